@@ -0,0 +1,337 @@
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Rough characters per token, to estimate the tokens of a run before it is sent
+CHARS_PER_TOKEN = 4
+# Failed-run error codes that are worth another attempt (rate_limit_exceeded is throttling)
+TRANSIENT_RUN_ERRORS = ("server_error", "timeout", "internal_error", None)
+# Runs before the latency averages are trusted to lower the limit
+LATENCY_WARMUP_RUNS = 20
+
+
+# Error raised for an agent run that ended with status "failed"
+class AgentRunError(RuntimeError):
+    def __init__(self, last_error):
+        super().__init__(f"Run failed: {last_error}")
+        self.last_error = last_error
+        self.code = last_error.get("code") if isinstance(last_error, dict) else getattr(last_error, "code", None)
+
+# Error raised for a call that was shed because the queue for a run slot or the quota was too long
+class AgentOverloadedError(RuntimeError):
+    pass
+
+
+# Function to tell whether a failed agent call is worth retrying
+def classify_error(error: Exception):
+    """
+    'throttled' for rate limiting (HTTP 429, runs failed with rate_limit_exceeded), 'transient' for
+    server and connection errors, None for errors a retry won't fix. The Azure exception types are
+    recognised by name and status code, so importing this module doesn't import the Azure SDK.
+    """
+    if isinstance(error, AgentRunError):
+        if error.code == "rate_limit_exceeded":
+            return "throttled"
+        return "transient" if error.code in TRANSIENT_RUN_ERRORS else None
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return "throttled"
+    if isinstance(status_code, int) and (status_code == 408 or status_code >= 500):
+        return "transient"
+    if any(cls.__name__ in ("ServiceRequestError", "ServiceResponseError") for cls in type(error).__mro__):
+        return "transient"
+    return None
+
+def _retry_after(error: Exception):
+    """Seconds the service asked to wait (Retry-After header or 'Try again in N seconds'), if any"""
+    response = getattr(error, "response", None)
+    header = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    match = re.search(r"try again in (\d+(?:\.\d+)?) second", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+# Retries left for one report section
+class RetryBudget:
+    def __init__(self, retries: int):
+        self.retries = retries
+        self.used = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.retries - self.used
+
+
+# Token bucket refilled continuously at a per-minute rate
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount (at most the capacity) is available"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        """Take amount, going below zero for corrections after the fact"""
+        self._refill()
+        self.level -= amount
+
+
+# Adaptive concurrency, retries and rate limits for all agent calls
+class AgentController:
+    """
+    Wraps the agent calls of the report pipeline.
+    - Runs hold one of `limit` slots. The limit follows AIMD: it grows by one per `limit` successful
+      runs while the slots are in use, and is multiplied by decrease_factor on a throttled or failed
+      run, or when the recent run latency exceeds latency_target (default: latency_tolerance times the
+      long-run average, once LATENCY_WARMUP_RUNS runs are in). Decreases happen at most once per
+      recent run latency, so one burst of throttling counts once.
+    - Throttled and transient errors are retried with full-jitter exponential backoff (at least the
+      wait the service asked for), within a retry budget per report section.
+    - Optional token buckets cap runs per minute and tokens per minute; the token estimate of a run
+      is corrected with its reported usage.
+    - A call that would wait longer than max_queue_seconds for a slot or the quota is shed with
+      AgentOverloadedError.
+    """
+
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 decrease_factor: float = 0.5, latency_target: float = None, latency_tolerance: float = 2.0,
+                 retry_budget: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 requests_per_minute: float = None, tokens_per_minute: float = None,
+                 max_queue_seconds: float = None, seed: int = None):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.retry_budget = retry_budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue_seconds = max_queue_seconds
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+        self._condition = threading.Condition()
+        self._random = random.Random(seed)
+        self._latency_recent = None   # fast moving average of run latency
+        self._latency_average = None   # slow moving average, the "normal" latency
+        self._tokens_per_run = None
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.counts = {"runs": 0, "retries": 0, "throttled": 0, "failed": 0, "shed": 0, "budget_exhausted": 0,
+                       "decreases": 0}
+        self.quota_wait_seconds = 0.0
+
+    def budget(self) -> RetryBudget:
+        """A fresh retry budget, shared by all calls of one report section"""
+        return RetryBudget(self.retry_budget)
+
+    def estimate_tokens(self, content: str) -> int:
+        """Tokens a run on content is expected to use: at least the prompt, usually the thread average"""
+        return max(len(content) // CHARS_PER_TOKEN, int(self._tokens_per_run or 0))
+
+    def call(self, fn, budget: RetryBudget = None, run: bool = False, tokens: int = 0):
+        """
+        Call fn(), retrying throttled and transient errors within budget (a new budget when None).
+        With run=True each attempt holds a run slot and takes its share of the quota (tokens).
+        """
+        budget = budget or self.budget()
+        attempt = 0
+        while True:
+            try:
+                if not run:
+                    return fn()
+                with self.slot(tokens) as outcome:
+                    result = fn()
+                    outcome["result"] = result
+                    return result
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    raise
+                if budget.remaining <= 0:
+                    with self._condition:
+                        self.counts["budget_exhausted"] += 1
+                    raise
+                budget.used += 1
+                backoff = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                delay = min(self.max_delay, max(backoff, _retry_after(e) or 0.0))
+                attempt += 1
+                with self._condition:
+                    self.counts["retries"] += 1
+                print(f"Agent call {kind} ({e}); retrying in {delay:.1f}s, {budget.remaining} retries left")
+                time.sleep(delay)
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """
+        Hold a run slot (and the run's quota) for the block; the block's outcome and latency adjust
+        the limit. The yielded dict takes the result of the run, to correct the token estimate.
+        """
+        self._acquire()
+        try:
+            self._take_quota(tokens)
+        except BaseException:
+            self._release()
+            raise
+        outcome = {}
+        started = time.perf_counter()
+        try:
+            yield outcome
+        except Exception as e:
+            self._on_error(classify_error(e))
+            raise
+        else:
+            self._on_success(time.perf_counter() - started, tokens, outcome.get("result"))
+        finally:
+            self._release()
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.max_queue_seconds if self.max_queue_seconds is not None else None
+        with self._condition:
+            self.waiting += 1
+            try:
+                while self.in_flight >= max(1, int(self.limit)):
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        self.counts["shed"] += 1
+                        raise AgentOverloadedError(f"No agent run slot free within {self.max_queue_seconds}s "
+                                                   f"({self.in_flight} runs in flight, limit {int(self.limit)})")
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    def _release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def _take_quota(self, tokens: int):
+        waited = 0.0
+        while True:
+            with self._condition:
+                buckets = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens)) if bucket]
+                wait = max([bucket.wait_time(amount) for bucket, amount in buckets], default=0.0)
+                if wait <= 0:
+                    for bucket, amount in buckets:
+                        bucket.take(amount)
+                    self.quota_wait_seconds += waited
+                    return
+                if self.max_queue_seconds is not None and waited + wait > self.max_queue_seconds:
+                    self.counts["shed"] += 1
+                    self.quota_wait_seconds += waited
+                    raise AgentOverloadedError(f"Agent quota not available within {self.max_queue_seconds}s")
+            time.sleep(wait)
+            waited += wait
+
+    def _on_success(self, seconds: float, tokens: int, result):
+        used = getattr(getattr(result, "usage", None), "total_tokens", None)
+        with self._condition:
+            self.counts["runs"] += 1
+            if isinstance(used, int):
+                if self.tokens:
+                    self.tokens.take(used - tokens)
+                self._tokens_per_run = used if self._tokens_per_run is None else 0.8 * self._tokens_per_run + 0.2 * used
+            self._latency_recent = seconds if self._latency_recent is None else 0.9 * self._latency_recent + 0.1 * seconds
+            self._latency_average = seconds if self._latency_average is None else 0.98 * self._latency_average + 0.02 * seconds
+            target = self.latency_target or self.latency_tolerance * self._latency_average
+            if self._latency_recent > target and self.counts["runs"] > LATENCY_WARMUP_RUNS:
+                self._decrease()
+            elif self.in_flight >= int(self.limit):
+                # Additive increase: about one more slot per window of limit runs, only when the slots are in use
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+    def _on_error(self, kind: str):
+        with self._condition:
+            self.counts["throttled" if kind == "throttled" else "failed"] += 1
+            if kind is not None:
+                self._decrease()
+
+    def _decrease(self):
+        # Called with the condition held
+        now = time.monotonic()
+        if now - self._last_decrease < (self._latency_recent or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.counts["decreases"] += 1
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "waiting": self.waiting,
+                    "latency_recent_seconds": self._latency_recent, "latency_average_seconds": self._latency_average,
+                    "quota_wait_seconds": round(self.quota_wait_seconds, 3), **self.counts}
+
+    def samples(self) -> list:
+        """(name, type, help, value) samples for the Prometheus /metrics output"""
+        stats = self.stats()
+        return [
+            ("agent_concurrency_limit", "gauge", "Current adaptive limit of concurrent agent runs.", stats["limit"]),
+            ("agent_runs_in_flight", "gauge", "Agent runs in progress.", stats["in_flight"]),
+            ("agent_runs_waiting", "gauge", "Agent runs waiting for a slot.", stats["waiting"]),
+            ("agent_run_retries_total", "counter", "Agent calls retried after a throttled or transient error.", stats["retries"]),
+            ("agent_runs_throttled_total", "counter", "Agent runs that were throttled.", stats["throttled"]),
+            ("agent_runs_failed_total", "counter", "Agent runs that failed for another reason.", stats["failed"]),
+            ("agent_runs_shed_total", "counter", "Agent calls shed because no slot or quota was free in time.", stats["shed"]),
+            ("agent_retry_budget_exhausted_total", "counter", "Sections that ran out of retries.", stats["budget_exhausted"]),
+            ("agent_quota_wait_seconds_total", "counter", "Time spent waiting for the request and token quota.",
+             stats["quota_wait_seconds"]),
+        ]
+
+
+def _env_float(name: str, default=None):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+# Function to create the controller from the AGENT_* settings
+def controller_from_env() -> AgentController:
+    return AgentController(
+        initial_limit=_env_float("AGENT_CONCURRENCY", 4),
+        max_limit=_env_float("AGENT_MAX_CONCURRENCY", 32),
+        retry_budget=int(_env_float("AGENT_RETRY_BUDGET", 3)),
+        requests_per_minute=_env_float("AGENT_REQUESTS_PER_MINUTE"),
+        tokens_per_minute=_env_float("AGENT_TOKENS_PER_MINUTE"),
+        max_queue_seconds=_env_float("AGENT_MAX_QUEUE_SECONDS"),
+    )
+
+_controller = None
+_controller_lock = threading.Lock()
+
+# Function to get the process-wide controller, created from the settings on first use
+def get_controller() -> AgentController:
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = controller_from_env()
+    return _controller
+
+def set_controller(controller: AgentController):
+    """Replace the process-wide controller (e.g. with other settings for a load test level)"""
+    global _controller
+    _controller = controller
+
+metrics.register_collector(lambda: get_controller().samples())
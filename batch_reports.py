@@ -0,0 +1,124 @@
+import contextlib
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import chat
+import metrics
+from agent_controller import get_controller
+from thread_manager import ThreadManager
+
+
+# Function to parse a partner ID specification like "1,2,5-9" or "all"
+def parse_partner_ids(spec, available_ids) -> list:
+    """
+    Turn a partner ID specification into a list of partner IDs.
+    Accepts 'all' (every ID in available_ids), comma separated IDs and inclusive ranges like '5-9',
+    or an iterable of IDs.
+    """
+    if not isinstance(spec, str):
+        return [int(partner_id) for partner_id in spec]
+    if spec.strip().lower() == "all":
+        return [int(partner_id) for partner_id in available_ids]
+
+    partner_ids = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part[1:]:
+            start, end = part.split("-", 1)
+            partner_ids.extend(range(int(start), int(end) + 1))
+        else:
+            partner_ids.append(int(part))
+    # Keep the given order but drop duplicates
+    return list(dict.fromkeys(partner_ids))
+
+# Function to generate the report of one partner, capturing the outcome instead of raising
+def _run_partner(project_client, agent_id: str, partner_id: int, thread_manager: ThreadManager,
+                 parallel_sections: bool = False, response_cache=None, journal=None) -> dict:
+    started = time.perf_counter()
+    try:
+        output_file = chat.generate_report(project_client, agent_id, partner_id, parallel_sections=parallel_sections,
+                                           thread_manager=thread_manager, response_cache=response_cache,
+                                           journal=journal)
+        return {"partner_id": partner_id, "ok": True, "output_file": str(output_file),
+                "seconds": time.perf_counter() - started}
+    except Exception as e:
+        traceback.print_exc()
+        return {"partner_id": partner_id, "ok": False, "error": f"{type(e).__name__}: {e}",
+                "seconds": time.perf_counter() - started}
+
+# Function to generate reports for many partners concurrently
+def run_batch(partner_ids, max_workers: int = 4, project_client=None, agent_id: str = None,
+              parallel_sections: bool = False, thread_cleanup: str = "delete", response_cache=None,
+              trace_file=None, run=None) -> dict:
+    """
+    Generate reports for many partners on a bounded worker pool.
+    Each partner gets its own fresh agent thread (pre-created in a pool of max_workers threads and
+    cleaned up according to thread_cleanup) and its files are written section by section.
+    A failing partner is recorded in the result and does not stop the other partners.
+    parallel_sections and response_cache are passed on to chat.generate_report, so a rerun after a
+    crash or a template change only pays for the sections whose inputs changed.
+    With a run (report_journal.ReportRun), every partner's sections are journaled in the run directory;
+    partners the run already finished are skipped and unfinished ones continue from their journal.
+    With a trace_file, the timing spans of the whole batch are written to it as a JSON trace (see metrics.trace).
+    Returns a summary dict with the per-partner results, failures and throughput.
+    """
+    partner_ids = list(partner_ids)
+    results = []
+    journals = {partner_id: run.journal(partner_id) for partner_id in partner_ids} if run else {}
+    finished = [partner_id for partner_id in partner_ids if partner_id in journals and journals[partner_id].done]
+    if finished:
+        # Recorded as succeeded, so the summary covers the whole run
+        print(f"Skipping {len(finished)} partners already finished in run {run.run_id}")
+        results = [{"partner_id": partner_id, "ok": True, "output_file": journals[partner_id].output_file,
+                    "seconds": 0.0, "skipped": True} for partner_id in finished]
+        partner_ids = [partner_id for partner_id in partner_ids if partner_id not in finished]
+    if project_client is None:
+        project_client, agent_id = chat.initialize_agent()
+
+    started = time.perf_counter()
+    print(f"Generating reports for {len(partner_ids)} partners with {max_workers} workers")
+
+    with metrics.trace(trace_file) if trace_file else contextlib.nullcontext(), \
+            project_client, \
+            ThreadManager(project_client, pool_size=max_workers, cleanup=thread_cleanup) as thread_manager, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(_run_partner, project_client, agent_id, partner_id, thread_manager, parallel_sections,
+                            response_cache, journals.get(partner_id))
+            for partner_id in partner_ids
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            status = "done" if result["ok"] else f"FAILED ({result['error']})"
+            print(f"[{done}/{len(partner_ids)}] Partner {result['partner_id']} {status} in {result['seconds']:.1f}s")
+
+    elapsed = time.perf_counter() - started
+    failed = [result for result in results if not result["ok"]]
+    summary = {
+        "partners": len(results),
+        "succeeded": len(results) - len(failed),
+        "skipped": len(finished),
+        "failed": failed,
+        "results": results,
+        "seconds": elapsed,
+        "partners_per_minute": (len(partner_ids) / elapsed * 60) if elapsed else 0.0,
+    }
+
+    print("\n" + "="*80)
+    print(f"Batch finished in {elapsed:.1f}s: {summary['succeeded']} succeeded, {len(failed)} failed, "
+          f"{summary['partners_per_minute']:.2f} partners/minute")
+    for result in failed:
+        print(f"  Partner {result['partner_id']}: {result['error']}")
+    summary["agent"] = get_controller().stats()
+    print(f"Agent runs: limit {summary['agent']['limit']}, {summary['agent']['retries']} retries, "
+          f"{summary['agent']['throttled']} throttled, {summary['agent']['shed']} shed")
+    if response_cache:
+        summary["cache"] = response_cache.stats()
+        print(f"Response cache: {summary['cache']}")
+    if trace_file:
+        print(f"Timing trace saved to: {trace_file}")
+    return summary
@@ -0,0 +1,90 @@
+"""
+Cold-start comparison of parsing the merged CSV against loading its columnar snapshot.
+
+Every measurement runs in a fresh Python process, like a Function host cold start.
+The sample CSV only has a few partners, so --rows tiles its rows into a larger CSV
+(with new Partner_IDs/TPIDs) in a temporary directory.
+
+Usage: python -m benchmarks.cold_start --rows 20000 --repeat 5 [--json results.json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_CSV = REPO_ROOT / "final_merged_with_questions.csv"
+
+CSV_PARSE = """
+import time; t = time.perf_counter()
+import pandas as pd
+df = pd.read_csv({path!r})
+print(time.perf_counter() - t)
+"""
+
+SNAPSHOT_LOAD = """
+import sys, time; sys.path.insert(0, {root!r}); t = time.perf_counter()
+from columnar_store import load_dataset
+df = load_dataset({path!r})
+print(time.perf_counter() - t)
+"""
+
+# Function to write a larger CSV by repeating the sample rows
+def make_csv(rows: int, directory: Path) -> Path:
+    sample = pd.read_csv(SAMPLE_CSV)
+    repeats = -(-rows // len(sample))
+    df = pd.concat([sample] * repeats, ignore_index=True).iloc[:rows]
+    df["Partner_ID"] = range(1, len(df) + 1)
+    df["TPID"] = df["Partner_ID"] * 1111
+    path = directory / "final_merged_with_questions.csv"
+    df.to_csv(path, index=False)
+    return path
+
+def _time(script: str) -> float:
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def run(rows: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_csv(rows, Path(tmp)) if rows else SAMPLE_CSV
+        if not rows:
+            # Work on a copy so the repository's snapshot is left alone
+            path = Path(tmp) / SAMPLE_CSV.name
+            path.write_bytes(SAMPLE_CSV.read_bytes())
+        csv_times = [_time(CSV_PARSE.format(path=str(path))) for _ in range(repeat)]
+        # The first snapshot load parses the CSV and writes the snapshot
+        build_time = _time(SNAPSHOT_LOAD.format(root=str(REPO_ROOT), path=str(path)))
+        snapshot_times = [_time(SNAPSHOT_LOAD.format(root=str(REPO_ROOT), path=str(path))) for _ in range(repeat)]
+        csv_size = path.stat().st_size
+        partners = len(pd.read_csv(path, usecols=["Partner_ID"]))
+
+    return {
+        "partners": partners,
+        "csv_bytes": csv_size,
+        "csv_parse_seconds": statistics.median(csv_times),
+        "snapshot_build_seconds": build_time,
+        "snapshot_load_seconds": statistics.median(snapshot_times),
+        "speedup": statistics.median(csv_times) / statistics.median(snapshot_times),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=0, help="Partners in the generated CSV (default: the sample CSV)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    for key, value in results.items():
+        print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Import-time profile of the Function app (or any module), using python -X importtime.
+
+Records the self and cumulative import cost of every module, prints the most expensive
+top-level packages and checks that heavy modules stay out of the import (the Azure AI SDK,
+credentials and scipy must only load when an agent route is used).
+
+Usage: python -m benchmarks.import_profile [--module function_app] [--json profile.json]
+                                           [--baseline old.json --threshold 0.2]
+Exits with status 1 when a forbidden module is imported or the total import time grew by
+more than the threshold compared to the baseline.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules the data-only routes must not pull in at import time
+FORBIDDEN = ["azure.ai.projects", "azure.ai.agents", "azure.identity", "scipy"]
+
+# Function to run one import under -X importtime and parse its report
+def profile_import(module: str) -> list:
+    """Return a list of (module, self_us, cumulative_us, depth) for one fresh-process import"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def summarize(module: str, entries: list) -> dict:
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+    total_us = sum(self_us for _, self_us, _, _ in entries)
+    imported = {name for name, _, _, _ in entries}
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "modules_imported": len(entries),
+        "packages_ms": {name: us / 1000 for name, us in sorted(by_package.items(), key=lambda item: -item[1])},
+        "modules": [{"name": name, "self_us": self_us, "cumulative_us": cumulative_us}
+                    for name, self_us, cumulative_us, _ in entries],
+        "forbidden_imported": [name for name in FORBIDDEN if name in imported],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="function_app")
+    parser.add_argument("--top", type=int, default=15, help="Packages to print (default: 15)")
+    parser.add_argument("--json", help="Write the full profile to this JSON file")
+    parser.add_argument("--baseline", help="Profile JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative growth of the total import time (default: 0.2)")
+    args = parser.parse_args()
+
+    profile = summarize(args.module, profile_import(args.module))
+    print(f"import {args.module}: {profile['total_ms']:.1f} ms, {profile['modules_imported']} modules")
+    for name, ms in list(profile["packages_ms"].items())[:args.top]:
+        print(f"  {name:<30} {ms:>9.1f} ms")
+    if args.json:
+        Path(args.json).write_text(json.dumps(profile, indent=2))
+
+    failed = False
+    if profile["forbidden_imported"]:
+        print(f"Heavy modules imported at startup: {', '.join(profile['forbidden_imported'])}")
+        failed = True
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        growth = profile["total_ms"] / baseline["total_ms"] - 1
+        print(f"Compared to baseline: {baseline['total_ms']:.1f} ms -> {profile['total_ms']:.1f} ms ({growth:+.0%})")
+        failed = failed or growth > args.threshold
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Throughput and memory of loading a JSON survey export with json_to_dataframe against
+streaming it in chunks (iter_dataframe_chunks / json_to_csv).
+
+A synthetic CRM-like export (a JSON array, or JSON Lines with --jsonl) is generated in a
+temporary directory. Every measurement runs in a fresh Python process: throughput is timed
+without tracing, peak memory is the tracemalloc peak of Python allocations in a second run.
+
+Usage: python -m benchmarks.json_ingest --records 200000 --chunk-size 50000 [--jsonl] [--json results.json]
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MEASURE = """
+import json, sys, time, tracemalloc; sys.path.insert(0, {root!r})
+import json_to_csv
+if {trace}: tracemalloc.start()
+t = time.perf_counter()
+{body}
+seconds = time.perf_counter() - t
+print(json.dumps({{"seconds": seconds, "peak_bytes": tracemalloc.get_traced_memory()[1], "rows": rows}}))
+"""
+
+MODES = {
+    "json_to_dataframe": "rows = len(json_to_csv.json_to_dataframe({path!r}))",
+    "iter_dataframe_chunks": "rows = sum(len(chunk) for chunk in json_to_csv.iter_dataframe_chunks({path!r}, {chunk_size}))",
+    "json_to_csv": "rows = json_to_csv.json_to_csv({path!r}, {output!r}, {chunk_size})",
+}
+
+# Function to write a synthetic survey export
+def make_export(records: int, path: Path, jsonl: bool = False):
+    """Records with 'new_' answer fields in mixed case plus CRM bookkeeping fields that get filtered out"""
+    rng = random.Random(0)
+    with path.open("w", encoding="utf-8") as f:
+        if not jsonl:
+            f.write("[\n")
+        for i in range(records):
+            record = {
+                "@odata.etag": f'W/"{rng.randrange(10**9)}"',
+                "new_partnerid": i + 1,
+                "new_TPID": (i + 1) * 1111,
+                "createdon": "2024-05-01T10:00:00Z",
+                "_ownerid_value": f"{rng.randrange(16**12):012x}",
+            }
+            for q in range(40):
+                record[f"new_Q{q}_Answer"] = rng.randint(0, 5)
+            record["new_comment"] = "lorem ipsum " * rng.randint(0, 8)
+            separator = ",\n" if not jsonl and i < records - 1 else "\n"
+            f.write(json.dumps(record) + separator)
+        if not jsonl:
+            f.write("]\n")
+
+def _measure(mode: str, path: Path, chunk_size: int, output: Path, trace: bool) -> dict:
+    body = MODES[mode].format(path=str(path), chunk_size=chunk_size, output=str(output))
+    script = MEASURE.format(root=str(REPO_ROOT), body=body, trace=trace)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(records: int, chunk_size: int, jsonl: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / ("export.jsonl" if jsonl else "export.json")
+        make_export(records, path, jsonl)
+        results = {"records": records, "file_bytes": path.stat().st_size, "chunk_size": chunk_size}
+        for mode in MODES:
+            if mode == "json_to_dataframe" and jsonl:
+                continue   # json.load can't read JSON Lines
+            timed = _measure(mode, path, chunk_size, Path(tmp) / "out.csv", trace=False)
+            traced = _measure(mode, path, chunk_size, Path(tmp) / "out.csv", trace=True)
+            results[mode] = {
+                "seconds": timed["seconds"],
+                "records_per_second": timed["rows"] / timed["seconds"],
+                "peak_mb": traced["peak_bytes"] / 2**20,
+            }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--jsonl", action="store_true", help="Generate JSON Lines instead of a JSON array")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.records, args.chunk_size, args.jsonl)
+    print(f"records: {results['records']}, file: {results['file_bytes'] / 2**20:.1f} MB, chunk size: {results['chunk_size']}")
+    for mode in MODES:
+        if mode in results:
+            r = results[mode]
+            print(f"{mode:>22}: {r['seconds']:.2f}s, {r['records_per_second']:,.0f} records/s, peak {r['peak_mb']:.1f} MB")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Load test of the report pipeline against the in-process fake agent (fake_agent.FakeProjectClient).
+
+Runs batch_reports.run_batch - the code path of `python chat.py --partners ...` - at every
+--concurrency level with a fresh fake agent, and reports throughput, p50/p95/p99 section (agent run)
+latency and error rates. Every level gets a fresh agent controller (agent_controller.py), and the
+final adaptive run limit, retries and shed calls are reported too. Reports are written to a temporary
+directory. --time-scale shrinks every simulated latency and retry delay (0.01 turns a 2 s run into
+20 ms) to try many partners quickly.
+
+Usage: python -m benchmarks.load_test --reports 40 --concurrency 1 4 8 16 [--latency lognormal:2.0:0.5]
+                                      [--failure-rate 0.02] [--throttle-rate 0.05] [--max-concurrent-runs 8]
+                                      [--time-scale 0.01] [--parallel-sections] [--synthetic 1000] [--json results.json]
+                                      [--initial-limit 4] [--max-limit 32] [--retry-budget 3]
+                                      [--requests-per-minute 600] [--tokens-per-minute 100000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import batch_reports  # noqa: E402
+import chat  # noqa: E402
+from agent_controller import AgentController, set_controller  # noqa: E402
+from fake_agent import FakeProjectClient  # noqa: E402
+
+
+def run_level(partner_ids: list, concurrency: int, args) -> dict:
+    client = FakeProjectClient(latency=args.latency, failure_rate=args.failure_rate, throttle_rate=args.throttle_rate,
+                               http_throttle_rate=args.http_throttle_rate, max_concurrent_runs=args.max_concurrent_runs,
+                               time_scale=args.time_scale, seed=args.seed)
+    controller = AgentController(initial_limit=args.initial_limit, max_limit=args.max_limit,
+                                 retry_budget=args.retry_budget, base_delay=args.time_scale,
+                                 max_delay=30.0 * args.time_scale, requests_per_minute=args.requests_per_minute,
+                                 tokens_per_minute=args.tokens_per_minute, seed=args.seed)
+    set_controller(controller)
+    # The pipeline prints every message and file it writes; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        summary = batch_reports.run_batch(partner_ids, max_workers=concurrency, project_client=client,
+                                          agent_id="fake-agent", parallel_sections=args.parallel_sections)
+
+    seconds = np.array([run[0] for run in client.runs]) * 1000
+    completed = np.array([run[0] for run in client.runs if run[1] == "completed"]) * 1000
+    runs = len(client.runs)
+    return {
+        "concurrency": concurrency,
+        "reports": len(partner_ids),
+        "succeeded": summary["succeeded"],
+        "seconds": summary["seconds"],
+        "reports_per_minute": summary["partners_per_minute"],
+        "sections_per_second": client.stats["completed"] / summary["seconds"] if summary["seconds"] else 0.0,
+        "section_p50_ms": float(np.percentile(completed, 50)) if len(completed) else None,
+        "section_p95_ms": float(np.percentile(completed, 95)) if len(completed) else None,
+        "section_p99_ms": float(np.percentile(completed, 99)) if len(completed) else None,
+        "run_max_ms": float(seconds.max()) if runs else None,
+        "report_error_rate": len(summary["failed"]) / len(partner_ids) if partner_ids else 0.0,
+        "run_error_rate": (client.stats["failed"] + client.stats["throttled"]) / runs if runs else 0.0,
+        "throttle_rate": client.stats["throttled"] / runs if runs else 0.0,
+        "http_throttled": client.stats["http_throttled"],
+        "errors": sorted({result["error"].split(":")[0] for result in summary["failed"]}),
+        "controller": controller.stats(),
+    }
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            from benchmarks import synthetic
+            chat.DATA_FILE = str(synthetic.write_csv(Path(tmp) / "final_merged_with_questions.csv", args.synthetic))
+        else:
+            chat.DATA_FILE = str(REPO_ROOT / chat.DATA_FILE)
+        available = chat.reload_data().kpi_scores_df.index
+        # Reports are spread over the available partners; repeated partners are separate reports
+        partner_ids = [int(available[i % len(available)]) for i in range(args.reports)]
+
+        # Report and backup files go to ./output, so run inside the temporary directory
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            levels = [run_level(partner_ids, concurrency, args) for concurrency in args.concurrency]
+        finally:
+            os.chdir(cwd)
+    return {"latency": args.latency, "time_scale": args.time_scale, "failure_rate": args.failure_rate,
+            "throttle_rate": args.throttle_rate, "http_throttle_rate": args.http_throttle_rate,
+            "max_concurrent_runs": args.max_concurrent_runs, "parallel_sections": args.parallel_sections,
+            "levels": levels}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20, help="Reports per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", default="lognormal:2.0:0.5",
+                        help="Agent run latency: fixed:S, uniform:LOW:HIGH, normal:MEAN:STD or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of runs that fail")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of runs that fail with rate_limit_exceeded")
+    parser.add_argument("--http-throttle-rate", type=float, default=0.0, help="Share of messages rejected with HTTP 429")
+    parser.add_argument("--max-concurrent-runs", type=int, help="Runs above this many in progress are throttled")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Factor applied to every simulated latency")
+    parser.add_argument("--parallel-sections", action="store_true", help="Run independent sections concurrently")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic dataset with this many partners")
+    parser.add_argument("--initial-limit", type=float, default=4, help="Initial adaptive limit of concurrent runs")
+    parser.add_argument("--max-limit", type=float, default=32, help="Upper bound of the adaptive run limit")
+    parser.add_argument("--retry-budget", type=int, default=3, help="Retries per report section")
+    parser.add_argument("--requests-per-minute", type=float, help="Cap on agent runs per minute")
+    parser.add_argument("--tokens-per-minute", type=float, help="Cap on agent tokens per minute")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    for level in results["levels"]:
+        print(f"concurrency {level['concurrency']}: {level['succeeded']}/{level['reports']} reports in {level['seconds']:.1f}s, "
+              f"{level['reports_per_minute']:.1f} reports/min, {level['sections_per_second']:.2f} sections/s")
+        if level["section_p50_ms"] is not None:
+            print(f"  section latency p50 {level['section_p50_ms']:.0f} ms, p95 {level['section_p95_ms']:.0f} ms, "
+                  f"p99 {level['section_p99_ms']:.0f} ms")
+        print(f"  errors: {level['report_error_rate']:.1%} of reports, {level['run_error_rate']:.1%} of runs "
+              f"({level['throttle_rate']:.1%} throttled, {level['http_throttled']} HTTP 429) {', '.join(level['errors'])}")
+        controller = level["controller"]
+        print(f"  controller: run limit {controller['limit']}, {controller['retries']} retries, "
+              f"{controller['budget_exhausted']} budgets exhausted, {controller['shed']} shed, "
+              f"{controller['quota_wait_seconds']:.1f}s waiting for quota")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Memory held by the loaded dataset: the old resident merged_df (parsed CSV plus copied frames)
+against the compact snapshot (question catalog, small-dtype answers, categorical texts).
+
+Every measurement runs in a fresh Python process and reports the deep pandas size of what stays
+loaded and the growth of the resident set (RSS, Linux only) over a process that only did the
+imports. --text-scale repeats every question and answer text, to show the compact snapshot
+doesn't grow with text length.
+
+Usage: python -m benchmarks.memory --rows 20000 [--text-scale 4] [--json results.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.cold_start import REPO_ROOT, make_csv
+
+MEASURE = """
+import gc, json, os, sys; sys.path.insert(0, {root!r})
+import numpy as np, pandas as pd
+import dataset_snapshot
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+gc.collect(); before = rss()
+{body}
+gc.collect()
+print(json.dumps({{"bytes": int(size), "rss_growth": rss() - before}}))
+"""
+
+# Before: the reload kept merged_df plus copies of its KPI and answer columns
+RESIDENT = """
+merged_df = pd.read_csv({path!r})
+kpi_scores_df = merged_df[['Partner_ID'] + dataset_snapshot.kpi_columns].set_index('Partner_ID')
+question_answer_columns = [col for col in merged_df.columns if col.endswith('_Answer')]
+question_scores_df = merged_df[['Partner_ID', 'TPID'] + question_answer_columns].copy()
+size = sum(df.memory_usage(deep=True).sum() for df in (merged_df, kpi_scores_df, question_scores_df))
+"""
+
+# After: the snapshot keeps only the catalog and compact frames
+SNAPSHOT = """
+snapshot, _ = dataset_snapshot.load_snapshot({path!r})
+size = snapshot.memory_usage()["total"]
+"""
+
+def _scale_texts(path: Path, scale: int):
+    df = pd.read_csv(path)
+    for column in df.columns:
+        if column.endswith(('_Answer_question', '_Answer_text')):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str) * scale)
+    df.to_csv(path, index=False)
+
+def _measure(script: str, path: Path) -> dict:
+    code = MEASURE.format(root=str(REPO_ROOT), body=script.format(path=str(path)))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(rows: int, text_scale: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_csv(rows, Path(tmp))
+        if text_scale > 1:
+            _scale_texts(path, text_scale)
+        resident = _measure(RESIDENT, path)
+        # The first load builds the columnar snapshot; measure a warm load like a restarted worker
+        _measure(SNAPSHOT, path)
+        compact = _measure(SNAPSHOT, path)
+        csv_size = path.stat().st_size
+
+    return {
+        "partners": rows,
+        "text_scale": text_scale,
+        "csv_bytes": csv_size,
+        "resident_merged_df_mb": resident["bytes"] / 2**20,
+        "resident_merged_df_rss_mb": resident["rss_growth"] / 2**20,
+        "compact_snapshot_mb": compact["bytes"] / 2**20,
+        "compact_snapshot_rss_mb": compact["rss_growth"] / 2**20,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--text-scale", type=int, default=1, help="Repeat every question and answer text this many times")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.text_scale)
+    for key, value in results.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Latency of similar-partner search with peers.PeerIndex.
+
+Random KPI scores (0-10) for --rows partners; reports the build time of the index, the median
+and p99 latency of single queries and the per-partner time of one batch query.
+
+Usage: python -m benchmarks.peers --rows 100000 --queries 200 [--k 10] [--batch 100] [--json results.json]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from dataset_snapshot import comparison_kpis  # noqa: E402
+from peers import PeerIndex  # noqa: E402
+
+
+def run(rows: int, queries: int, k: int, batch: int) -> dict:
+    rng = np.random.default_rng(0)
+    kpi_scores_df = pd.DataFrame(
+        rng.uniform(0, 10, (rows, len(comparison_kpis))),
+        columns=comparison_kpis,
+        index=pd.Index(np.arange(1, rows + 1), name='Partner_ID'),
+    )
+
+    started = time.perf_counter()
+    index = PeerIndex(kpi_scores_df, comparison_kpis)
+    build_time = time.perf_counter() - started
+
+    results = {"partners": rows, "kpis": len(index.kpis), "k": k, "build_ms": build_time * 1000}
+    partner_ids = rng.integers(1, rows + 1, queries)
+    for metric in ("euclidean", "cosine"):
+        times = []
+        for partner_id in partner_ids:
+            started = time.perf_counter()
+            index.nearest(int(partner_id), k, metric)
+            times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        index.nearest_batch(partner_ids[:batch].tolist(), k, metric)
+        batch_time = time.perf_counter() - started
+
+        results[f"{metric}_p50_ms"] = statistics.median(times) * 1000
+        results[f"{metric}_p99_ms"] = float(np.percentile(times, 99)) * 1000
+        results[f"{metric}_batch_per_partner_ms"] = batch_time * 1000 / min(batch, queries)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=100, help="Partners per batch query")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.queries, args.k, args.batch)
+    for key, value in results.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
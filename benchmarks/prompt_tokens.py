@@ -0,0 +1,63 @@
+"""
+Estimated input tokens of the report prompts, verbose against compact (prompt_encoding.py).
+
+For every partner the prompts are built in both modes and the estimated tokens of every section
+are reported, with the compact question catalog in the thread and in the agent instructions, and
+for every --budget of the compact summary.
+
+Usage: python -m benchmarks.prompt_tokens --partners 1 2 3 [--budget 1500 800] [--json results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import chat  # noqa: E402
+from prompt_encoding import estimate_tokens  # noqa: E402
+
+
+def _section_tokens(partner_id: int, compact: bool) -> dict:
+    # build_prompts prints its own before/after estimate in compact mode
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompts = chat.build_prompts(partner_id, chat.prepare_partner_summary(partner_id), compact=compact)
+    return {prompt['name']: estimate_tokens(prompt['content']) for prompt in prompts}
+
+def run(partner_ids: list, budgets: list) -> dict:
+    results = {}
+    for partner_id in partner_ids:
+        variants = {"verbose": _section_tokens(partner_id, False)}
+        for catalog in ("thread", "instructions"):
+            chat.QUESTION_CATALOG = catalog
+            for budget in [0] + budgets:
+                chat.PROMPT_TOKEN_BUDGET = budget
+                variants[f"compact_{catalog}" + (f"_budget{budget}" if budget else "")] = _section_tokens(partner_id, True)
+        results[partner_id] = variants
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--partners", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--budget", type=int, nargs="*", default=[1500], help="Token budgets of the compact summary")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    chat.DATA_FILE = str(REPO_ROOT / chat.DATA_FILE)
+    results = run(args.partners, args.budget)
+    for partner_id, variants in results.items():
+        verbose_total = sum(variants["verbose"].values())
+        print(f"partner {partner_id}:")
+        for name, sections in variants.items():
+            total = sum(sections.values())
+            print(f"  {name:<32} {total:>6} tokens ({total / verbose_total - 1:+.0%}), "
+                  f"summary {sections['Initial Summary']}, comparison {sections['Comparison to other partners']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time of computing every KPI and index column from the answers with scoring.py.
+
+Random answers (0-10) for --rows partners are scored with the default weight table;
+--missing sets the share of unanswered questions.
+
+Usage: python -m benchmarks.scoring --rows 100000 --repeat 5 [--missing 0.05] [--json results.json]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from scoring import ScoringModel  # noqa: E402
+
+
+def run(rows: int, repeat: int, missing: float) -> dict:
+    model = ScoringModel.load()
+    rng = np.random.default_rng(0)
+    answers = rng.integers(0, 11, (rows, len(model.questions))).astype(np.float64)
+    answers[rng.random(answers.shape) < missing] = np.nan
+    question_scores_df = pd.DataFrame(answers, columns=model.questions)
+    question_scores_df.insert(0, 'Partner_ID', np.arange(1, rows + 1))
+
+    matrix_times = []
+    frame_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        model.score_matrix(answers)
+        matrix_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        model.score(question_scores_df)
+        frame_times.append(time.perf_counter() - started)
+
+    return {
+        "partners": rows,
+        "questions": len(model.questions),
+        "kpis": len(model.kpis),
+        "missing": missing,
+        "score_matrix_ms": statistics.median(matrix_times) * 1000,
+        "score_frame_ms": statistics.median(frame_times) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--missing", type=float, default=0.0, help="Share of unanswered questions (default: 0)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat, args.missing)
+    for key, value in results.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
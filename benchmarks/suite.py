@@ -0,0 +1,237 @@
+"""
+Benchmark suite over synthetic datasets: time and peak memory of the data load, reload,
+partner summary, comparison and Function route paths.
+
+For every --partners size a synthetic dataset (benchmarks/synthetic.py) is written to a temporary
+directory and measured in a fresh Python process. The agent client is replaced by a stub that
+refuses to connect, so the suite runs offline and never reaches Azure. Measured paths:
+  load_cold          first load: parse the CSV, write the columnar snapshot, build all indexes
+  load_warm          load of a new process state from the columnar snapshot
+  reload_unchanged   POST /reload when the file didn't change
+  reload_delta       reload after appending --delta-fraction new partners (the delta path)
+  summary, compare, compare_segment, peers   per-partner calls, distinct partners
+  route_summary, route_compare, route_peers, route_rankings   the Function handlers
+Load and reload paths report median_ms over --repeat runs, per-call paths p50_ms / p95_ms over
+--calls partners; every path also reports the tracemalloc peak_mb of one traced run.
+
+Usage: python -m benchmarks.suite --partners 1000 10000 [--questions 120] [--repeat 3] [--calls 200]
+                                  [--json results.json] [--baseline old.json --threshold 0.2]
+With --baseline, exits with status 1 when a median or p50 timing grew by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks import synthetic  # noqa: E402
+
+# Timings compared against the baseline (tails are too noisy to fail a run on);
+# timings below MIN_COMPARED_MS are noise and are skipped
+COMPARED_KEYS = ("median_ms", "p50_ms")
+MIN_COMPARED_MS = 1.0
+
+
+def _no_agent():
+    raise RuntimeError("The agent client is disabled in benchmarks")
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+def _peak_mb(action) -> float:
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+def _measure(action, setup=None, repeat: int = 3) -> dict:
+    """Median time of repeat runs of action (setup runs untimed before each), then one traced run"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    return {"median_ms": statistics.median(times) * 1000, "min_ms": min(times) * 1000, "peak_mb": _peak_mb(action)}
+
+def _measure_calls(call, partner_ids: list) -> dict:
+    """Latency percentiles of call(partner_id) over distinct partners, then the peak of one traced pass"""
+    times = []
+    for partner_id in partner_ids:
+        started = time.perf_counter()
+        call(partner_id)
+        times.append(time.perf_counter() - started)
+    times = np.array(times) * 1000
+    return {"p50_ms": float(np.percentile(times, 50)), "p95_ms": float(np.percentile(times, 95)),
+            "calls": len(partner_ids), "peak_mb": _peak_mb(lambda: [call(pid) for pid in partner_ids])}
+
+def _route(handler, route: str, params: dict = None, **route_params):
+    """Call a Function handler the way the host does and fail on non-200 responses"""
+    import azure.functions as func
+    request = func.HttpRequest("GET", f"/api/{route}", params=params or {}, route_params=route_params, body=b"")
+    response = handler.build().get_user_function()(request, *route_params.values())
+    if response.status_code != 200:
+        raise RuntimeError(f"/{route} returned {response.status_code}: {response.get_body()[:200]!r}")
+    return response
+
+# Function to measure every path against one dataset (runs in its own process)
+def run_worker(csv_path: Path, partners: int, questions: int, repeat: int, calls: int, delta_fraction: float) -> dict:
+    import chat
+    import function_app
+    chat.create_project_client = _no_agent
+    chat.DATA_FILE = str(csv_path)
+    snapshot_dir = csv_path.parent / ".snapshot"
+
+    def reset(remove_snapshot: bool):
+        chat._snapshot = None
+        if remove_snapshot:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    metrics = {}
+    rss_before = _rss()
+    metrics["load_cold"] = _measure(chat.reload_data, lambda: reset(True), repeat)
+    metrics["load_warm"] = _measure(chat.reload_data, lambda: reset(False), repeat)
+    snapshot = chat.reload_data()
+    metrics["memory"] = {"snapshot_mb": snapshot.memory_usage()["total"] / 2**20,
+                         "rss_growth_mb": (_rss() - rss_before) / 2**20}
+    metrics["reload_unchanged"] = _measure(chat.reload_data, None, repeat)
+
+    # Each delta run appends new partners to the CSV (untimed), then times the reload
+    rng = np.random.default_rng(1)
+    sample = pd.read_csv(synthetic.SAMPLE_CSV)
+    question_list = synthetic._questions(sample, questions, np.random.default_rng(0))
+    model = synthetic.ScoringModel.load()
+    added = max(1, int(partners * delta_fraction))
+    next_id = [partners + 1]
+
+    def append_partners():
+        chunk = synthetic.make_chunk(question_list, model, next_id[0], added, rng)
+        chunk.to_csv(csv_path, mode="a", header=False, index=False)
+        next_id[0] += added
+    metrics["reload_delta"] = _measure(chat.reload_data, append_partners, repeat)
+
+    partner_ids = [int(pid) for pid in rng.choice(np.arange(1, partners + 1), min(calls, partners), replace=False)]
+    metrics["summary"] = _measure_calls(chat.prepare_partner_summary, partner_ids)
+    metrics["compare"] = _measure_calls(chat.prepare_comparison_stats, partner_ids)
+    metrics["compare_segment"] = _measure_calls(lambda pid: chat.prepare_comparison_stats(pid, "pti_band"), partner_ids)
+    metrics["peers"] = _measure_calls(lambda pid: chat.get_snapshot().peer_index.nearest(pid, 10), partner_ids)
+
+    chat.get_snapshot().partner_store.clear_cache()
+    metrics["route_summary"] = _measure_calls(
+        lambda pid: _route(function_app.get_summary, f"summary/{pid}", partner_id=str(pid)), partner_ids)
+    metrics["route_compare"] = _measure_calls(
+        lambda pid: _route(function_app.compare_partner, f"compare/{pid}", partner_id=str(pid)), partner_ids)
+    metrics["route_peers"] = _measure_calls(
+        lambda pid: _route(function_app.get_peers, f"peers/{pid}", {"k": "10"}, partner_id=str(pid)), partner_ids)
+    offsets = [int(offset) for offset in rng.integers(0, max(1, partners - 20), len(partner_ids))]
+    metrics["route_rankings"] = _measure_calls(
+        lambda offset: _route(function_app.get_rankings, "rankings/KPI_AI", {"offset": str(offset)}, kpi="KPI_AI"), offsets)
+    return metrics
+
+def run(partners: int, questions: int, repeat: int, calls: int, delta_fraction: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = synthetic.write_csv(Path(tmp) / "final_merged_with_questions.csv", partners, questions)
+        csv_mb = csv_path.stat().st_size / 2**20
+        questions = questions or sum(col.endswith("_Answer") for col in pd.read_csv(csv_path, nrows=0).columns)
+        command = [sys.executable, "-m", "benchmarks.suite", "--worker", str(csv_path),
+                   "--partners", str(partners), "--repeat", str(repeat), "--calls", str(calls),
+                   "--delta-fraction", str(delta_fraction), "--questions", str(questions)]
+        result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed:\n{result.stderr[-2000:]}")
+        metrics = json.loads(result.stdout.strip().splitlines()[-1])
+    return {"partners": partners, "questions": questions, "csv_mb": csv_mb, "metrics": metrics}
+
+def _git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+# Function to compare the timings of two suite results
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print the change of every timing present in both results; return the ones that grew beyond threshold"""
+    regressions = []
+    old_runs = {(run["partners"], run["questions"]): run for run in baseline["runs"]}
+    for run in results["runs"]:
+        old = old_runs.get((run["partners"], run["questions"]))
+        if old is None:
+            continue
+        for path, values in run["metrics"].items():
+            for key, value in values.items():
+                old_value = old["metrics"].get(path, {}).get(key)
+                if key not in COMPARED_KEYS or old_value is None or max(value, old_value) < MIN_COMPARED_MS:
+                    continue
+                growth = value / old_value - 1
+                print(f"  {run['partners']:>8} {path:<18} {key:<10} {old_value:>10.2f} -> {value:>10.2f} ms ({growth:+.0%})")
+                if growth > threshold:
+                    regressions.append((run["partners"], path, key, growth))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--partners", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--questions", type=int, help="Number of questions (default: the sample's)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=200, help="Distinct partners per per-call path")
+    parser.add_argument("--delta-fraction", type=float, default=0.005, help="Share of partners appended per delta reload")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative growth of a timing (default: 0.2)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        metrics = run_worker(Path(args.worker), args.partners[0], args.questions, args.repeat, args.calls, args.delta_fraction)
+        print(json.dumps(metrics))
+        return
+
+    results = {
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "runs": [],
+    }
+    for partners in args.partners:
+        run_result = run(partners, args.questions, args.repeat, args.calls, args.delta_fraction)
+        results["runs"].append(run_result)
+        print(f"{partners} partners, {run_result['questions']} questions ({run_result['csv_mb']:.1f} MB CSV)")
+        for path, values in run_result["metrics"].items():
+            print(f"  {path:<18} " + ", ".join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                                             for key, value in values.items()))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        print("Compared to baseline:")
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for partners, path, key, growth in regressions:
+            print(f"Regression: {path} {key} at {partners} partners grew {growth:+.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
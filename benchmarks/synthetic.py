@@ -0,0 +1,139 @@
+"""
+Synthetic versions of final_merged_with_questions.csv for benchmarks.
+
+The columns, their order and the answer formats follow the sample CSV: a numeric answer and its
+option text per question (the sample's options plus extra scores, drawn around a per-partner
+maturity level so KPI scores spread), ';'-joined multi-select answers, the question text on
+every row, and KPI columns computed from the answers with scoring.py. --questions adds questions beyond the sample's by copying existing
+ones under new codes. Rows are written in chunks, so the file can be larger than memory; note
+that every row repeats all question texts (about 17 KB per partner with the sample questions).
+
+Usage: python -m benchmarks.synthetic output.csv --partners 100000 [--questions 120] [--missing 0.02] [--seed 0]
+"""
+import argparse
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from dataset_snapshot import kpi_columns  # noqa: E402
+from scoring import ScoringModel  # noqa: E402
+
+SAMPLE_CSV = REPO_ROOT / "final_merged_with_questions.csv"
+CHUNK_SIZE = 20_000
+# Scores added to the sample's options of every numeric question
+EXTRA_SCORES = (0, 2, 5, 8, 10)
+# Distinct answers generated for every text (multi-select or free text) question
+TEXT_CHOICES = 64
+
+
+# Answer options and question text of one question, taken from the sample
+class _Question:
+    def __init__(self, code: str, sample: pd.DataFrame, source: str = None, rng: np.random.Generator = None):
+        source = source or code
+        self.code = code
+        self.question = str(sample[f"{source}_Answer_question"].dropna().iloc[0]) if f"{source}_Answer_question" in sample else None
+        if source != code and self.question is not None:
+            self.question = f"{self.question} ({code})"
+        answers = sample[f"{source}_Answer"].dropna()
+        texts = sample[f"{source}_Answer_text"]
+        self.numeric = pd.api.types.is_numeric_dtype(answers)
+        if self.numeric:
+            options = {int(score): str(text) for score, text in zip(answers, texts.loc[answers.index])}
+            for score in EXTRA_SCORES:
+                options.setdefault(score, f"Option scoring {score}")
+            self.scores = np.array(sorted(options), dtype=np.int64)
+            self.texts = [options[score] for score in self.scores]
+        else:
+            # Multi-select answers are ';'-joined option lists; other text answers are names
+            tokens = sorted({token for value in answers for token in str(value).split(";") if token})
+            if any(";" in str(value) for value in answers):
+                picks = rng.random((TEXT_CHOICES, len(tokens))) < 0.4
+                picks[np.arange(TEXT_CHOICES), rng.integers(0, len(tokens), TEXT_CHOICES)] = True
+                choices = ["".join(f"{token};" for token, picked in zip(tokens, row) if picked) for row in picks]
+            else:
+                choices = tokens + [f"{tokens[i % len(tokens)]} {i}" for i in range(TEXT_CHOICES - len(tokens))]
+            self.texts = list(dict.fromkeys(choices))
+
+    def draw(self, rng: np.random.Generator, maturity: np.ndarray, missing: float):
+        """Answer and answer text columns for partners of the given maturity (0-1, higher scores more likely)"""
+        rows = len(maturity)
+        if self.numeric:
+            position = 0.7 * maturity + 0.3 * rng.random(rows)
+            codes = np.minimum((position * len(self.texts)).astype(np.int64), len(self.texts) - 1)
+        else:
+            codes = rng.integers(0, len(self.texts), rows)
+        codes[rng.random(rows) < missing] = -1
+        texts = pd.Categorical.from_codes(codes, self.texts)
+        if not self.numeric:
+            return texts, texts
+        answers = self.scores[codes].astype(np.float64)
+        answers[codes < 0] = np.nan
+        return (answers if missing else answers.astype(np.int64)), texts
+
+
+def _questions(sample: pd.DataFrame, count: int, rng: np.random.Generator) -> list:
+    codes = [col[:-len("_Answer")] for col in sample.columns if col.endswith("_Answer")]
+    if count is not None and count < len(codes):
+        raise ValueError(f"At least {len(codes)} questions are needed (the scored ones of the sample)")
+    questions = [_Question(code, sample, rng=rng) for code in codes]
+    # Extra questions copy the options of existing ones under new codes in the same areas
+    for i in range((count or len(codes)) - len(codes)):
+        source = codes[i % len(codes)]
+        area = re.sub(r"_\d+$", "", source)
+        questions.append(_Question(f"{area}_{100 + i}", sample, source=source, rng=rng))
+    return questions
+
+def make_chunk(questions: list, model: ScoringModel, first_id: int, rows: int, rng: np.random.Generator,
+               missing: float = 0.0) -> pd.DataFrame:
+    """Generate the rows of partners first_id .. first_id + rows - 1 in the column layout of the sample CSV"""
+    partner_ids = np.arange(first_id, first_id + rows)
+    # Answers of one partner are correlated, so KPI scores spread like real survey results
+    maturity = rng.beta(2, 2, rows)
+    answers, texts = {}, {}
+    for question in questions:
+        answers[f"{question.code}_Answer"], texts[f"{question.code}_Answer_text"] = question.draw(rng, maturity, missing)
+    question_scores_df = pd.DataFrame({"Partner_ID": partner_ids, **answers})
+    kpi_scores_df = model.score(question_scores_df, kpi_columns)
+
+    columns = {"Partner_ID": partner_ids}
+    columns.update({col: kpi_scores_df[col].to_numpy() for col in kpi_columns})
+    columns["TPID"] = partner_ids * 1111
+    columns.update(answers)
+    columns.update(texts)
+    columns.update({f"{q.code}_Answer_question": q.question for q in questions if q.question is not None})
+    return pd.DataFrame(columns)
+
+def write_csv(path, partners: int, questions: int = None, missing: float = 0.0, seed: int = 0,
+              chunk_size: int = CHUNK_SIZE) -> Path:
+    """Write a synthetic dataset CSV with the given number of partners (and questions) to path"""
+    path = Path(path)
+    rng = np.random.default_rng(seed)
+    sample = pd.read_csv(SAMPLE_CSV)
+    question_list = _questions(sample, questions, rng)
+    model = ScoringModel.load()
+    for start in range(0, partners, chunk_size):
+        chunk = make_chunk(question_list, model, start + 1, min(chunk_size, partners - start), rng, missing)
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="CSV file to write")
+    parser.add_argument("--partners", type=int, default=10_000)
+    parser.add_argument("--questions", type=int, help="Number of questions (default: the sample's)")
+    parser.add_argument("--missing", type=float, default=0.0, help="Share of unanswered questions (default: 0)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = write_csv(args.output, args.partners, args.questions, args.missing, args.seed)
+    print(f"Wrote {args.partners} partners to {path} ({path.stat().st_size / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,117 +1,150 @@
 import os
 import sys
-import pandas as pd
-import numpy as np
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
+import argparse
+import contextlib
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
-from scipy import stats
-from json_to_csv import json_to_dataframe
-
-# Global DataFrames - load once at module level from CSV
-
-merged_df = pd.read_csv("final_merged_with_questions.csv")
-
-# Create KPI scores dataframe (equivalent to the Excel KPI_Scores sheet)
-kpi_columns = ['Sales_and_Marketing', 'Cloud_Strategy', 'Business_model', 'Solution_Area_Focus', 
-               'Cloud_Services', 'Cloud_Tooling', 'KPI_Strat', 'KPI_AI', 'KPI_Copilot', 'KPI_SEC', 
-               'KPI_Scale', 'KPI_Data', 'AIDW_AI_Index', 'AIDW_DB_Index', 'AIDW_Inno_Index', 
-               'Business_Capability', 'Technical_Capability', 'AIDW_Index', 'Partner_PTI', 'AIDW_ready']
-kpi_scores_df = merged_df[['Partner_ID'] + kpi_columns].set_index('Partner_ID')
-
-# Create question scores dataframe (equivalent to the Excel Question_Scores sheet)
-question_answer_columns = [col for col in merged_df.columns if col.endswith('_Answer') and not col.endswith('_Answer_text') and not col.endswith('_Answer_question')]
-question_scores_df = merged_df[['Partner_ID', 'TPID'] + question_answer_columns].copy()
-
-# Create question mapping dictionary from the CSV data
-question_text_columns = [col for col in merged_df.columns if col.endswith('_Answer_question')]
-question_dict = {}
-for col in question_text_columns:
-    question_code = col.replace('_Answer_question', '_Answer')
-    # Get the first non-null question text for this question code
-    question_text = merged_df[col].dropna().iloc[0] if not merged_df[col].dropna().empty else question_code
-    question_dict[question_code] = question_text
+from dataset_snapshot import comparison_kpis, load_snapshot
+from stats_index import KPIStatsIndex
+from prompt_scheduler import run_prompt_dag, inject_dependency_outputs
+from thread_manager import ThreadManager, CLEANUP_MODES
+from response_cache import ResponseCache, section_keys
+from report_journal import (ReportWriter, ReportJournal, ReportRun, format_report_header, format_report_section,
+                            format_backup_entry)
+import metrics
+from metrics import span, observe
+from agent_controller import AgentRunError, get_controller
+from prompt_encoding import PromptEncoder, CATALOG_MODES, compact_whitespace, estimate_tokens, format_kpi_table
+from partner_store import plain_value
+
+DATA_FILE = "final_merged_with_questions.csv"
+# Compute the KPI scores from the answers (scoring.py, kpi_weights.csv) instead of reading them from the CSV
+DERIVE_KPIS = os.getenv("DERIVE_KPIS", "").lower() in ("1", "true", "yes")
+# Also compare each partner with its most similar partners in the comparison prompt (0 = off)
+COMPARISON_PEERS = int(os.getenv("COMPARISON_PEERS", "0"))
+# Compact prompts (see prompt_encoding.py): question codes instead of question texts, KPI tables, no template indentation
+COMPACT_PROMPTS = os.getenv("COMPACT_PROMPTS", "").lower() in ("1", "true", "yes")
+# Estimated token budget of the compact summary prompt (0 = no budget); low-signal answers are left out first
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+# Where the agent gets the question catalog of compact summaries: "thread" or "instructions"
+QUESTION_CATALOG = os.getenv("QUESTION_CATALOG", "thread")
+# Also build the verbose prompts of every compact report, to print how many tokens compact mode saves
+PROMPT_TOKEN_REPORT = os.getenv("PROMPT_TOKEN_REPORT", "").lower() in ("1", "true", "yes")
+
+# Current dataset snapshot - loaded once, on first use (see get_snapshot), so importing this
+# module (e.g. by the Function app) doesn't parse the dataset before a route needs it.
+# A reload swaps in a new snapshot in one assignment; readers keep the one they started with.
+_snapshot = None
+_data_lock = threading.Lock()
 
 # Function to reload data from CSV file
-def reload_data():
-    """Reload all data from CSV file"""
-    global merged_df, kpi_scores_df, question_scores_df, question_dict
-    merged_df = pd.read_csv("final_merged_with_questions.csv")
-    
-    # Recreate KPI scores dataframe
-    kpi_columns = ['Sales_and_Marketing', 'Cloud_Strategy', 'Business_model', 'Solution_Area_Focus', 
-                   'Cloud_Services', 'Cloud_Tooling', 'KPI_Strat', 'KPI_AI', 'KPI_Copilot', 'KPI_SEC', 
-                   'KPI_Scale', 'KPI_Data', 'AIDW_AI_Index', 'AIDW_DB_Index', 'AIDW_Inno_Index', 
-                   'Business_Capability', 'Technical_Capability', 'AIDW_Index', 'Partner_PTI', 'AIDW_ready']
-    kpi_scores_df = merged_df[['Partner_ID'] + kpi_columns].set_index('Partner_ID')
-    
-    # Recreate question scores dataframe
-    question_answer_columns = [col for col in merged_df.columns if col.endswith('_Answer') and not col.endswith('_Answer_text') and not col.endswith('_Answer_question')]
-    question_scores_df = merged_df[['Partner_ID', 'TPID'] + question_answer_columns].copy()
-    
-    # Recreate question mapping dictionary
-    question_text_columns = [col for col in merged_df.columns if col.endswith('_Answer_question')]
-    question_dict = {}
-    for col in question_text_columns:
-        question_code = col.replace('_Answer_question', '_Answer')
-        question_text = merged_df[col].dropna().iloc[0] if not merged_df[col].dropna().empty else question_code
-        question_dict[question_code] = question_text
+def reload_data(derive_kpis: bool = None):
+    """
+    Reload the data from the CSV file (through its columnar snapshot, see columnar_store.load_dataset).
+    Nothing is rebuilt when the file is unchanged, and only the changed partners are re-indexed
+    when few rows changed (see dataset_snapshot.load_snapshot). Returns the current snapshot.
+    derive_kpis computes kpi_scores_df from the answers (default: the DERIVE_KPIS setting).
+    """
+    with _data_lock:
+        return _load_snapshot(derive_kpis)
+
+def _load_snapshot(derive_kpis: bool = None):
+    # Called with _data_lock held
+    global _snapshot
+    if derive_kpis is None:
+        derive_kpis = _snapshot.derive_kpis if _snapshot is not None else DERIVE_KPIS
+    with span("data_load", derive_kpis=derive_kpis) as attributes:
+        snapshot, how = load_snapshot(DATA_FILE, previous=_snapshot, derive_kpis=derive_kpis)
+        attributes.update(how=how, version=snapshot.version, partners=len(snapshot.kpi_scores_df))
+    if how != "unchanged":
+        print(f"Data version {snapshot.version} loaded ({how})")
+    _snapshot = snapshot
+    return snapshot
+
+# Function to get the current dataset snapshot
+def get_snapshot():
+    """Return the current dataset snapshot, loading the data on first use"""
+    snapshot = _snapshot
+    if snapshot is None:
+        with _data_lock:
+            snapshot = _snapshot if _snapshot is not None else _load_snapshot()
+    return snapshot
+
+def ensure_data_loaded():
+    """Load the data on first use"""
+    get_snapshot()
+
+# Data attributes kept for compatibility, served from the current snapshot
+_SNAPSHOT_ATTRIBUTES = ('kpi_scores_df', 'question_scores_df', 'answer_texts_df', 'question_dict',
+                        'question_answer_columns', 'kpi_stats_index', 'partner_store', 'peer_index', 'segment_cube',
+                        'data_version')
+
+def __getattr__(name):
+    # Module attributes that are created lazily: the data of the current snapshot and the shared agent client
+    if name in _SNAPSHOT_ATTRIBUTES:
+        return getattr(get_snapshot(), name)
+    if name == 'project_client':
+        return get_project_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # function for getting response from CSV data
 def prepare_partner_summary(partner_id: int):
-    try:
-        # Get the partner's KPI scores
-        partner_kpis = kpi_scores_df.loc[partner_id]
-    except KeyError:
-        print("Available Partner IDs:", kpi_scores_df.index.tolist())
-        raise ValueError(f"Partner ID {partner_id} not found in KPI scores. Please check the available IDs above.")
-    
-    # Get the partner's question scores
-    partner_questions = question_scores_df[question_scores_df['Partner_ID'] == partner_id]
-    if partner_questions.empty:
-        raise ValueError(f"Partner ID {partner_id} not found in Question scores")
-    partner_questions = partner_questions.iloc[0]
-    
-    # Get TPID from question scores
-    tpid = partner_questions['TPID']
-    
-    # Prepare the summary text in the requested format
-    summary_text = f"""Chosen Partner: {partner_id} with TPID: {tpid}
+    with span("partner_summary", partner_id=partner_id):
+        snapshot = get_snapshot()
+        try:
+            # Rendered from the partner store, cached until the next data change
+            return snapshot.partner_store.render_summary(partner_id)
+        except KeyError:
+            print("Available Partner IDs:", snapshot.kpi_scores_df.index.tolist())
+            raise ValueError(f"Partner ID {partner_id} not found in KPI scores. Please check the available IDs above.")
+
+# Function to get the content of a partner summary as JSON-serializable data
+def prepare_summary_record(partner_id: int) -> dict:
+    """Partner ID, TPID, KPI scores and question replies of prepare_partner_summary as a dict"""
+    with span("partner_summary", partner_id=partner_id, format="json"):
+        try:
+            return get_snapshot().partner_store.summary_record(partner_id)
+        except KeyError:
+            raise ValueError(f"Partner ID {partner_id} not found in KPI scores.") from None
+
+# Function to create an Azure AI project client
+def create_project_client():
+    """
+    Create a new AIProjectClient (the Azure SDK is only imported here, on first use).
+    FAKE_AGENT=true returns the offline stand-in from fake_agent.py instead, with run latencies
+    drawn from FAKE_AGENT_LATENCY (default lognormal:2.0:0.5).
+    """
+    if os.getenv("FAKE_AGENT", "").lower() in ("1", "true", "yes"):
+        from fake_agent import FakeProjectClient
+        return FakeProjectClient(latency=os.getenv("FAKE_AGENT_LATENCY", "lognormal:2.0:0.5"))
 
-KPI Scores:"""
-    
-    # Add KPI scores to summary, ensuring AIDW_ready is included
-    for kpi, score in partner_kpis.items():
-        if kpi == 'AIDW_ready':
-            # Handle AIDW_ready as a string value
-            summary_text += f"\n{kpi}: {score}"
-        elif isinstance(score, (int, float)) and not np.isnan(score):   # here we check if the score is a number(!) and not NaN
-            summary_text += f"\n{kpi}: {score:.2f}"
-    
-    summary_text += "\n\nQuestion replies:"
-    
-    # Add question scores to summary with full question text and numbering
-    for i, (question_code, score) in enumerate(partner_questions.items(), 1):
-        if question_code not in ['Partner_ID', 'TPID']:
-            # Get the full question text from mapping, if available
-            full_question = question_dict.get(question_code, question_code)  # Use code as fallback
-            summary_text += f"\n{i}. {full_question}: {score}"
-    
-    return summary_text
+    from azure.ai.projects import AIProjectClient
+    from azure.identity import DefaultAzureCredential
 
-project_client = AIProjectClient(
-    credential=DefaultAzureCredential(),
-    endpoint=os.getenv("AZURE_ENDPOINT")
-)
+    return AIProjectClient(
+        credential=DefaultAzureCredential(),
+        endpoint=os.getenv("AZURE_ENDPOINT")
+    )
+
+_project_client = None
+_client_lock = threading.Lock()
+
+# Function to get the shared Azure AI project client, created on first use
+def get_project_client():
+    """Return the shared AIProjectClient, creating it (and its credentials) on first use"""
+    global _project_client
+    if _project_client is None:
+        with _client_lock:
+            if _project_client is None:
+                _project_client = create_project_client()
+    return _project_client
 
 # Function to initialize that specific Azure AI agent
 def initialize_agent():
     """Initialize the Azure AI agent and verify its existence"""
-    project_client = AIProjectClient(
-        credential=DefaultAzureCredential(),
-        endpoint=os.getenv("AZURE_ENDPOINT")
-    )
+    project_client = create_project_client()
     agent_id = os.getenv("AZURE_AGENT_ID")
 
     return project_client, agent_id
@@ -122,28 +155,99 @@ class ResponseWrapper:
 
 # Function to send a message to the agent and get the response
 def send_message_to_agent(project_client, thread_id: str, agent_id: str, content: str):
-    """Send a message to the agent and get the response"""
-    message = project_client.agents.messages.create(
-        thread_id=thread_id,
-        role="user",
-        content=content
-    )
+    """
+    Send a message to the agent and get the response.
+    Every call goes through the agent controller (see agent_controller.py): the run waits for a
+    concurrency slot and the quota, and throttled or transient errors are retried within the
+    section's retry budget. A run that still fails raises AgentRunError.
+    """
+    controller = get_controller()
+    budget = controller.budget()
+
+    def create_message():
+        with span("agent_message_create", prompt_chars=len(content)):
+            return project_client.agents.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=content
+            )
+    message = controller.call(create_message, budget)
     print(f"Sent message, ID: {message.id}")
-    
-    run = project_client.agents.runs.create_and_process(thread_id=thread_id, agent_id=agent_id)
-    print(f"Run finished with status: {run.status}")
-    
-    if run.status == "failed":
-        raise RuntimeError(f"Run failed: {run.last_error}")
-    
-    messages = project_client.agents.messages.list(thread_id=thread_id)
-    for message in messages:
-        if message.text_messages:
-            # print(f"{message.role}: {message.text_messages[-1].text.value}")
-            return message.text_messages[-1]
-    return None
 
+    # A failed run leaves the message unanswered on the thread, so a retry runs the thread again
+    def run_agent():
+        with span("agent_run") as attributes:
+            run = project_client.agents.runs.create_and_process(thread_id=thread_id, agent_id=agent_id)
+            attributes.update(run_status=str(run.status), **_token_usage(run))
+        print(f"Run finished with status: {run.status}")
+        if run.status == "failed":
+            raise AgentRunError(run.last_error)
+        return run
+    run = controller.call(run_agent, budget, run=True, tokens=controller.estimate_tokens(content))
+
+    # Only the messages of this run, newest first, so retrieval cost doesn't grow with the thread history
+    def list_messages():
+        with span("agent_messages_list") as attributes:
+            messages = project_client.agents.messages.list(thread_id=thread_id, run_id=run.id, order="desc")
+            for message in messages:
+                if message.text_messages:
+                    # print(f"{message.role}: {message.text_messages[-1].text.value}")
+                    attributes["response_chars"] = len(message.text_messages[-1].text.value)
+                    return message.text_messages[-1]
+        return None
+    return controller.call(list_messages, budget)
+
+def _token_usage(run) -> dict:
+    """Prompt, completion and total tokens of a run, when the service reports them"""
+    usage = getattr(run, "usage", None)
+    if usage is None:
+        return {}
+    return {name: getattr(usage, name) for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+            if isinstance(getattr(usage, name, None), int)}
+
+# Function to send a message to the agent and stream the response as it is generated
+def stream_message_to_agent(project_client, thread_id: str, agent_id: str, content: str):
+    """
+    Send a message to the agent and yield the response text deltas as they arrive.
+    The message is retried like in send_message_to_agent and the run holds a slot of the agent
+    controller, but a run that fails part way through is not retried: its output was already yielded.
+    """
+    from azure.ai.agents.models import AgentStreamEvent, MessageDeltaChunk, ThreadRun
+
+    controller = get_controller()
+
+    def create_message():
+        with span("agent_message_create", prompt_chars=len(content)):
+            return project_client.agents.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=content
+            )
+    message = controller.call(create_message)
+    print(f"Sent message, ID: {message.id}")
 
+    # The run is timed by hand: a span can't stay open across the yields to the consumer
+    started = time.perf_counter()
+    attributes = {"response_chars": 0}
+    status = "error"
+    try:
+        with controller.slot(controller.estimate_tokens(content)), \
+                project_client.agents.runs.stream(thread_id=thread_id, agent_id=agent_id) as stream:
+            for event_type, event_data, _ in stream:
+                if isinstance(event_data, MessageDeltaChunk):
+                    if event_data.text:
+                        attributes["response_chars"] += len(event_data.text)
+                        yield event_data.text
+                elif isinstance(event_data, ThreadRun) and event_data.status == "failed":
+                    raise AgentRunError(event_data.last_error)
+                elif event_type == AgentStreamEvent.ERROR:
+                    raise RuntimeError(f"Run failed: {event_data}")
+                elif event_type == AgentStreamEvent.DONE:
+                    break
+        status = "ok"
+    finally:
+        observe("agent_run_stream", time.perf_counter() - started, status=status, **attributes)
+    print("Run finished streaming")
 
 
 # Function to save the conversation history to a text file
@@ -157,345 +261,660 @@ def save_conversation_to_text(conversation_history, partner_id: int) -> Path:
     output_file = output_dir / f"partner_{partner_id}_analysis_{timestamp}.txt"
     
     with output_file.open('w', encoding='utf-8') as f:
-        f.write(f"Analysis for Partner {partner_id}\n")
-        f.write(f"Generated on: {timestamp}\n")
-        f.write("="*80 + "\n\n")
-        
-        # Write initial summary first (it's in the first conversation turn)
-        if conversation_history:
-            f.write("=== Initial Summary ===\n\n")
-            f.write(conversation_history[0]["user"])  # This contains prepare_partner_summary output
-            f.write("\n\n" + "="*80 + "\n\n")
-        
-        # Write only assistant responses for subsequent turns
-        for turn in conversation_history[1:]:  # Skip the first turn as we already handled it
-            section_name = turn.get('name', 'Analysis')  # Get the specific name from the turn
-            f.write(f"=== {section_name} ===\n\n")
-            f.write(turn["assistant"])
-            f.write("\n\n" + "="*80 + "\n\n")
+        f.write(format_report_header(partner_id, timestamp))
+        # The first turn is written as the initial summary (prepare_partner_summary output), the others as responses
+        for i, turn in enumerate(conversation_history):
+            f.write(format_report_section(turn, first=i == 0))
     
     print(f"\nAnalysis saved to: {output_file.absolute()}")
     return output_file
 
-# Function to prepare comparison statistics for a specific partner
-def prepare_comparison_stats(partner_id: int) -> str:
-    """
-    Prepares comparison statistics text including the percentile of the chosen partner for each KPI.
-    Returns formatted string ready to be used in the prompts.
-    """
-    # Get partner's scores
-    try:
-        partner_scores = kpi_scores_df.loc[partner_id]
-    except KeyError:
-        raise ValueError(f"Partner ID {partner_id} not found in KPI scores")
-    
-    comparison_text = "Statistics of all partners:\n"
+# Function to format the comparison statistics text of one partner
+def _format_comparison_stats(kpi_stats_index, scores, percentiles, title: str = "Statistics of all partners") -> str:
+    """Format comparison statistics text from a partner's KPI scores and percentiles"""
+    comparison_text = f"{title}:\n"
     
-    # List of KPIs to analyze
-    kpis = [
-        'Sales_and_Marketing', 'Cloud_Strategy', 'Business_model', 
-        'Solution_Area_Focus', 'Cloud_Tooling', 'KPI_Strat',
-        'KPI_AI', 'KPI_Copilot', 'KPI_Scale', 'KPI_Data',
-        'AIDW_AI_Index', 'AIDW_DB_Index', 'AIDW_Inno_Index',
-        'Business_Capability', 'AIDW_Index', 'Partner_PTI'
-    ]
-    
-    for kpi in kpis:
-        if kpi not in kpi_scores_df.columns:
-            continue
-            
-        # Calculate statistics
-        mean = kpi_scores_df[kpi].mean()
-        std = kpi_scores_df[kpi].std()
-        p25 = kpi_scores_df[kpi].quantile(0.25)
-        p75 = kpi_scores_df[kpi].quantile(0.75)
-        
-        # Calculate partner's percentile
-        partner_value = partner_scores[kpi]
-        partner_percentile = int(stats.percentileofscore(kpi_scores_df[kpi].dropna(), partner_value))
+    for i, kpi in enumerate(kpi_stats_index.kpis):
+        kpi_stats = kpi_stats_index.stats[kpi]
+        partner_value = scores[i]
+        partner_percentile = int(percentiles[i])
         
         # Format the text
         comparison_text += (
-            f" {kpi}: Mean - {mean:.2f}, "
-            f"Standard Deviation - {std:.2f}, "
-            f"25th percentile - {p25:.2f}, "
-            f"75th percentile - {p75:.2f}, "
+            f" {kpi}: Mean - {kpi_stats.mean:.2f}, "
+            f"Standard Deviation - {kpi_stats.std:.2f}, "
+            f"25th percentile - {kpi_stats.p25:.2f}, "
+            f"75th percentile - {kpi_stats.p75:.2f}, "
             f"Partner Score - {partner_value:.2f} "
             f"(at {partner_percentile}th percentile)\n"
         )
     
     return comparison_text
 
-######### Getting the resoponce from the agent and saving it #########
-
-# step before running the code:
-# 1. activate the environment .venv\scripts\activate
-# 2. in powershell run the command: az login     and then, select the subscription you want to use (or press enter to use the default one)
-# 3. set the environment variable AZURE_CONNECTION_STRING with the connection string of your project
-#    i.e. code to run: $env:AZURE_CONNECTION_STRING = "" set here the connection string of your project
-# 4. run the script in powershell: python chat_paiti.py
+# Function to put the comparison statistics of one partner into a dict
+def _comparison_record(kpi_stats_index, scores, percentiles, title: str = "Statistics of all partners") -> dict:
+    """The values of _format_comparison_stats as JSON-serializable data, one entry per KPI"""
+    kpis = []
+    for i, kpi in enumerate(kpi_stats_index.kpis):
+        kpi_stats = kpi_stats_index.stats[kpi]
+        kpis.append({
+            "kpi": kpi,
+            "mean": plain_value(kpi_stats.mean),
+            "std": plain_value(kpi_stats.std),
+            "p25": plain_value(kpi_stats.p25),
+            "p75": plain_value(kpi_stats.p75),
+            "partner_score": plain_value(scores[i]),
+            "partner_percentile": int(percentiles[i]),
+        })
+    return {"title": title, "kpis": kpis}
 
-def main():
-    try:
-        # Optionally reload data before processing
-        reload_data()     # uncomment this line if you want to reload data from Excel files (e.g. when data is updated). Cuz data is saved in global variables, you can use it without reloading
+# Function to prepare comparison statistics for a specific partner
+def prepare_comparison_stats(partner_id: int, segment: str = None, compact: bool = False) -> str:
+    """
+    Prepares comparison statistics text including the percentile of the chosen partner for each KPI.
+    With a segment (see segments.SEGMENTS) the partner is compared with its own group of that segment.
+    compact formats the statistics as a table (see prompt_encoding.format_kpi_table).
+    Returns formatted string ready to be used in the prompts.
+    """
+    with span("comparison_stats", partner_id=partner_id, segment=segment):
+        return prepare_comparison_stats_batch([partner_id], segment, compact)[partner_id]
+
+# Function to get the comparison statistics of a partner as JSON-serializable data
+def prepare_comparison_record(partner_id: int, segment: str = None) -> dict:
+    """The statistics of prepare_comparison_stats as a dict (title and one entry per KPI)"""
+    with span("comparison_stats", partner_id=partner_id, segment=segment, format="json"):
+        record = _comparison_stats_batch([partner_id], segment, _comparison_record)[partner_id]
+        return dict(partner_id=partner_id, segment=segment, **record)
+
+# Function to prepare comparison statistics for many partners at once
+def prepare_comparison_stats_batch(partner_ids: list, segment: str = None, compact: bool = False) -> dict:
+    """
+    Prepares comparison statistics texts for many partners in one vectorized pass.
+    Returns a dict of partner ID -> formatted string.
+    """
+    return _comparison_stats_batch(partner_ids, segment, format_kpi_table if compact else _format_comparison_stats)
+
+def _comparison_stats_batch(partner_ids: list, segment: str, format_stats) -> dict:
+    snapshot = get_snapshot()
+    kpi_stats_index = snapshot.kpi_stats_index
+    partner_ids = list(partner_ids)
+    scores = kpi_stats_index.partner_scores(partner_ids)
+    if segment is None:
+        percentiles = kpi_stats_index.percentiles(partner_ids)
+        return {
+            partner_id: format_stats(kpi_stats_index, scores[row], percentiles[row])
+            for row, partner_id in enumerate(partner_ids)
+        }
+
+    # Statistics come precomputed from the segment cube, one cohort per group
+    groups = snapshot.segment_cube.partner_groups(segment, partner_ids)
+    column = snapshot.segment_cube.segments[segment].column
+    return {
+        partner_id: format_stats(group_index, scores[row], group_index.percentiles_of(scores[row])[0],
+                                 title=f"Statistics of partners with {column} {label}")
+        for row, (partner_id, (label, group_index)) in enumerate(zip(partner_ids, groups))
+    }
+
+# Function to prepare comparison statistics against a partner's most similar partners
+def prepare_peer_comparison_stats(partner_id: int, k: int = 10, metric: str = "euclidean", compact: bool = False) -> str:
+    """
+    Prepares comparison statistics text of the partner against its k nearest peers by KPI profile
+    (see peers.PeerIndex) instead of all partners.
+    """
+    snapshot = get_snapshot()
+    peers = snapshot.peer_index.nearest(partner_id, k, metric)
+    peer_ids = [peer_id for peer_id, _ in peers]
+    kpi_scores_df = snapshot.kpi_scores_df
+    # The partner is ranked within its peers (it is not one of them)
+    peer_index = KPIStatsIndex(kpi_scores_df.loc[peer_ids], comparison_kpis)
+    scores = snapshot.kpi_stats_index.partner_scores([partner_id])[0]
+    format_stats = format_kpi_table if compact else _format_comparison_stats
+    return format_stats(peer_index, scores, peer_index.percentiles_of(scores)[0],
+                        title=f"Statistics of the {len(peer_ids)} most similar partners")
+
+_prompt_encoder = None
+
+# Function to get the compact prompt encoder of the current dataset snapshot
+def get_prompt_encoder() -> PromptEncoder:
+    global _prompt_encoder
+    snapshot = get_snapshot()
+    encoder = _prompt_encoder
+    if encoder is None or encoder.partner_store is not snapshot.partner_store:
+        encoder = _prompt_encoder = PromptEncoder(snapshot.partner_store, snapshot.question_scores_df)
+    return encoder
+
+# Function to prepare the compact summary of a partner
+def prepare_compact_summary(partner_id: int, token_budget: int = None, catalog: str = None) -> tuple:
+    """
+    Compact summary text of a partner (see prompt_encoding.PromptEncoder) and its info dict.
+    token_budget defaults to PROMPT_TOKEN_BUDGET and catalog to QUESTION_CATALOG: with "thread"
+    the catalog of the partner's questions comes first, with "instructions" the agent already has it.
+    """
+    catalog = catalog or QUESTION_CATALOG
+    if catalog not in CATALOG_MODES:
+        raise ValueError(f"Question catalog must be one of {', '.join(CATALOG_MODES)}")
+    with span("compact_summary", partner_id=partner_id) as attributes:
+        try:
+            text, info = get_prompt_encoder().encode_summary(
+                partner_id, token_budget if token_budget is not None else PROMPT_TOKEN_BUDGET,
+                include_catalog=catalog == "thread")
+        except KeyError:
+            raise ValueError(f"Partner ID {partner_id} not found in KPI scores.")
+        attributes.update(info)
+    return text, info
+
+# Function to build the report prompts for a specific partner
+def build_prompts(partner_id: int, summary: str, compact: bool = None) -> list:
+    """
+    Build the list of report prompts for a partner.
+    Each prompt has a name, its content and the names of the sections it depends on.
+    compact (default: COMPACT_PROMPTS) replaces the summary with the compact summary, the comparison
+    statistics with KPI tables and strips the template indentation; the estimated prompt tokens are
+    printed (with PROMPT_TOKEN_REPORT also those of the verbose prompts, which are built for that).
+    """
+    compact = COMPACT_PROMPTS if compact is None else compact
+    if compact:
+        verbose_summary = summary
+        summary, summary_info = prepare_compact_summary(partner_id)
+    comparison_stats = prepare_comparison_stats(partner_id, compact=compact)
+    if COMPARISON_PEERS:
+        comparison_stats += prepare_peer_comparison_stats(partner_id, COMPARISON_PEERS, compact=compact)
+
+    # Define all prompts (in report order, dependencies declared per section)
+    prompts = [
+        {"name": "Initial Summary", "depends_on": [], "content": f"""For this prompt, just consume the text. I need your output from the next prompt.
+        {summary}"""},
         
-        project_client, agent_id = initialize_agent()
+        {"name": "Strength Analysis", "depends_on": ["Initial Summary"], "content": """
+        [Response Language: German (just like mentioned in instructions)]
+        Based on the previous evaluation summary, generate a detailed analysis of the customer's strengths. Your response must include exactly 5-6 distinct strengths. 
+
+        For each strength:
+        - Start with a bolded headline stating the name of the strength (use Markdown formatting: **Strength Name**)
+        - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
+        - What this strength is
+        - What it means having this strength
+        - What it enables them to do
+        - How it impacts partner's customers or business performance
+        - Market relevance of this strength
+        - How transformative is this strength manifested in the partner's answers
+        - How disruptive is this strength manifested in the partner's answers
         
-        # Initialize conversation history
-        conversation_history = []
-        partner_id = 1  # Replace with your partner ID
 
-        # Prepare summary before entering context
-        summary = prepare_partner_summary(partner_id)
+        Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
+        Use the following format:
+         
+        **Strength #1 headline**:  
+        [Paragraph about this strength.]
+
+        **Strength #2 headline**:  
+        [Paragraph about this strength.]
+         
+        (and so on until Strength #5)
+        """},
         
-        # All Azure client operations within a single context manager
-        with project_client:
-            # Create thread
-            thread_id = os.getenv("AZURE_THREAD_ID")
-            thread = project_client.agents.threads.get(thread_id)
-            print(f"Created thread, ID: {thread.id}")
-            
-            # Define all prompts
-            prompts = [
-                {"name": "Initial Summary", "content": f"""For this prompt, just consume the text. I need your output from the next prompt.
-                {summary}"""},
-                
-                {"name": "Strength Analysis", "content": """
-                [Response Language: German (just like mentioned in instructions)]
-                Based on the previous evaluation summary, generate a detailed analysis of the customer's strengths. Your response must include exactly 5-6 distinct strengths. 
-
-                For each strength:
-                - Start with a bolded headline stating the name of the strength (use Markdown formatting: **Strength Name**)
-                - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
-                - What this strength is
-                - What it means having this strength
-                - What it enables them to do
-                - How it impacts partner's customers or business performance
-                - Market relevance of this strength
-                - How transformative is this strength manifested in the partner's answers
-                - How disruptive is this strength manifested in the partner's answers
-                
-
-                Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
-                Use the following format:
-                 
-                **Strength #1 headline**:  
-                [Paragraph about this strength.]
-
-                **Strength #2 headline**:  
-                [Paragraph about this strength.]
-                 
-                (and so on until Strength #5)
-                """},
-                
-                {"name": "Weakness Analysis", "content": """
-                [Response Language: German (just like mentioned in instructions)]
-                Based on the previous evaluation summary, generate a detailed analysis of the customer's weaknesses. Your response must include exactly 5-6 distinct weaknesses. 
-
-                For each weakness:
-                - Start with a bolded headline stating the name of the weakness (use Markdown formatting: **Weakness Name**)
-                - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
-                - What this weakness is
-                - What it means having this weakness
-                - What it limits them to do
-                - How it impacts their customers or business performance
-
-                Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
-                Use the following format:
-                 
-                **Weakness #1 headline**:  
-                [Paragraph about this weakness.]
-
-                **Weakness #2 headline**:  
-                [Paragraph about this weakness.]
-                 
-                (and so on until Weakness #5)
-                """},
-
-                {"name": "Opportunity Assessment", "content": """
-                [Response Language: German (just like mentioned in instructions)]
-                Based on the previous evaluation summary, generate a detailed analysis of the customer's business opportunities emerging from their identified strengths. Your response must include exactly same amount of distinct opportunities as strengths.
-
-                For each opportunity:
-                - Start with a bolded headline stating the name of the opportunity (use Markdown formatting: **Opportunity Name**)
-                - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
-                - What business opportunity arises from the corresponding strength
-                - What it would enable the partner to achieve if they effectively exploit this strength
-                - How it could positively impact partner's customers or overall business performance after leveraging this strength
-
-                Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
-
-                Use the following format:
-
-                **Opportunity #1 headline**:  
-                [Paragraph about this opportunity.]
-
-                **Opportunity #2 headline**:  
-                [Paragraph about this opportunity.]
-
-                (and so on until Opportunity #5)
-                """},
-
-                {"name": "Comparison to other partners", "content": f"""
-                [Response Language: German (just like mentioned in instructions)]
-                {prepare_comparison_stats(partner_id)}
-
-                Based on the summary statistics of all partner results and selected partner, generate a detailed analysis focusing on the partner's top 3 best-performing and bottom 3 worst-performing KPIs. 
-                Focus primarily on the following KPIs: KPI_Strat, KPI_AI, KPI_Copilot, KPI_SEC, KPI_Scale, KPI_Data, AIDW_Index and AIDW_ready, Business_Capability, Technical_Capability. Avoid focusing on AIDW_AI_Index, AIDW_DB_Index and AIDW_Inno_Index as seperate area of focus.
-                Keep the language simple avoiding statistics jargon, and focus on clear, simple comparison. E.g. instead of specific percentile, say in top x% performers.
-
-                First analyze the 3 strongest KPIs (where the partner performs best relative to other partners), then the 3 weakest KPIs (where the partner shows the most room for improvement). For each KPI:
-                - Start with a bolded headline stating the KPI name (use Markdown formatting: **KPI Name - Strong/Weak Performance**)
-                - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
-                - The partner's performance in this KPI relative to other partners
-                - What this performance level means for the partner's business
-                - How this impacts their market position
-                - Specific recommendations for maintaining strength or improving weakness
-                - General maturity level in this area
-
-                Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
-                Use the following format:
-
-                ### Top 3 Strongest KPIs:
-
-                **KPI #1 - Area of Excellence**:  
-                [Paragraph about this KPI's strong performance.]
-
-                **KPI #2 - Area of Excellence**:  
-                [Paragraph about this KPI's strong performance.]
-
-                **KPI #3 - Area of Excellence**:  
-                [Paragraph about this KPI's strong performance.]
-
-                ### Top 3 Areas for Improvement:
-
-                **KPI #1 - Development Area**:  
-                [Paragraph about this KPI's weak performance.]
-
-                **KPI #2 - Development Area**:  
-                [Paragraph about this KPI's weak performance.]
-
-                **KPI #3 - Development Area**:  
-                [Paragraph about this KPI's weak performance.]
-                """},
-
-                {"name": "Recommendation Assessment", "content": """
-                [Response Language: German (just like mentioned in instructions)]                
-                Based on the previous evaluation summary, generate a detailed set of actionable recommendations for the customer. Your recommendations must be divided into two distinct sections:
-
-                1. **Recommendations for Weaknesses**  
-                2. **Recommendations for Opportunities**
+        {"name": "Weakness Analysis", "depends_on": ["Initial Summary"], "content": """
+        [Response Language: German (just like mentioned in instructions)]
+        Based on the previous evaluation summary, generate a detailed analysis of the customer's weaknesses. Your response must include exactly 5-6 distinct weaknesses. 
 
-                The number of recommendations in each section must directly correspond to the number of weaknesses and opportunities identified in the previous analysis. For example, if five weaknesses were identified, provide five recommendations in the 'Recommendations for Weaknesses' section. If six opportunities were identified, provide six recommendations in the 'Recommendations for Opportunities' section.
+        For each weakness:
+        - Start with a bolded headline stating the name of the weakness (use Markdown formatting: **Weakness Name**)
+        - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
+        - What this weakness is
+        - What it means having this weakness
+        - What it limits them to do
+        - How it impacts their customers or business performance
+
+        Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
+        Use the following format:
+         
+        **Weakness #1 headline**:  
+        [Paragraph about this weakness.]
+
+        **Weakness #2 headline**:  
+        [Paragraph about this weakness.]
+         
+        (and so on until Weakness #5)
+        """},
+
+        {"name": "Opportunity Assessment", "depends_on": ["Initial Summary", "Strength Analysis"], "content": """
+        [Response Language: German (just like mentioned in instructions)]
+        Based on the previous evaluation summary, generate a detailed analysis of the customer's business opportunities emerging from their identified strengths. Your response must include exactly same amount of distinct opportunities as strengths.
 
-                For each recommendation:
-                - Clearly state which specific weakness or opportunity it addresses (or both, if applicable)
-                - Start with a bolded headline naming the recommendation (use Markdown formatting: **Recommendation Name**)
-                - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
-                    - What the recommendation involves
-                    - Why it is relevant for the customer, based on the identified weakness or opportunity
-                    - How it will help address that weakness or exploit that opportunity
-                    - The expected business or customer impact after implementation
-                    - Give me estimated effort and time to implement this recommendation in terms of short-term (1 month), mid-term (3-6 months) or long-term (6-12 months) horizon
-                    - Give me estimation on how sales relevant this recommendation is, in terms of high, medium or low sales relevance
+        For each opportunity:
+        - Start with a bolded headline stating the name of the opportunity (use Markdown formatting: **Opportunity Name**)
+        - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
+        - What business opportunity arises from the corresponding strength
+        - What it would enable the partner to achieve if they effectively exploit this strength
+        - How it could positively impact partner's customers or overall business performance after leveraging this strength
 
-                 
-                Each recommendation must include **at least one specific, concrete suggestion**, such as:
-                - Relevant Microsoft training programs
-                - Microsoft Certification courses
-                - Microsoft Workshops
-                - Microsoft Internal process improvements
-                - Microsoft Strategic initiatives
+        Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
 
-                You have access to the connected knowledge base of available programs, certificates, and resources, and should suggest the most relevant and up-to-date options in each case.
+        Use the following format:
 
-                Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique recommendation without repeating ideas.
+        **Opportunity #1 headline**:  
+        [Paragraph about this opportunity.]
 
-                Use the following format:
+        **Opportunity #2 headline**:  
+        [Paragraph about this opportunity.]
 
-                ### Recommendations for Weaknesses:
+        (and so on until Opportunity #5)
+        """},
 
-                **Recommendation #1 headline**:  
-                [Paragraph about this recommendation.]
+        {"name": "Comparison to other partners", "depends_on": ["Initial Summary"], "content": f"""
+        [Response Language: German (just like mentioned in instructions)]
+        {comparison_stats}
 
-                **Recommendation #2 headline**:  
-                [Paragraph about this recommendation.]
+        Based on the summary statistics of all partner results and selected partner, generate a detailed analysis focusing on the partner's top 3 best-performing and bottom 3 worst-performing KPIs. 
+        Focus primarily on the following KPIs: KPI_Strat, KPI_AI, KPI_Copilot, KPI_SEC, KPI_Scale, KPI_Data, AIDW_Index and AIDW_ready, Business_Capability, Technical_Capability. Avoid focusing on AIDW_AI_Index, AIDW_DB_Index and AIDW_Inno_Index as seperate area of focus.
+        Keep the language simple avoiding statistics jargon, and focus on clear, simple comparison. E.g. instead of specific percentile, say in top x% performers.
 
-                (Continue until a recommendation is provided for each identified weakness.)
+        First analyze the 3 strongest KPIs (where the partner performs best relative to other partners), then the 3 weakest KPIs (where the partner shows the most room for improvement). For each KPI:
+        - Start with a bolded headline stating the KPI name (use Markdown formatting: **KPI Name - Strong/Weak Performance**)
+        - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
+        - The partner's performance in this KPI relative to other partners
+        - What this performance level means for the partner's business
+        - How this impacts their market position
+        - Specific recommendations for maintaining strength or improving weakness
+        - General maturity level in this area
 
-                ### Recommendations for Opportunities:
+        Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique aspect without repeating the same ideas.
+        Use the following format:
 
-                **Recommendation #1 headline**:  
-                [Paragraph about this recommendation.]
+        ### Top 3 Strongest KPIs:
 
-                **Recommendation #2 headline**:  
-                [Paragraph about this recommendation.]
+        **KPI #1 - Area of Excellence**:  
+        [Paragraph about this KPI's strong performance.]
 
-                (Continue until a recommendation is provided for each identified opportunity.)
+        **KPI #2 - Area of Excellence**:  
+        [Paragraph about this KPI's strong performance.]
 
-                """},
+        **KPI #3 - Area of Excellence**:  
+        [Paragraph about this KPI's strong performance.]
 
-                {"name": "Summary Assessment", "content": """
-                [Response Language: German (just like mentioned in instructions)]                
-                Generate a detailed strategic assessment for the partner regarding its current position and future potential as a partner in the Microsoft ecosystem. The document should be titled as 'Summary of [partner ID]', and discuss the following key elements in precise and formal German language:
-                 
-                 A summary of partner's current performance and positioning, highlighting its strengths and unique differentiators within the market and the Microsoft partner ecosystem.
-                 Five strategic dimensions with separate paragraphs – People, AI, Innovation, Transformation, and Impact (PAITI) – described in detail as a framework for the company's necessary AI transformation. Under each dimension, provide actionable recommendations tailored for achieving leadership and excellence. Include insights on relevant Microsoft programs, technologies, and opportunities to develop competitive advantage.
-                 Performance metrics: Summarize the company's KPIs. Compare these to other partners benchmark and specify areas where the company excels or falls short.
-                 A concluding summary, emphasizing partner's potential to emerge as a leading Microsoft partner in the AI & Cloud space. Include a motivational call to action, supported by previously discussed points, that encourages the company to capitalize on its strengths and actively pursue the outlined recommendations.
-                 
-                 Use clear and concise language with a professional tone. Ensure the text acknowledges partner's current achievements while providing a constructive critique of areas for improvement, backed by data. Close with an optimistic outlook that inspires confidence in partner's future success.
+        ### Top 3 Areas for Improvement:
 
-                 Also, consider the following context (ignore if no bulletpoints below):
-                 -
-                """}
-            ]
-            
-            # Send all messages within the same context
-            # Batch file writing instead of writing after each response
-            responses_buffer = []
-            for prompt in prompts:
-                response = send_message_to_agent(project_client, thread.id, agent_id, prompt['content'])
-                # Add to responses_buffer for backup
-                responses_buffer.append({
-                    "name": prompt['name'],
-                    "content": response.text.value,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                })
-                # Add to conversation history
-                conversation_history.append({
-                    "name": prompt['name'],
-                    "user": prompt['content'],
-                    "assistant": response.text.value
-                })
-
-            # Write all responses at once
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-            # Create output and backup directories
-            output_dir = Path.cwd() / "output"
-            backup_dir = output_dir / "backup"
-            output_dir.mkdir(exist_ok=True)
-            backup_dir.mkdir(exist_ok=True)
-
-            # Create backup file in the backup directory
-            backup_file = backup_dir / f"backup_responses_{partner_id}_{timestamp}.txt"
-            with open(backup_file, "w", encoding='utf-8') as f:
-                for resp in responses_buffer:
-                    f.write(f"\n=== {resp['name']} at {resp['timestamp']} ===\n")
-                    f.write(resp['content'])
-                    f.write("\n\n" + "="*80 + "\n\n")
-            print(f"Response backed up to: {backup_file.absolute()}")
-            
-            # After all responses are collected, save complete conversation to text
-            txt_file = save_conversation_to_text(conversation_history, partner_id)
-            print(f"Complete conversation saved to: {txt_file.resolve()}")
+        **KPI #1 - Development Area**:  
+        [Paragraph about this KPI's weak performance.]
+
+        **KPI #2 - Development Area**:  
+        [Paragraph about this KPI's weak performance.]
+
+        **KPI #3 - Development Area**:  
+        [Paragraph about this KPI's weak performance.]
+        """},
+
+        {"name": "Recommendation Assessment", "depends_on": ["Initial Summary", "Weakness Analysis", "Opportunity Assessment"], "content": """
+        [Response Language: German (just like mentioned in instructions)]                
+        Based on the previous evaluation summary, generate a detailed set of actionable recommendations for the customer. Your recommendations must be divided into two distinct sections:
+
+        1. **Recommendations for Weaknesses**  
+        2. **Recommendations for Opportunities**
+
+        The number of recommendations in each section must directly correspond to the number of weaknesses and opportunities identified in the previous analysis. For example, if five weaknesses were identified, provide five recommendations in the 'Recommendations for Weaknesses' section. If six opportunities were identified, provide six recommendations in the 'Recommendations for Opportunities' section.
+
+        For each recommendation:
+        - Clearly state which specific weakness or opportunity it addresses (or both, if applicable)
+        - Start with a bolded headline naming the recommendation (use Markdown formatting: **Recommendation Name**)
+        - Follow this with a single, well-developed paragraph (5-7 sentences) explaining:
+            - What the recommendation involves
+            - Why it is relevant for the customer, based on the identified weakness or opportunity
+            - How it will help address that weakness or exploit that opportunity
+            - The expected business or customer impact after implementation
+            - Give me estimated effort and time to implement this recommendation in terms of short-term (1 month), mid-term (3-6 months) or long-term (6-12 months) horizon
+            - Give me estimation on how sales relevant this recommendation is, in terms of high, medium or low sales relevance
+
+         
+        Each recommendation must include **at least one specific, concrete suggestion**, such as:
+        - Relevant Microsoft training programs
+        - Microsoft Certification courses
+        - Microsoft Workshops
+        - Microsoft Internal process improvements
+        - Microsoft Strategic initiatives
+
+        You have access to the connected knowledge base of available programs, certificates, and resources, and should suggest the most relevant and up-to-date options in each case.
+
+        Do not use bullet points, line breaks, or numbered lists within paragraphs. Ensure each paragraph covers a unique recommendation without repeating ideas.
+
+        Use the following format:
+
+        ### Recommendations for Weaknesses:
+
+        **Recommendation #1 headline**:  
+        [Paragraph about this recommendation.]
+
+        **Recommendation #2 headline**:  
+        [Paragraph about this recommendation.]
+
+        (Continue until a recommendation is provided for each identified weakness.)
+
+        ### Recommendations for Opportunities:
+
+        **Recommendation #1 headline**:  
+        [Paragraph about this recommendation.]
+
+        **Recommendation #2 headline**:  
+        [Paragraph about this recommendation.]
+
+        (Continue until a recommendation is provided for each identified opportunity.)
+
+        """},
+
+        {"name": "Summary Assessment", "depends_on": ["Initial Summary", "Strength Analysis", "Weakness Analysis", "Opportunity Assessment",
+                                                  "Comparison to other partners", "Recommendation Assessment"], "content": """
+        [Response Language: German (just like mentioned in instructions)]                
+        Generate a detailed strategic assessment for the partner regarding its current position and future potential as a partner in the Microsoft ecosystem. The document should be titled as 'Summary of [partner ID]', and discuss the following key elements in precise and formal German language:
+         
+         A summary of partner's current performance and positioning, highlighting its strengths and unique differentiators within the market and the Microsoft partner ecosystem.
+         Five strategic dimensions with separate paragraphs – People, AI, Innovation, Transformation, and Impact (PAITI) – described in detail as a framework for the company's necessary AI transformation. Under each dimension, provide actionable recommendations tailored for achieving leadership and excellence. Include insights on relevant Microsoft programs, technologies, and opportunities to develop competitive advantage.
+         Performance metrics: Summarize the company's KPIs. Compare these to other partners benchmark and specify areas where the company excels or falls short.
+         A concluding summary, emphasizing partner's potential to emerge as a leading Microsoft partner in the AI & Cloud space. Include a motivational call to action, supported by previously discussed points, that encourages the company to capitalize on its strengths and actively pursue the outlined recommendations.
+         
+         Use clear and concise language with a professional tone. Ensure the text acknowledges partner's current achievements while providing a constructive critique of areas for improvement, backed by data. Close with an optimistic outlook that inspires confidence in partner's future success.
+
+         Also, consider the following context (ignore if no bulletpoints below):
+         -
+        """}
+    ]
+    if compact:
+        for prompt in prompts:
+            prompt['content'] = compact_whitespace(prompt['content'])
+        tokens = f"{sum(estimate_tokens(prompt['content']) for prompt in prompts)} compact"
+        if PROMPT_TOKEN_REPORT:
+            verbose_prompts = build_prompts(partner_id, verbose_summary, False)
+            tokens = f"{sum(estimate_tokens(prompt['content']) for prompt in verbose_prompts)} -> {tokens}"
+        left_out = [f"{summary_info[key]} {label}" for key, label in (("dropped_unanswered", "unanswered"),
+                                                                       ("dropped_near_average", "near-average"))
+                    if summary_info[key]]
+        print(f"Prompt tokens (estimated): {tokens}" + (f", {' and '.join(left_out)} answers left out" if left_out else ""))
+    return prompts
+
+# Function to save the raw agent responses to a backup file
+def save_responses_backup(responses_buffer, partner_id: int) -> Path:
+    """Save the raw agent responses to a backup file in the output/backup directory"""
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+    # Create output and backup directories
+    output_dir = Path.cwd() / "output"
+    backup_dir = output_dir / "backup"
+    output_dir.mkdir(exist_ok=True)
+    backup_dir.mkdir(exist_ok=True)
+
+    # Create backup file in the backup directory
+    backup_file = backup_dir / f"backup_responses_{partner_id}_{timestamp}.txt"
+    with open(backup_file, "w", encoding='utf-8') as f:
+        for resp in responses_buffer:
+            f.write(format_backup_entry(resp['name'], resp['timestamp'], resp['content']))
+    print(f"Response backed up to: {backup_file.absolute()}")
+    return backup_file
+
+# Function to generate the full report of one partner
+def generate_report(project_client, agent_id: str, partner_id: int, thread_id: str = None,
+                    parallel_sections: bool = False, thread_manager: ThreadManager = None,
+                    response_cache: ResponseCache = None, on_section=None, journal: ReportJournal = None) -> Path:
+    """
+    Run all report prompts for a partner, writing every section to the backup and output files as it finishes.
+    Uses the given thread, or a fresh thread from thread_manager when thread_id is None
+    (a temporary ThreadManager is created when none is given).
+    With parallel_sections, independent sections run at the same time on forked threads
+    (see prompt_scheduler.run_prompt_dag) instead of one after another on one thread.
+    With a response_cache, sections whose inputs haven't changed are not sent to the agent again.
+    on_section(name, done, total) is called after every finished section, to report progress.
+    With a journal (see report_journal.ReportJournal), every finished section is journaled and the
+    sections already in it are not sent to the agent again, so a failed report can be resumed.
+    Returns the path of the saved conversation file.
+    """
+    with span("report", partner_id=partner_id, parallel_sections=parallel_sections):
+        # Prepare summary before talking to the agent
+        summary = prepare_partner_summary(partner_id)
+        prompts = build_prompts(partner_id, summary)
+        sections = journal.lookup(response_cache) if journal else response_cache
+
+        writer = ReportWriter(partner_id, [prompt['name'] for prompt in prompts])
+        lock = threading.Lock()
+        finished = []
+
+        def section_done(turn: dict):
+            with lock, span("write_report_files", section=turn['name']):
+                if journal:
+                    journal.add(turn)
+                writer.add(turn)
+                finished.append(turn['name'])
+                count = len(finished)
+            if on_section:
+                on_section(turn['name'], count, len(prompts))
+
+        own_manager = thread_manager is None
+        if own_manager:
+            thread_manager = ThreadManager(project_client)
+        try:
+            if parallel_sections:
+                run_prompt_dag(project_client, agent_id, prompts, send_message_to_agent, thread_manager,
+                               thread_id=thread_id, response_cache=sections, on_section=section_done)
+            else:
+                _run_prompts_serial(project_client, agent_id, prompts, thread_manager, thread_id, sections, section_done)
+        except BaseException:
+            writer.abort()
+            raise
+        finally:
+            if own_manager:
+                thread_manager.close()
+
+        txt_file = writer.close()
+        if journal:
+            journal.finish(txt_file)
+        print(f"Complete conversation saved to: {txt_file.resolve()}")
+        return txt_file
+
+# Function to generate the full report of one partner, streaming the agent output
+def stream_report(project_client, agent_id: str, partner_id: int, thread_id: str = None,
+                  thread_manager: ThreadManager = None):
+    """
+    Run all report prompts for a partner on one thread and yield events while the agent writes:
+    ("section", name) when a section starts, ("delta", text) for each piece of output and
+    ("done", path of the saved conversation file) at the end.
+    Every section is written to the backup and output files as it finishes, like generate_report.
+    """
+    summary = prepare_partner_summary(partner_id)
+    prompts = build_prompts(partner_id, summary)
+    writer = ReportWriter(partner_id, [prompt['name'] for prompt in prompts])
+
+    own_manager = thread_manager is None
+    if own_manager:
+        thread_manager = ThreadManager(project_client)
+    report_thread_id = thread_id or thread_manager.acquire()
+    print(f"Created thread, ID: {report_thread_id}")
+
+    try:
+        for prompt in prompts:
+            yield ("section", prompt['name'])
+            parts = []
+            for delta in stream_message_to_agent(project_client, report_thread_id, agent_id, prompt['content']):
+                parts.append(delta)
+                yield ("delta", delta)
+            with span("write_report_files", partner_id=partner_id, section=prompt['name']):
+                writer.add(_conversation_turn(prompt['name'], prompt['content'], "".join(parts)))
+
+        txt_file = writer.close()
+        print(f"Complete conversation saved to: {txt_file.resolve()}")
+        yield ("done", str(txt_file))
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if not thread_id:
+            thread_manager.release(report_thread_id)
+        if own_manager:
+            thread_manager.close()
+
+# Function to run the report prompts one after another on a single thread
+def _run_prompts_serial(project_client, agent_id: str, prompts: list, thread_manager: ThreadManager,
+                        thread_id: str = None, response_cache: ResponseCache = None, on_section=None) -> list:
+    """
+    Send all prompts in order on one thread, returning the conversation history.
+    With a response_cache, unchanged sections are served from the cache; their content is
+    handed to the agent together with the next section that does need a run.
+    on_section(turn) is called with the conversation turn of every finished section.
+    """
+    # In a conversation every section depends on all sections before it
+    names = [prompt['name'] for prompt in prompts]
+    cache_keys = section_keys(agent_id, prompts, {name: names[:i] for i, name in enumerate(names)})
+
+    conversation_history = []
+    restored = []   # cached sections the thread hasn't seen yet
+    report_thread_id = None
+    try:
+        for prompt in prompts:
+            text = response_cache.get(cache_keys[prompt['name']]) if response_cache else None
+            if text is not None:
+                conversation_history.append(_conversation_turn(prompt['name'], prompt['content'], text,
+                                                               cache_keys[prompt['name']]))
+                restored.append((prompt['name'], text if prompt.get('depends_on') else prompt['content']))
+                if on_section:
+                    on_section(conversation_history[-1])
+                continue
+
+            if report_thread_id is None:
+                if thread_id:
+                    # A thread owned by the caller is used as is and not cleaned up
+                    report_thread_id = project_client.agents.threads.get(thread_id).id
+                else:
+                    report_thread_id = thread_manager.acquire()
+                print(f"Created thread, ID: {report_thread_id}")
+
+            content = inject_dependency_outputs(prompt['content'], restored)
+            restored = []
+            with span("section", section=prompt['name']):
+                response = send_message_to_agent(project_client, report_thread_id, agent_id, content)
+            if response is None:
+                raise RuntimeError(f"No response from agent for section '{prompt['name']}'")
+            if response_cache:
+                response_cache.put(cache_keys[prompt['name']], response.text.value, prompt['name'])
+            conversation_history.append(_conversation_turn(prompt['name'], content, response.text.value,
+                                                           cache_keys[prompt['name']]))
+            if on_section:
+                on_section(conversation_history[-1])
+    finally:
+        if report_thread_id and not thread_id:
+            thread_manager.release(report_thread_id)
+    return conversation_history
+
+def _conversation_turn(name: str, user: str, assistant: str, key: str = None) -> dict:
+    return {
+        "name": name,
+        "user": user,
+        "assistant": assistant,
+        "timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+        "key": key,
+    }
+
+######### Getting the resoponce from the agent and saving it #########
+
+# step before running the code:
+# 1. activate the environment .venv\scripts\activate
+# 2. in powershell run the command: az login     and then, select the subscription you want to use (or press enter to use the default one)
+# 3. set the environment variable AZURE_CONNECTION_STRING with the connection string of your project
+#    i.e. code to run: $env:AZURE_CONNECTION_STRING = "" set here the connection string of your project
+# 4. run the script in powershell: python chat_paiti.py
+# 5. for a batch of partners run: python chat.py --partners all --workers 4   (or e.g. --partners 1,2,5-9)
+
+# Function to parse the command line arguments
+def parse_args(argv=None):
+    """Parse command line arguments for single partner and batch runs"""
+    parser = argparse.ArgumentParser(description="Generate partner analysis reports with the Azure AI agent.")
+    parser.add_argument("--partner", type=int, default=1,
+                        help="Partner ID for a single report (default: 1)")
+    parser.add_argument("--partners",
+                        help="Batch mode: partner IDs as a list or ranges (e.g. '1,2,5-9') or 'all'")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Batch mode: number of partners processed concurrently (default: 4)")
+    parser.add_argument("--parallel-sections", action="store_true",
+                        help="Run independent report sections at the same time on forked threads")
+    parser.add_argument("--reuse-thread", action="store_true",
+                        help="Single report on the long-lived AZURE_THREAD_ID thread instead of a fresh one")
+    parser.add_argument("--thread-cleanup", choices=CLEANUP_MODES, default="delete",
+                        help="What happens to fresh threads after a report: delete (default), archive to output/threads, keep")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't use the agent response cache in output/cache")
+    parser.add_argument("--cache-bypass", action="store_true",
+                        help="Ignore cached responses but refresh the cache with the new ones")
+    parser.add_argument("--compact-prompts", action="store_true",
+                        help="Send compact prompts: question codes with a question catalog, KPI tables, no template indentation")
+    parser.add_argument("--token-budget", type=int,
+                        help="Estimated token budget of the compact summary; low-signal answers are left out first")
+    parser.add_argument("--prompt-tokens", action="store_true",
+                        help="With --compact-prompts, also estimate the tokens of the verbose prompts (builds them once more)")
+    parser.add_argument("--question-catalog", action="store_true",
+                        help="Print the question catalog (e.g. for the agent instructions with QUESTION_CATALOG=instructions) and exit")
+    parser.add_argument("--resume", metavar="RUN",
+                        help="Continue a stopped run (run ID under output/runs): journaled sections and finished partners are skipped")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write the timing spans of the run to FILE as a JSON trace (chrome://tracing format)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global COMPACT_PROMPTS, PROMPT_TOKEN_BUDGET, PROMPT_TOKEN_REPORT
+    args = parse_args(argv)
+    COMPACT_PROMPTS = COMPACT_PROMPTS or args.compact_prompts
+    PROMPT_TOKEN_REPORT = PROMPT_TOKEN_REPORT or args.prompt_tokens
+    if args.token_budget is not None:
+        PROMPT_TOKEN_BUDGET = args.token_budget
+    if args.question_catalog:
+        print(get_prompt_encoder().catalog())
+        return
+    run = None
+    try:
+        # Optionally reload data before processing
+        snapshot = reload_data()     # uncomment this line if you want to reload data from Excel files (e.g. when data is updated). Cuz data is saved in global variables, you can use it without reloading
+        
+        response_cache = None if args.no_cache else ResponseCache(bypass=args.cache_bypass)
+        from batch_reports import parse_partner_ids, run_batch
+
+        # Every run journals its sections in output/runs/<run ID>, so a failed run can be resumed
+        if args.resume:
+            run = ReportRun.open(args.resume)
+            print(f"Resuming run {run.run_id}")
+        else:
+            partner_ids = parse_partner_ids(args.partners, snapshot.kpi_scores_df.index) if args.partners else [args.partner]
+            run = ReportRun.create(partner_ids, args.parallel_sections, batch=bool(args.partners))
+            print(f"Run ID: {run.run_id} (continue it with --resume {run.run_id})")
+        parallel_sections = run.manifest["parallel_sections"]
+
+        if run.manifest["batch"]:
+            # Batch mode reports failures per partner instead of stopping the run
+            result = run_batch(run.partner_ids, max_workers=args.workers, parallel_sections=parallel_sections,
+                               thread_cleanup=args.thread_cleanup, response_cache=response_cache,
+                               trace_file=args.trace, run=run)
+            if result["failed"]:
+                print(f"Continue the run with: python chat.py --resume {run.run_id}")
+                sys.exit(1)
+            return
+
+        partner_id = run.partner_ids[0]
+        journal = run.journal(partner_id)
+        if journal.done:
+            print(f"Run {run.run_id} already finished: {journal.output_file}")
+            return
+        project_client, agent_id = initialize_agent()
+        
+        # All Azure client operations within a single context manager
+        thread_id = os.getenv("AZURE_THREAD_ID") if args.reuse_thread else None
+        with metrics.trace(args.trace) if args.trace else contextlib.nullcontext(), \
+                project_client, ThreadManager(project_client, cleanup=args.thread_cleanup) as thread_manager:
+            generate_report(project_client, agent_id, partner_id, thread_id=thread_id,
+                            parallel_sections=parallel_sections, thread_manager=thread_manager,
+                            response_cache=response_cache, journal=journal)
+        if args.trace:
+            print(f"Timing trace saved to: {args.trace}")
+        if response_cache:
+            print(f"Response cache: {response_cache.stats()}")
             
     except Exception as e:
         print(f"Error: {e}")
+        if run is not None and not run.manifest["batch"]:
+            print(f"Continue the run with: python chat.py --resume {run.run_id}")
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
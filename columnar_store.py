@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Snapshots live next to the CSV: .snapshot/<csv name>.json points to the current snapshot directory
+SNAPSHOT_DIR_NAME = ".snapshot"
+SNAPSHOT_FORMAT = 1
+
+
+# Function to compute the content hash of a file
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to hash every record of a CSV file in one pass over its raw bytes
+def scan_records(csv_path, known=None):
+    """
+    Returns (sha256, header, hashes, fresh): the SHA-256 of the file (same as file_sha256), the
+    header record, a 64-bit hash of every data record in file order and, when known (a set of
+    hashes) is given, the raw bytes of the records whose hash isn't in it as {record number: bytes}.
+    Records keep their line endings; a record continues over line breaks inside quoted fields and
+    blank lines are skipped like pandas does.
+    """
+    digest = hashlib.sha256()
+    header, hashes, fresh = None, [], {}
+
+    def add(record):
+        record_hash = int.from_bytes(hashlib.sha256(record).digest()[:8], "little", signed=True)
+        if known is not None and record_hash not in known:
+            fresh[len(hashes)] = record
+        hashes.append(record_hash)
+
+    record, quotes = b"", 0
+    with open(csv_path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            record = record + line if record else line
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+            if header is None:
+                header = record
+            elif record not in (b"\n", b"\r\n"):
+                add(record)
+            record, quotes = b"", 0
+    if record and header is not None:
+        # Last record with an unterminated quote: kept, so parsing it fails like parsing the file would
+        add(record)
+    return digest.hexdigest(), header or b"", hashes, fresh
+
+# Function to load the record hashes stored with a snapshot
+def load_record_hashes(csv_path, manifest: dict):
+    """The scan_records hashes of the rows of a snapshot, or None for snapshots written without them"""
+    if "records" not in manifest:
+        return None
+    return np.load(Path(csv_path).parent / SNAPSHOT_DIR_NAME / manifest["directory"] / manifest["records"])
+
+def _manifest_path(csv_path: Path) -> Path:
+    return csv_path.parent / SNAPSHOT_DIR_NAME / f"{csv_path.name}.json"
+
+def _read_manifest(csv_path: Path):
+    try:
+        with _manifest_path(csv_path).open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == SNAPSHOT_FORMAT else None
+
+# Function to find a snapshot that matches the current CSV file
+def find_fresh_snapshot(csv_path) -> dict:
+    """
+    Return the manifest of a snapshot built from the current content of csv_path, or None.
+    The file size and mtime are checked first; the content hash is only computed when they differ.
+    """
+    csv_path = Path(csv_path)
+    manifest = _read_manifest(csv_path)
+    if manifest is None or not (csv_path.parent / SNAPSHOT_DIR_NAME / manifest["directory"]).is_dir():
+        return None
+    stat = csv_path.stat()
+    if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+        return manifest
+    if manifest["size"] == stat.st_size and manifest["sha256"] == file_sha256(csv_path):
+        # Same content with a new mtime (e.g. copied on deploy): remember the new mtime
+        manifest["mtime_ns"] = stat.st_mtime_ns
+        _write_json(_manifest_path(csv_path), manifest)
+        return manifest
+    return None
+
+def _write_json(path: Path, data: dict):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# Function to build a columnar snapshot of a CSV file
+def build_snapshot(csv_path, df: pd.DataFrame = None) -> dict:
+    """
+    Write a typed columnar snapshot of csv_path: one .npy file per column plus a schema.
+    Numeric columns are stored as they are; text columns are stored as int32 category codes
+    with the categories in the schema, so repeated question texts are stored once.
+    Returns the new manifest.
+    """
+    csv_path = Path(csv_path)
+    if df is None:
+        df = pd.read_csv(csv_path)
+    stat = csv_path.stat()
+    sha256, _, hashes, _ = scan_records(csv_path)
+
+    root = csv_path.parent / SNAPSHOT_DIR_NAME
+    # Every content version gets its own directory, so a memory-mapped older snapshot is never overwritten
+    directory = f"{csv_path.stem}-{sha256[:16]}"
+    snapshot_dir = root / directory
+    tmp_dir = root / f"{directory}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        file_name = f"{i}.npy"
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            np.save(tmp_dir / file_name, series.to_numpy())
+            columns.append({"name": name, "kind": "numeric", "file": file_name})
+        else:
+            codes, categories = pd.factorize(series, use_na_sentinel=True)
+            np.save(tmp_dir / file_name, codes.astype(np.int32))
+            columns.append({"name": name, "kind": "category", "file": file_name,
+                            "categories": [str(category) for category in categories]})
+
+    schema = {"rows": len(df), "columns": columns}
+    _write_json(tmp_dir / "schema.json", schema)
+    # Hashes of the raw records, so a reload can find the rows that changed without parsing the file
+    if len(hashes) == len(df):
+        np.save(tmp_dir / "records.npy", np.array(hashes, dtype=np.int64))
+    if snapshot_dir.exists():
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(tmp_dir, snapshot_dir)
+
+    manifest = {"format": SNAPSHOT_FORMAT, "source": csv_path.name, "directory": directory,
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    if len(hashes) == len(df):
+        manifest["records"] = "records.npy"
+    _write_json(_manifest_path(csv_path), manifest)
+    _remove_old_snapshots(root, csv_path.stem, keep=directory)
+    return manifest
+
+def _remove_old_snapshots(root: Path, stem: str, keep: str):
+    """Best-effort removal of older snapshot directories (they may still be mapped, e.g. on Windows)"""
+    for path in root.glob(f"{stem}-*"):
+        if path.is_dir() and path.name != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+# Function to load a snapshot as a DataFrame
+def load_snapshot(csv_path, manifest: dict) -> pd.DataFrame:
+    """Load a snapshot with memory-mapped numeric columns and categorical text columns"""
+    snapshot_dir = Path(csv_path).parent / SNAPSHOT_DIR_NAME / manifest["directory"]
+    with (snapshot_dir / "schema.json").open("r", encoding="utf-8") as f:
+        schema = json.load(f)
+
+    data = {}
+    for column in schema["columns"]:
+        values = np.load(snapshot_dir / column["file"], mmap_mode="r")
+        if column["kind"] == "category":
+            data[column["name"]] = pd.Categorical.from_codes(np.asarray(values), categories=column["categories"])
+        else:
+            data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+# Function to load the dataset, using the columnar snapshot whenever it is up to date
+def load_dataset(csv_path) -> pd.DataFrame:
+    """
+    Load csv_path through its columnar snapshot, building the snapshot first when it is missing
+    or stale. Falls back to parsing the CSV when the snapshot can't be written (read-only deploys).
+    """
+    return load_dataset_with_manifest(csv_path)[0]
+
+# Function to load the dataset together with the manifest describing its content
+def load_dataset_with_manifest(csv_path):
+    """Like load_dataset, but returns (df, manifest); the manifest is None when the CSV was parsed directly"""
+    csv_path = Path(csv_path)
+    manifest = find_fresh_snapshot(csv_path)
+    if manifest is not None:
+        return load_snapshot(csv_path, manifest), manifest
+
+    df = pd.read_csv(csv_path)
+    try:
+        manifest = build_snapshot(csv_path, df)
+    except OSError as e:
+        print(f"Could not write dataset snapshot: {e}")
+        return df, None
+    # Load what was just written, so callers always get the same column types
+    return load_snapshot(csv_path, manifest), manifest
@@ -0,0 +1,308 @@
+import hashlib
+import itertools
+import random
+import threading
+import time
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+
+# Rough characters per token of the fake token usage
+CHARS_PER_TOKEN = 4
+
+
+# Function to parse a latency distribution like "lognormal:2.0:0.5"
+def latency_distribution(spec: str):
+    """
+    Turn a latency specification into a function rng -> seconds. Specifications:
+    fixed:S, uniform:LOW:HIGH, normal:MEAN:STD (clipped at 0), lognormal:MEDIAN:SIGMA.
+    """
+    kind, *params = spec.split(":")
+    params = [float(param) for param in params]
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if kind == "lognormal" and len(params) == 2:
+        return lambda rng: params[0] * rng.lognormvariate(0.0, params[1])
+    raise ValueError(f"Invalid latency distribution {spec!r} (fixed:S, uniform:LOW:HIGH, normal:MEAN:STD or lognormal:MEDIAN:SIGMA)")
+
+# Function to write the deterministic canned answer to a prompt
+def canned_response(content: str) -> str:
+    """The same prompt always gets the same answer, so reports and cache keys are reproducible"""
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    headline = content.strip().splitlines()[0][:60] if content.strip() else "empty prompt"
+    return (f"**Fake analysis {digest[:8]}**:  \n"
+            f"Canned response to '{headline}'. "
+            f"This text stands in for the agent output ({len(content)} characters of prompt, digest {digest[8:24]}).")
+
+
+# Objects shaped like the azure.ai.agents models the report pipeline reads
+class _Text:
+    def __init__(self, value: str):
+        self.text = type("TextValue", (), {"value": value})()
+
+class FakeMessage:
+    def __init__(self, message_id: str, thread_id: str, role: str, content: str, run_id: str = None):
+        self.id = message_id
+        self.thread_id = thread_id
+        self.role = role
+        self.run_id = run_id
+        self.text_messages = [_Text(content)]
+
+class FakeThread:
+    def __init__(self, thread_id: str):
+        self.id = thread_id
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+class FakeRun:
+    def __init__(self, run_id: str, thread_id: str, status: str, last_error: dict = None, usage: FakeUsage = None):
+        self.id = run_id
+        self.thread_id = thread_id
+        self.status = status
+        self.last_error = last_error
+        self.usage = usage
+
+
+# In-process stand-in for AIProjectClient
+class FakeProjectClient:
+    """
+    Implements the part of AIProjectClient.agents the report pipeline uses (threads.create/get/delete,
+    messages.create/list, runs.create_and_process and runs.stream) without a network connection.
+    Every run sleeps for a latency drawn from the configured distribution (times time_scale) and
+    answers with canned_response. Runs fail with failure_rate, are throttled (status failed,
+    code rate_limit_exceeded) with throttle_rate or when more than max_concurrent_runs are in progress,
+    and messages.create raises HTTP 429 with http_throttle_rate.
+    Outcomes are drawn from a generator seeded with the seed, the prompt and the attempt number, so
+    a scenario replays the same way whatever the thread scheduling.
+    """
+
+    def __init__(self, latency: str = "lognormal:2.0:0.5", failure_rate: float = 0.0, throttle_rate: float = 0.0,
+                 http_throttle_rate: float = 0.0, max_concurrent_runs: int = None, time_scale: float = 1.0,
+                 seed: int = 0, responder=canned_response):
+        self.latency = latency_distribution(latency)
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.http_throttle_rate = http_throttle_rate
+        self.max_concurrent_runs = max_concurrent_runs
+        self.time_scale = time_scale
+        self.seed = seed
+        self.responder = responder
+        self.agents = _FakeAgents(self)
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = {}   # thread ID -> list of FakeMessage
+        self._attempts = {}   # prompt digest -> attempts so far
+        self._running = 0
+        self.runs = []   # (seconds, status, error code) of every run, in completion order
+        self.stats = {"messages": 0, "runs": 0, "completed": 0, "failed": 0, "throttled": 0, "http_throttled": 0}
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_fake{next(self._ids):06d}"
+
+    def _rng(self, kind: str, content: str) -> random.Random:
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._attempts.get((kind, digest), 0)
+            self._attempts[(kind, digest)] = attempt + 1
+        return random.Random(f"{self.seed}:{kind}:{digest}:{attempt}")
+
+    def _messages(self, thread_id: str) -> list:
+        try:
+            return self._threads[thread_id]
+        except KeyError:
+            raise ResourceNotFoundError(f"No thread found with id '{thread_id}'.") from None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _FakeAgents:
+    def __init__(self, client: FakeProjectClient):
+        self.threads = _FakeThreads(client)
+        self.messages = _FakeMessages(client)
+        self.runs = _FakeRuns(client)
+
+
+class _FakeThreads:
+    def __init__(self, client: FakeProjectClient):
+        self._client = client
+
+    def create(self, messages: list = None) -> FakeThread:
+        client = self._client
+        with client._lock:
+            thread_id = client._new_id("thread")
+            client._threads[thread_id] = [
+                FakeMessage(client._new_id("msg"), thread_id, message["role"], message["content"])
+                for message in (messages or [])
+            ]
+        return FakeThread(thread_id)
+
+    def get(self, thread_id: str) -> FakeThread:
+        with self._client._lock:
+            self._client._messages(thread_id)
+        return FakeThread(thread_id)
+
+    def delete(self, thread_id: str):
+        with self._client._lock:
+            self._client._messages(thread_id)
+            del self._client._threads[thread_id]
+
+
+class _FakeMessages:
+    def __init__(self, client: FakeProjectClient):
+        self._client = client
+
+    def create(self, thread_id: str, role: str, content: str) -> FakeMessage:
+        client = self._client
+        if client.http_throttle_rate and client._rng("message", content).random() < client.http_throttle_rate:
+            with client._lock:
+                client.stats["http_throttled"] += 1
+            error = HttpResponseError(message="(429) Rate limit is exceeded. Try again in 1 seconds.")
+            error.status_code, error.reason = 429, "Too Many Requests"
+            raise error
+        with client._lock:
+            message = FakeMessage(client._new_id("msg"), thread_id, role, content)
+            client._messages(thread_id).append(message)
+            client.stats["messages"] += 1
+        return message
+
+    def list(self, thread_id: str, run_id: str = None, order: str = "desc", **kwargs) -> list:
+        with self._client._lock:
+            messages = [message for message in self._client._messages(thread_id)
+                        if run_id is None or message.run_id == run_id]
+        return messages[::-1] if order == "desc" else messages
+
+
+class _FakeRuns:
+    def __init__(self, client: FakeProjectClient):
+        self._client = client
+
+    def _start(self, thread_id: str):
+        """Register a run on the thread and draw its latency and outcome: (prompt, run ID, seconds, error)"""
+        client = self._client
+        with client._lock:
+            messages = client._messages(thread_id)
+            prompt = messages[-1].text_messages[0].text.value if messages else ""
+            run_id = client._new_id("run")
+            client._running += 1
+            client.stats["runs"] += 1
+            overloaded = client.max_concurrent_runs is not None and client._running > client.max_concurrent_runs
+        rng = client._rng("run", prompt)
+        seconds = client.latency(rng) * client.time_scale
+        if overloaded or rng.random() < client.throttle_rate:
+            error = {"code": "rate_limit_exceeded", "message": "Rate limit is exceeded. Try again in 1 seconds."}
+        elif rng.random() < client.failure_rate:
+            error = {"code": "server_error", "message": "Sorry, something went wrong."}
+        else:
+            error = None
+        return prompt, run_id, seconds, error
+
+    def _finish(self, thread_id: str, run_id: str, prompt: str, started: float, error: dict):
+        """Record the outcome of a run (and its response message when it completed); returns the usage"""
+        client = self._client
+        usage = None
+        with client._lock:
+            if error is None:
+                response = client.responder(prompt)
+                client._messages(thread_id).append(
+                    FakeMessage(client._new_id("msg"), thread_id, "assistant", response, run_id))
+                client.stats["completed"] += 1
+                # Like the service, the prompt tokens cover the whole thread the run read
+                thread_chars = sum(len(message.text_messages[0].text.value) for message in client._messages(thread_id))
+                usage = FakeUsage((thread_chars - len(response)) // CHARS_PER_TOKEN, len(response) // CHARS_PER_TOKEN)
+            else:
+                client.stats["throttled" if error["code"] == "rate_limit_exceeded" else "failed"] += 1
+            client.runs.append((time.perf_counter() - started, "completed" if error is None else "failed",
+                                error and error["code"]))
+            client._running -= 1
+        return usage
+
+    def create_and_process(self, thread_id: str, agent_id: str, **kwargs) -> FakeRun:
+        started = time.perf_counter()
+        prompt, run_id, seconds, error = self._start(thread_id)
+        try:
+            time.sleep(seconds)
+        finally:
+            usage = self._finish(thread_id, run_id, prompt, started, error)
+        return FakeRun(run_id, thread_id, "completed" if error is None else "failed", error, usage)
+
+    def stream(self, thread_id: str, agent_id: str, **kwargs) -> "FakeRunStream":
+        return FakeRunStream(self, thread_id, agent_id)
+
+
+# Streamed run, iterated like the SDK's run stream as (event type, event data, None) tuples
+class FakeRunStream:
+    """
+    Context manager yielding the canned response as message delta events, spread over the run
+    latency, then thread.run.completed and done. Throttled runs fail before any output, other
+    failures half way through the response (like a service error mid-stream), with the same
+    outcome as create_and_process would have for the prompt and attempt.
+    """
+
+    # Words per message delta
+    WORDS_PER_DELTA = 8
+
+    def __init__(self, runs: _FakeRuns, thread_id: str, agent_id: str):
+        self._runs = runs
+        self.thread_id = thread_id
+        self.agent_id = agent_id
+        self._started = time.perf_counter()
+        self._prompt, self.run_id, self._seconds, self._error = runs._start(thread_id)
+        self._finished = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if not self._finished:
+            self._finished = True
+            self._runs._finish(self.thread_id, self.run_id, self._prompt, self._started, self._error)
+
+    def __iter__(self):
+        # The SDK models are only needed (and imported) when a report is streamed
+        from azure.ai.agents.models import (AgentStreamEvent, MessageDelta, MessageDeltaChunk, MessageDeltaTextContent,
+                                            MessageDeltaTextContentObject, RunError, ThreadRun)
+
+        def run_event(status: str):
+            last_error = RunError(**self._error) if self._error else None
+            return ThreadRun(id=self.run_id, thread_id=self.thread_id, agent_id=self.agent_id,
+                             status=status, last_error=last_error)
+
+        words = self._runs._client.responder(self._prompt).split(" ")
+        chunks = [" ".join(words[i:i + self.WORDS_PER_DELTA]) + (" " if i + self.WORDS_PER_DELTA < len(words) else "")
+                  for i in range(0, len(words), self.WORDS_PER_DELTA)]
+        if self._error is not None:
+            # Throttled runs fail before the first token, other failures half way through
+            chunks = [] if self._error["code"] == "rate_limit_exceeded" else chunks[:len(chunks) // 2]
+        yield AgentStreamEvent.THREAD_RUN_CREATED, run_event("queued"), None
+        pause = self._seconds / max(1, len(chunks))
+        for chunk in chunks:
+            time.sleep(pause)
+            delta = MessageDelta(role="assistant", content=[
+                MessageDeltaTextContent(index=0, text=MessageDeltaTextContentObject(value=chunk))])
+            yield AgentStreamEvent.THREAD_MESSAGE_DELTA, MessageDeltaChunk(id=f"{self.run_id}_msg", delta=delta), None
+        if not chunks:
+            time.sleep(self._seconds)
+        self.close()
+        if self._error is not None:
+            yield AgentStreamEvent.THREAD_RUN_FAILED, run_event("failed"), None
+        else:
+            yield AgentStreamEvent.THREAD_RUN_COMPLETED, run_event("completed"), None
+        yield AgentStreamEvent.DONE, "[DONE]", None
@@ -2,13 +2,20 @@ import azure.functions as func
 import logging
 import pandas as pd
 import json
-from chat import prepare_partner_summary, prepare_comparison_stats, reload_data
+from chat import (prepare_partner_summary, prepare_comparison_stats, prepare_summary_record, prepare_comparison_record,
+                  reload_data, get_snapshot)
+from segments import SEGMENTS
+from metrics import render_prometheus
+from batch_reports import parse_partner_ids
+import report_jobs
+import http_cache
+from scoring import DerivedKPIMismatchError
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
 # Load sample data
 sample_csv_path = "final_merged_with_questions.csv"
-reload_data()  # Ensure data is loaded from chat.py
+# Data is loaded once when chat.py is imported (from the columnar snapshot when it is up to date)
 
 @app.route(route="test", methods=["GET"])
 def test_function(req: func.HttpRequest) -> func.HttpResponse:
@@ -21,17 +28,58 @@ def test_function(req: func.HttpRequest) -> func.HttpResponse:
         mimetype="application/json"
     )
 
+def _data_response(req: func.HttpRequest, route: str, partner_id: int, variant: tuple, render_text, render_json,
+                   validate=None) -> func.HttpResponse:
+    """
+    Response of a data route, as text or JSON (?format=json or Accept: application/json), with an
+    ETag of the data version: a matching If-None-Match is answered with 304 before anything is
+    rendered, other requests are served from the rendered response cache (see http_cache.py) and
+    compressed when the client accepts gzip or deflate.
+    The partner (and whatever validate(snapshot) checks) must exist before If-None-Match is
+    looked at, so an unknown partner is a 404 even for If-None-Match: *.
+    """
+    output = req.params.get("format") or ("json" if "application/json" in req.headers.get("Accept", "") else "text")
+    if output not in ("text", "json"):
+        raise ValueError("format must be text or json")
+    snapshot = get_snapshot()
+    if partner_id not in snapshot.partner_store:
+        raise ValueError(f"Partner ID {partner_id} not found in KPI scores.")
+    if validate is not None:
+        validate(snapshot)
+    variant = tuple(variant) + (output,)
+    encoding = http_cache.choose_encoding(req.headers.get("Accept-Encoding"))
+    version = snapshot.content_version
+    cache = http_cache.get_response_cache()
+    headers = {
+        "ETag": cache.etag(version, route, partner_id, variant, encoding),
+        "Cache-Control": http_cache.cache_control(),
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if http_cache.etag_matches(req.headers.get("If-None-Match"), headers["ETag"]):
+        cache.count_not_modified()
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    if output == "json":
+        response = cache.get_or_render(version, route, partner_id, variant, lambda: json.dumps(render_json()), "application/json")
+    else:
+        response = cache.get_or_render(version, route, partner_id, variant, render_text, "text/plain")
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return func.HttpResponse(
+        response.encoded(encoding),
+        status_code=200,
+        headers=headers,
+        mimetype=response.mimetype
+    )
+
 @app.route(route="summary/{partner_id}", methods=["GET"])
 def get_summary(req: func.HttpRequest, partner_id: int) -> func.HttpResponse:
-    """Generate a summary for a specific partner ID."""
+    """Generate a summary for a specific partner ID (?format=json for the summary as JSON)."""
     try:
         partner_id = int(partner_id)
-        summary = prepare_partner_summary(partner_id)
-        return func.HttpResponse(
-            summary,
-            status_code=200,
-            mimetype="text/plain"
-        )
+        return _data_response(req, "summary", partner_id, (),
+                              lambda: prepare_partner_summary(partner_id),
+                              lambda: prepare_summary_record(partner_id))
     except ValueError as e:
         logging.error(f"Error generating summary: {e}")
         return func.HttpResponse(str(e), status_code=404)
@@ -41,15 +89,15 @@ def get_summary(req: func.HttpRequest, partner_id: int) -> func.HttpResponse:
 
 @app.route(route="compare/{partner_id}", methods=["GET"])
 def compare_partner(req: func.HttpRequest, partner_id: int) -> func.HttpResponse:
-    """Provide comparison statistics for a specific partner ID."""
+    """Provide comparison statistics for a specific partner ID (?segment= to compare within the partner's segment group, ?format=json for JSON)."""
     try:
         partner_id = int(partner_id)
-        comparison_stats = prepare_comparison_stats(partner_id)
-        return func.HttpResponse(
-            comparison_stats,
-            status_code=200,
-            mimetype="text/plain"
-        )
+        segment = req.params.get("segment")
+        return _data_response(req, "compare", partner_id, (segment,),
+                              lambda: prepare_comparison_stats(partner_id, segment),
+                              lambda: prepare_comparison_record(partner_id, segment),
+                              # Unknown segments, and partners outside every group of the segment
+                              lambda snapshot: segment and snapshot.segment_cube.partner_groups(segment, [partner_id]))
     except ValueError as e:
         logging.error(f"Error generating comparison: {e}")
         return func.HttpResponse(str(e), status_code=404)
@@ -57,25 +105,171 @@ def compare_partner(req: func.HttpRequest, partner_id: int) -> func.HttpResponse
         logging.error(f"Error generating comparison: {e}")
         return func.HttpResponse("Error generating comparison.", status_code=500)
 
+@app.route(route="peers/{partner_id}", methods=["GET"])
+def get_peers(req: func.HttpRequest, partner_id: int) -> func.HttpResponse:
+    """List the most similar partners by KPI profile (?k=10, ?metric=euclidean|cosine)."""
+    try:
+        partner_id = int(partner_id)
+        k = int(req.params.get("k", 10))
+        metric = req.params.get("metric", "euclidean")
+        peers = get_snapshot().peer_index.nearest(partner_id, k, metric)
+        return func.HttpResponse(
+            json.dumps({
+                "partner_id": partner_id,
+                "metric": metric,
+                "peers": [{"partner_id": peer_id, "distance": round(distance, 4)} for peer_id, distance in peers]
+            }),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except ValueError as e:
+        logging.error(f"Error finding peers: {e}")
+        return func.HttpResponse(str(e), status_code=404)
+    except Exception as e:
+        logging.error(f"Error finding peers: {e}")
+        return func.HttpResponse("Error finding peers.", status_code=500)
+
+@app.route(route="rankings/{kpi}", methods=["GET"])
+def get_rankings(req: func.HttpRequest, kpi: str) -> func.HttpResponse:
+    """Page through the partners ranked by a KPI (?order=top|bottom, ?limit=20, ?offset=0, or ?min_percentile=&max_percentile=)."""
+    try:
+        limit = int(req.params.get("limit", 20))
+        offset = int(req.params.get("offset", 0))
+        rank_matrix = get_snapshot().rank_matrix
+        min_percentile = req.params.get("min_percentile")
+        max_percentile = req.params.get("max_percentile")
+        if min_percentile is not None or max_percentile is not None:
+            rankings = rank_matrix.percentile_range(kpi, float(min_percentile or 0), float(max_percentile or 100), limit, offset)
+        else:
+            order = req.params.get("order", "top")
+            if order not in ("top", "bottom"):
+                raise ValueError("order must be top or bottom")
+            rankings = rank_matrix.top(kpi, limit, offset, bottom=order == "bottom")
+        return func.HttpResponse(
+            json.dumps(rankings),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except ValueError as e:
+        logging.error(f"Error generating rankings: {e}")
+        return func.HttpResponse(str(e), status_code=404)
+    except Exception as e:
+        logging.error(f"Error generating rankings: {e}")
+        return func.HttpResponse("Error generating rankings.", status_code=500)
+
+def _job_response(job: dict, coalesced: bool = None) -> dict:
+    response = dict(job, status_url=f"/api/report/jobs/{job['job_id']}")
+    if coalesced is not None:
+        response["coalesced"] = coalesced
+    return response
+
+@app.route(route="report/{partner_id}", methods=["POST"])
+def queue_report(req: func.HttpRequest, partner_id: int) -> func.HttpResponse:
+    """Queue a report job for a partner and return its job ID right away (?force=true to not reuse an existing job)."""
+    try:
+        partner_id = int(partner_id)
+        force = req.params.get("force", "").lower() in ("1", "true", "yes")
+        [(job, coalesced)] = report_jobs.submit_reports([partner_id], force)
+        return func.HttpResponse(
+            json.dumps(_job_response(job, coalesced)),
+            status_code=202,
+            mimetype="application/json"
+        )
+    except ValueError as e:
+        logging.error(f"Error queueing report: {e}")
+        return func.HttpResponse(str(e), status_code=404)
+    except Exception as e:
+        logging.error(f"Error queueing report: {e}")
+        return func.HttpResponse("Error queueing report.", status_code=500)
+
+@app.route(route="report", methods=["POST"])
+def queue_reports(req: func.HttpRequest) -> func.HttpResponse:
+    """Queue report jobs for many partners, given as a JSON body {"partners": "1,2,5-9" | "all" | [1, 2]}."""
+    try:
+        body = req.get_json()
+        spec = body.get("partners") if isinstance(body, dict) else None
+        if not spec:
+            raise TypeError
+    except (ValueError, TypeError):
+        return func.HttpResponse('Expected a JSON body like {"partners": "1,2,5-9"}.', status_code=400)
+    try:
+        force = req.params.get("force", "").lower() in ("1", "true", "yes")
+        partner_ids = parse_partner_ids(spec, get_snapshot().kpi_scores_df.index)
+        submitted = report_jobs.submit_reports(partner_ids, force)
+        return func.HttpResponse(
+            json.dumps({
+                "queued": sum(not coalesced for _, coalesced in submitted),
+                "coalesced": sum(coalesced for _, coalesced in submitted),
+                "jobs": [_job_response(job, coalesced) for job, coalesced in submitted]
+            }),
+            status_code=202,
+            mimetype="application/json"
+        )
+    except ValueError as e:
+        logging.error(f"Error queueing reports: {e}")
+        return func.HttpResponse(str(e), status_code=404)
+    except Exception as e:
+        logging.error(f"Error queueing reports: {e}")
+        return func.HttpResponse("Error queueing reports.", status_code=500)
+
+@app.route(route="report/jobs/{job_id}", methods=["GET"])
+def get_report_job(req: func.HttpRequest, job_id: str) -> func.HttpResponse:
+    """Status, per-section progress and (once it succeeded) the report text of a report job."""
+    try:
+        job = report_jobs.get_queue().get(job_id)
+        if job is None:
+            raise ValueError(f"Report job {job_id} not found")
+        return func.HttpResponse(
+            json.dumps(_job_response(job)),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except ValueError as e:
+        logging.error(f"Error getting report job: {e}")
+        return func.HttpResponse(str(e), status_code=404)
+    except Exception as e:
+        logging.error(f"Error getting report job: {e}")
+        return func.HttpResponse("Error getting report job.", status_code=500)
+
 @app.route(route="reload", methods=["POST"])
 def reload_data_route(req: func.HttpRequest) -> func.HttpResponse:
-    """Reload the sample CSV data."""
+    """Reload the sample CSV data (?derive_kpis=true|false to compute the KPI scores from the answers)."""
     try:
-        reload_data()
-        return func.HttpResponse("Data reloaded successfully.", status_code=200)
+        derive_kpis = req.params.get("derive_kpis")
+        snapshot = reload_data(None if derive_kpis is None else derive_kpis.lower() in ("1", "true", "yes"))
+        return func.HttpResponse(f"Data reloaded successfully (version {snapshot.version}).", status_code=200)
+    except DerivedKPIMismatchError as e:
+        # The weight table doesn't reproduce the dataset scores; the current data stays in place
+        logging.error(f"Error reloading data: {e}")
+        return func.HttpResponse(str(e), status_code=409)
     except Exception as e:
         logging.error(f"Error reloading data: {e}")
         return func.HttpResponse("Error reloading data.", status_code=500)
 
+@app.route(route="metrics", methods=["GET"])
+def get_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Expose the stage timing histograms and counters in the Prometheus text format."""
+    return func.HttpResponse(
+        render_prometheus(),
+        status_code=200,
+        mimetype="text/plain; version=0.0.4"
+    )
+
 @app.route(route="docs", methods=["GET"])
 def docs(req: func.HttpRequest) -> func.HttpResponse:
     """Provide documentation for the available routes."""
     docs_info = {
         "routes": [
             {"route": "/test", "method": "GET", "description": "Test the function with sample data."},
-            {"route": "/summary/{partner_id}", "method": "GET", "description": "Generate a summary for a specific partner ID."},
-            {"route": "/compare/{partner_id}", "method": "GET", "description": "Provide comparison statistics for a specific partner ID."},
-            {"route": "/reload", "method": "POST", "description": "Reload the sample CSV data."},
+            {"route": "/summary/{partner_id}", "method": "GET", "description": "Generate a summary for a specific partner ID. Optional query parameter: format=text|json (or Accept: application/json). Responses carry an ETag of the data version (send it as If-None-Match to get 304 Not Modified) and are gzip or deflate compressed when the client accepts it."},
+            {"route": "/compare/{partner_id}", "method": "GET", "description": "Provide comparison statistics for a specific partner ID. Optional query parameter: segment=" + "|".join(SEGMENTS) + " to compare within the partner's segment group, format=text|json (or Accept: application/json). ETags, 304 Not Modified and compression as for /summary."},
+            {"route": "/peers/{partner_id}", "method": "GET", "description": "List the most similar partners by KPI profile. Optional query parameters: k (default 10) and metric=euclidean|cosine."},
+            {"route": "/rankings/{kpi}", "method": "GET", "description": "Page through the partners ranked by a KPI. Optional query parameters: order=top|bottom, limit (default 20, at most 1000), offset (default 0), or min_percentile and max_percentile to list the partners within a percentile range."},
+            {"route": "/report/{partner_id}", "method": "POST", "description": "Queue a report job for a partner and return its job ID (202). A queued, running or finished job for the same partner and data version is returned instead of a new one. Optional query parameter: force=true to always queue a new job."},
+            {"route": "/report", "method": "POST", "description": "Queue report jobs for many partners. JSON body: {\"partners\": \"1,2,5-9\"}, \"all\" or a list of partner IDs. Optional query parameter: force=true."},
+            {"route": "/report/jobs/{job_id}", "method": "GET", "description": "Status (queued, running, succeeded, failed), per-section progress and, once it succeeded, the report text of a report job."},
+            {"route": "/reload", "method": "POST", "description": "Reload the sample CSV data. Optional query parameter: derive_kpis=true|false to compute the KPI scores from the answers (409 when the computed scores differ from the KPI columns of the CSV, see DERIVED_KPI_CHECK)."},
+            {"route": "/metrics", "method": "GET", "description": "Expose the stage timing histograms and counters in the Prometheus text format."},
             {"route": "/docs", "method": "GET", "description": "Provide documentation for the available routes."}
         ]
     }
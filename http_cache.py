@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+# Seconds clients and proxies may use a response without asking again; 0 means they revalidate
+# every time (cheap: an unchanged response is answered with 304 Not Modified)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+# Rendered responses kept in memory
+HTTP_CACHE_ENTRIES = int(os.getenv("HTTP_CACHE_ENTRIES", "2048"))
+
+# Content codings we compress with, preferred in this order when the client accepts them equally.
+# The output is deterministic (no gzip timestamp), so every host sends the same bytes for an ETag.
+ENCODINGS = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+    "deflate": lambda body: zlib.compress(body, 6),
+}
+
+
+# Function to pick the response encoding from an Accept-Encoding header
+def choose_encoding(accept_encoding: str):
+    """The supported coding with the highest q-value (gzip on a tie), or None to send the body as is"""
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    best, best_weight = None, 0.0
+    for coding in ENCODINGS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+# Function to check an If-None-Match header against the current ETag
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Weak comparison as HTTP requires for If-None-Match (a W/ prefix added by a proxy still matches).
+    "*" matches any current representation, so callers check that the resource exists first.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+# Function to get the Cache-Control header of the data routes
+def cache_control(max_age: int = None) -> str:
+    max_age = HTTP_CACHE_MAX_AGE if max_age is None else max_age
+    return f"public, max-age={max_age}, must-revalidate" if max_age > 0 else "no-cache"
+
+
+# One rendered response body, with its compressed variants made on first use
+class RenderedResponse:
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self._encoded = {}
+
+    def encoded(self, encoding: str = None) -> bytes:
+        if encoding is None:
+            return self.body
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = ENCODINGS[encoding](self.body)
+        return body
+
+    def nbytes(self) -> int:
+        return len(self.body) + sum(len(body) for body in self._encoded.values())
+
+
+# In-process cache of rendered route responses for the current data version
+class RenderedResponseCache:
+    """
+    LRU cache of rendered response bodies, keyed by route, partner ID and variant (query parameters
+    and output format). Every entry belongs to one data version (DatasetSnapshot.content_version):
+    the first lookup after reload_data() swapped in different data empties the cache.
+    The ETag of a response is derived from the same version, so it can be checked (and answered with
+    304 Not Modified) before anything is rendered.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = HTTP_CACHE_ENTRIES if max_entries is None else max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(version: str, route: str, partner_id, variant: tuple = (), encoding: str = None) -> str:
+        """Strong ETag of one response representation; compressed representations get their own"""
+        digest = hashlib.sha256(repr((route, partner_id, tuple(variant))).encode("utf-8")).hexdigest()[:8]
+        suffix = f"-{encoding}" if encoding else ""
+        return f'"{route}-{partner_id}-{version}-{digest}{suffix}"'
+
+    def get_or_render(self, version: str, route: str, partner_id, variant: tuple, render, mimetype: str) -> RenderedResponse:
+        """The cached response, or render() (str or bytes) cached as a new one"""
+        key = (route, partner_id, tuple(variant))
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            self.misses += 1
+
+        body = render()
+        response = RenderedResponse(body.encode("utf-8") if isinstance(body, str) else body, mimetype)
+        with self._lock:
+            if version == self.version:
+                self._entries[key] = response
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return response
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.version = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": sum(response.nbytes() for response in self._entries.values()),
+                    "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+    def samples(self) -> list:
+        """(name, type, help, value) samples for the Prometheus /metrics output"""
+        stats = self.stats()
+        return [
+            ("http_response_cache_entries", "gauge", "Rendered responses in the in-process cache.", stats["entries"]),
+            ("http_response_cache_bytes", "gauge", "Bytes of the cached responses, compressed variants included.", stats["bytes"]),
+            ("http_response_cache_hits_total", "counter", "Responses served from the in-process cache.", stats["hits"]),
+            ("http_response_cache_misses_total", "counter", "Responses rendered because they were not cached.", stats["misses"]),
+            ("http_not_modified_total", "counter", "Requests answered with 304 Not Modified.", stats["not_modified"]),
+        ]
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+# Function to get the process-wide rendered response cache
+def get_response_cache() -> RenderedResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = RenderedResponseCache()
+    return _response_cache
+
+
+metrics.register_collector(lambda: get_response_cache().samples())
@@ -0,0 +1,314 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from columnar_store import SNAPSHOT_DIR_NAME, load_dataset, scan_records
+from dataset_snapshot import kpi_columns
+from json_to_csv import filter_record, iter_json_records
+from scoring import DERIVED_KPI_CHECK, WEIGHTS_FILE, DerivedKPIMismatchError, check_derived_kpis, compute_kpi_scores
+
+DATA_FILE = "final_merged_with_questions.csv"
+MANIFEST_FORMAT = 1
+
+
+# Function to map raw export fields to the columns of the merged dataset
+def field_mapping(columns: list) -> dict:
+    """
+    Raw field name -> merged column. Exports name every attribute 'new_' + the column name in any
+    case (json_to_csv lowercases them), e.g. new_sm_1_answer -> SM_1_Answer.
+    """
+    return {f"new_{column}".lower(): column for column in columns}
+
+# Function to read a question catalog file
+def load_question_catalog(path) -> dict:
+    """Read a JSON object of question code (e.g. 'SM_1' or 'SM_1_Answer', any case) -> question text"""
+    with open(path, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    return {code.lower().removesuffix("_answer"): text for code, text in catalog.items()}
+
+def _questions_from_dataset(df: pd.DataFrame) -> dict:
+    """Question texts already present in a merged dataset, keyed like load_question_catalog"""
+    catalog = {}
+    for column in df.columns:
+        if column.endswith("_Answer_question"):
+            first_row = df[column].first_valid_index()
+            if first_row is not None:
+                catalog[column.removesuffix("_Answer_question").lower()] = df[column].loc[first_row]
+    return catalog
+
+def _record_hash(record: dict) -> str:
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _manifest_path(output_path: Path) -> Path:
+    return output_path.parent / SNAPSHOT_DIR_NAME / f"{output_path.name}.ingest.json"
+
+def _read_manifest(output_path: Path) -> dict:
+    try:
+        with _manifest_path(output_path).open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == MANIFEST_FORMAT else None
+
+def _write_manifest(output_path: Path, manifest: dict):
+    path = _manifest_path(output_path)
+    path.parent.mkdir(exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def _export_state(paths: list) -> dict:
+    state = {}
+    for path in paths:
+        stat = os.stat(path)
+        state[str(Path(path).resolve())] = [stat.st_size, stat.st_mtime_ns]
+    return state
+
+# Function to collect the raw records of every partner from the exports
+def collect_partner_records(response_paths: list, partner_paths: list = (), mapping: dict = None) -> dict:
+    """
+    Stream the exports and merge the mapped fields of every partner into one record.
+    Partner exports carry Partner_ID, TPID and partner level fields; response exports carry answers
+    and are joined to their partner by Partner_ID, or by TPID when they have no Partner_ID
+    (responses of unknown TPIDs are skipped). Later records override earlier fields.
+    Returns Partner_ID -> {column: value}.
+    """
+    partners = {}
+    tpid_to_partner = {}
+    unknown_fields = set()
+    orphans = 0
+
+    def add(record):
+        nonlocal orphans
+        row = {}
+        for key, value in filter_record(record).items():
+            column = mapping.get(key)
+            if column is None:
+                unknown_fields.add(key)
+            else:
+                row[column] = value
+        partner_id = row.get("Partner_ID")
+        if partner_id is None and row.get("TPID") is not None:
+            partner_id = tpid_to_partner.get(row["TPID"])
+        if partner_id is None:
+            orphans += 1
+            return
+        partner_id = int(partner_id)
+        partners.setdefault(partner_id, {"Partner_ID": partner_id}).update(row)
+        if row.get("TPID") is not None:
+            tpid_to_partner.setdefault(row["TPID"], partner_id)
+
+    # Partners first, so answer records can be joined on TPID
+    for path in list(partner_paths) + list(response_paths):
+        for record in iter_json_records(path):
+            add(record)
+
+    if orphans:
+        print(f"Skipped {orphans} records without a known Partner_ID or TPID")
+    if unknown_fields:
+        print(f"Ignored {len(unknown_fields)} fields without a dataset column: {', '.join(sorted(unknown_fields)[:10])}"
+              + (" ..." if len(unknown_fields) > 10 else ""))
+    return partners
+
+# Function to check that derived KPI scores may be written to the dataset
+def _derived_kpis_allowed(existing: pd.DataFrame, kpis: list) -> str:
+    """
+    None when scores computed from answers may be written, else the reason they may not.
+    The weight table has to reproduce the KPI columns of the existing dataset first
+    (check_derived_kpis, per DERIVED_KPI_CHECK); without a dataset to check against only
+    DERIVED_KPI_CHECK=warn or off allows them.
+    """
+    reference = [kpi for kpi in kpis if existing is not None and kpi in existing.columns]
+    if not reference:
+        if DERIVED_KPI_CHECK == "refuse":
+            return f"no dataset scores to check {WEIGHTS_FILE.name} against (set DERIVED_KPI_CHECK=warn to compute them anyway)"
+        return None
+    answer_columns = [column for column in existing.columns if column.endswith("_Answer")]
+    try:
+        derived = compute_kpi_scores(existing[["Partner_ID"] + answer_columns], reference)
+        check_derived_kpis(derived, existing[["Partner_ID"] + reference].set_index("Partner_ID"))
+    except (ValueError, DerivedKPIMismatchError) as e:
+        return str(e)
+    return None
+
+# Function to build merged dataset rows from raw partner records
+def build_rows(records: list, columns: list, questions: dict, existing: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Rows in the column order of the dataset, with the question text columns filled from the catalog.
+    KPI and index scores the exports don't carry are kept from the existing dataset for the partners
+    it has; new partners get them computed from their answers (scoring.py) only when the weight table
+    reproduces the existing scores (_derived_kpis_allowed), and are left empty otherwise.
+    """
+    rows = pd.DataFrame(records).reindex(columns=columns)
+    for column in columns:
+        if column.endswith("_Answer_question"):
+            rows[column] = questions.get(column.removesuffix("_Answer_question").lower())
+
+    kpis = [kpi for kpi in kpi_columns if kpi in columns]
+    if not kpis:
+        return rows
+    new = pd.Series(True, index=rows.index)
+    if existing is not None:
+        known = existing.drop_duplicates("Partner_ID").set_index("Partner_ID")
+        kept = known[[kpi for kpi in kpis if kpi in known.columns]].reindex(rows["Partner_ID"].to_numpy())
+        kept.index = rows.index
+        for kpi in kept.columns:
+            # Scores the exports carry win over the existing ones
+            rows[kpi] = rows[kpi].combine_first(kept[kpi])
+        new = ~rows["Partner_ID"].isin(known.index)
+
+    unscored = rows[kpis].isna().any(axis=1) & new
+    if unscored.any():
+        reason = _derived_kpis_allowed(existing, kpis)
+        if reason is None:
+            answer_columns = [column for column in columns if column.endswith("_Answer")]
+            try:
+                scores = compute_kpi_scores(rows.loc[unscored, ["Partner_ID"] + answer_columns], kpis)
+            except ValueError as e:
+                reason = str(e)
+        if reason is not None:
+            print(f"KPI scores of {int(unscored.sum())} new partners left empty: {reason}")
+            return rows
+        scores.index = rows.index[unscored]
+        for kpi in kpis:
+            rows.loc[unscored, kpi] = rows.loc[unscored, kpi].combine_first(scores[kpi])
+        print(f"Computed the missing KPI scores of {int(unscored.sum())} new partners from their answers ({WEIGHTS_FILE.name})")
+    return rows
+
+# Function to give rebuilt rows the column types of the existing dataset
+def _match_dtypes(rebuilt: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    """
+    Integer columns that a missing answer turned into floats become nullable Int64, so rebuilt rows
+    write 0, 5, ... like the existing rows instead of 0.0, 5.0, ...
+    """
+    casts = {}
+    for column in rebuilt.columns:
+        if (column in existing.columns and pd.api.types.is_integer_dtype(existing[column].dtype)
+                and pd.api.types.is_float_dtype(rebuilt[column].dtype)):
+            values = rebuilt[column].dropna()
+            if (values == values.round()).all():
+                casts[column] = "Int64"
+    return rebuilt.astype(casts) if casts else rebuilt
+
+# Function to build the merged dataset from raw response exports
+def run_pipeline(response_paths: list, partner_paths: list = (), output_path=DATA_FILE,
+                 questions_path=None, template_path=None, full: bool = False) -> dict:
+    """
+    Build the merged dataset (output_path, plus its columnar snapshot) from raw JSON/JSONL exports.
+    The exports are complete dumps: partners missing from them are removed from the dataset.
+    A manifest of per-partner content hashes (in .snapshot/) makes later runs rebuild only new or
+    changed partners, and skip writing altogether when nothing changed. full=True ignores it.
+    The column set comes from the existing dataset, or from the header of template_path.
+    Returns a dict with the partner counts of the run.
+    """
+    started = time.perf_counter()
+    output_path = Path(output_path)
+    exports = _export_state(list(partner_paths) + list(response_paths) + ([questions_path] if questions_path else []))
+    manifest = None if full or not output_path.exists() else _read_manifest(output_path)
+    if manifest is not None and manifest["output"] != list(_export_state([output_path]).values())[0]:
+        # The dataset was replaced since the last run, so the manifest doesn't describe it any more
+        manifest = None
+    result = {"output_file": str(output_path), "partners": 0, "added": 0, "changed": 0,
+              "removed": 0, "unchanged": 0, "written": False}
+    if manifest is not None and manifest["exports"] == exports:
+        print("Exports unchanged since the last run, nothing to do")
+        result.update(partners=len(manifest["partners"]), unchanged=len(manifest["partners"]),
+                      seconds=time.perf_counter() - started)
+        return result
+
+    existing = load_dataset(output_path) if output_path.exists() else None
+    if template_path is not None:
+        columns = list(pd.read_csv(template_path, nrows=0).columns)
+    elif existing is not None:
+        columns = list(existing.columns)
+    else:
+        raise ValueError(f"{output_path} doesn't exist yet: pass a template CSV that defines the dataset columns")
+
+    questions = _questions_from_dataset(existing) if existing is not None else {}
+    if questions_path:
+        questions.update(load_question_catalog(questions_path))
+
+    partners = collect_partner_records(response_paths, partner_paths, field_mapping(columns))
+    hashes = {str(partner_id): _record_hash(record) for partner_id, record in partners.items()}
+    old_hashes = manifest["partners"] if manifest is not None else {}
+    # Question texts and columns are part of every row: if they changed, every partner is rebuilt
+    if manifest is not None and (manifest["questions_hash"] != _record_hash(questions) or list(existing.columns) != columns):
+        old_hashes = {}
+
+    added = [pid for pid in partners if str(pid) not in old_hashes]
+    changed = [pid for pid in partners if str(pid) in old_hashes and old_hashes[str(pid)] != hashes[str(pid)]]
+    removed = [int(pid) for pid in old_hashes if int(pid) not in partners]
+    result.update(partners=len(partners), added=len(added), changed=len(changed), removed=len(removed),
+                  unchanged=len(partners) - len(added) - len(changed))
+
+    if added or changed or removed or not old_hashes:
+        rebuilt = build_rows([partners[pid] for pid in changed + added], columns, questions, existing)
+        if existing is not None:
+            rebuilt = _match_dtypes(rebuilt, existing)
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        rebuilt.to_csv(tmp_path, index=False)
+        if old_hashes:
+            # Unchanged rows are written back as the exact records of the current file, so their bytes
+            # don't change; rebuilt rows take the place of changed partners and new partners go last
+            _, header, _, records = scan_records(output_path, known=set())
+            _, _, _, rebuilt_records = scan_records(tmp_path, known=set())
+            rebuilt_records = dict(zip(changed + added, rebuilt_records.values()))
+            dropped = set(removed + changed)
+            lines = [header]
+            for number, partner_id in enumerate(existing["Partner_ID"].tolist()):
+                if partner_id in rebuilt_records:
+                    lines.append(rebuilt_records.pop(partner_id))
+                elif partner_id not in dropped:
+                    lines.append(records[number])
+            lines += rebuilt_records.values()
+            with tmp_path.open("wb") as f:
+                f.writelines(line if line.endswith(b"\n") else line + b"\n" for line in lines)
+        os.replace(tmp_path, output_path)
+        # Load once so the columnar snapshot the service reads is built right away
+        load_dataset(output_path)
+        result["written"] = True
+
+    _write_manifest(output_path, {
+        "format": MANIFEST_FORMAT,
+        "exports": exports,
+        "output": list(_export_state([output_path]).values())[0],
+        "questions_hash": _record_hash(questions),
+        "partners": hashes,
+    })
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the merged partner dataset from raw JSON/JSONL response exports.")
+    parser.add_argument("responses", nargs="+", help="Response exports (JSON array or JSON Lines)")
+    parser.add_argument("--partners", nargs="*", default=[],
+                        help="Partner exports with Partner_ID, TPID and partner level fields, joined to the responses")
+    parser.add_argument("--output", default=DATA_FILE, help=f"Merged dataset to write (default: {DATA_FILE})")
+    parser.add_argument("--questions", help="JSON file of question code -> question text")
+    parser.add_argument("--template", help="CSV whose header defines the dataset columns (default: the existing output)")
+    parser.add_argument("--full", action="store_true", help="Rebuild every partner, ignoring the manifest of the last run")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        result = run_pipeline(args.responses, args.partners, args.output, questions_path=args.questions,
+                              template_path=args.template, full=args.full)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"{result['partners']} partners: {result['added']} added, {result['changed']} changed, "
+          f"{result['removed']} removed, {result['unchanged']} unchanged in {result['seconds']:.2f}s")
+    if result["written"]:
+        print(f"Wrote {result['output_file']} - POST /reload to serve the new data")
+
+
+if __name__ == "__main__":
+    main()
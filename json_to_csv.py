@@ -1,5 +1,11 @@
 import pandas as pd
 import json
+import re
+from typing import Callable, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 50_000
+READ_BLOCK_SIZE = 1024 * 1024
+_SEPARATORS = re.compile(r'[\s,]*')
 
 def json_to_dataframe(json_file_path: str) -> pd.DataFrame:
     """
@@ -33,6 +39,135 @@ def json_to_dataframe(json_file_path: str) -> pd.DataFrame:
     
     return df
 
+def filter_record(record: dict) -> dict:
+    """
+    Keeps the keys of one record that start with 'new_', lowercased to match the CSV attributes.
+    
+    Args:
+        record (dict): One record of the JSON export.
+    
+    Returns:
+        dict: The filtered record.
+    """
+    return {key.lower(): value for key, value in record.items() if key.startswith('new_')}
+
+def iter_json_records(json_file_path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[dict]:
+    """
+    Parses the records of a JSON export one at a time, without loading the whole file.
+    Accepts a top-level JSON array of records as well as JSON Lines (one record per line).
+    
+    Args:
+        json_file_path (str): Path to the JSON or JSONL file.
+        block_size (int): Number of characters read from the file at a time.
+    
+    Yields:
+        dict: The next record of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file_path, 'r', encoding='utf-8') as file:
+        buffer = file.read(block_size).lstrip('\ufeff')
+        position = 0
+        in_array = None
+        at_eof = not buffer
+        while True:
+            # Skip whitespace and the separators between records
+            position = _SEPARATORS.match(buffer, position).end()
+            if position < len(buffer):
+                if in_array is None:
+                    in_array = buffer[position] == '['
+                    if in_array:
+                        position += 1
+                        continue
+                if in_array and buffer[position] == ']':
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if at_eof:
+                        raise
+                    record = None
+                if record is not None:
+                    position = end
+                    yield record
+                    continue
+            elif at_eof:
+                if in_array:
+                    raise ValueError(f"Unterminated JSON array in {json_file_path}")
+                return
+
+            # The next record is incomplete: drop what was consumed and read another block
+            block = file.read(block_size)
+            at_eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+
+def iter_dataframe_chunks(json_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Streams a JSON or JSONL export as DataFrames of at most chunk_size rows.
+    Records are filtered to their 'new_' keys and lowercased one at a time, so memory use depends
+    on chunk_size instead of on the file size.
+    
+    Args:
+        json_file_path (str): Path to the JSON or JSONL file.
+        chunk_size (int): Maximum number of rows per chunk.
+    
+    Yields:
+        pd.DataFrame: The next chunk. A chunk only has the columns that occur in its own records.
+    """
+    rows = []
+    for record in iter_json_records(json_file_path):
+        rows.append(filter_record(record))
+        if len(rows) == chunk_size:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+def process_json_chunks(json_file_path: str, on_chunk: Callable[[pd.DataFrame], None],
+                        chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Streams a JSON or JSONL export and passes every chunk to a callback.
+    
+    Args:
+        json_file_path (str): Path to the JSON or JSONL file.
+        on_chunk (Callable): Called with each DataFrame chunk, in file order.
+        chunk_size (int): Maximum number of rows per chunk.
+    
+    Returns:
+        int: The number of records processed.
+    """
+    total = 0
+    for chunk in iter_dataframe_chunks(json_file_path, chunk_size):
+        on_chunk(chunk)
+        total += len(chunk)
+    return total
+
+def json_to_csv(json_file_path: str, csv_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                columns: Optional[list] = None) -> int:
+    """
+    Converts a JSON or JSONL export into a CSV file in bounded memory, one chunk at a time.
+    
+    Args:
+        json_file_path (str): Path to the JSON or JSONL file.
+        csv_file_path (str): Path of the CSV file to write.
+        chunk_size (int): Maximum number of rows held in memory at once.
+        columns (list, optional): Output columns. By default a first pass over the file collects
+            the 'new_' columns in order of appearance, like json_to_dataframe.
+    
+    Returns:
+        int: The number of records written.
+    """
+    if columns is None:
+        columns = list(dict.fromkeys(key for record in iter_json_records(json_file_path)
+                                     for key in filter_record(record)))
+    written = 0
+    with open(csv_file_path, 'w', encoding='utf-8', newline='') as file:
+        pd.DataFrame(columns=columns).to_csv(file, index=False)
+        for chunk in iter_dataframe_chunks(json_file_path, chunk_size):
+            chunk.reindex(columns=columns).to_csv(file, index=False, header=False)
+            written += len(chunk)
+    return written
+
 # Example usage
 if __name__ == "__main__":
     json_file_path = "c:\\Hackahton Server Function\\response.json"
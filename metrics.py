@@ -0,0 +1,196 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds (seconds) of the duration histogram buckets: sub-millisecond data lookups up to agent runs
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                    30.0, 60.0, 120.0, 300.0)
+
+# Attributes inherited by nested spans, e.g. the partner ID of a report for its agent calls
+INHERITED_ATTRIBUTES = ("partner_id", "section")
+# Numeric span attributes that are also summed into counters
+COUNTED_ATTRIBUTES = ("prompt_chars", "response_chars", "prompt_tokens", "completion_tokens", "total_tokens")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+# Cumulative histogram of durations, in the Prometheus bucket layout
+class Histogram:
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+# Process-wide registry of stage timings and counters
+class MetricsRegistry:
+    """
+    Aggregates finished spans into one duration histogram and error count per stage, and sums
+    the size and token attributes of the spans. While a trace is active every span is also kept
+    with its attributes, to be written as a JSON trace file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}   # stage -> Histogram
+        self.errors = {}   # stage -> count
+        self.counters = {}   # (counter name, stage) -> total
+        self.collectors = []   # functions returning (name, type, help, value) samples of other components
+        self._trace = None
+
+    def record(self, span: dict):
+        with self._lock:
+            stage = span["name"]
+            self.histograms.setdefault(stage, Histogram()).observe(span["seconds"])
+            if span["status"] == "error":
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+            for name in COUNTED_ATTRIBUTES:
+                value = span["attributes"].get(name)
+                if isinstance(value, (int, float)):
+                    self.counters[(name, stage)] = self.counters.get((name, stage), 0) + value
+            if self._trace is not None:
+                self._trace.append(span)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.counters.clear()
+
+    def register_collector(self, collect):
+        """Add collect() -> [(name, type, help, value)] to the output, for state kept elsewhere (e.g. gauges)"""
+        with self._lock:
+            self.collectors.append(collect)
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            collectors = list(self.collectors)
+            lines = [
+                "# HELP report_stage_duration_seconds Duration of report pipeline stages.",
+                "# TYPE report_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'report_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'report_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'report_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += ["# HELP report_stage_errors_total Report pipeline stages that raised an error.",
+                      "# TYPE report_stage_errors_total counter"]
+            lines += [f'report_stage_errors_total{{stage="{stage}"}} {count}' for stage, count in sorted(self.errors.items())]
+
+            for name in COUNTED_ATTRIBUTES:
+                metric = f"agent_{name}_total"
+                values = sorted((stage, total) for (counter, stage), total in self.counters.items() if counter == name)
+                if not values:
+                    continue
+                lines += [f"# HELP {metric} Sum of {name.replace('_', ' ')} recorded by the stages.", f"# TYPE {metric} counter"]
+                lines += [f'{metric}{{stage="{stage}"}} {total}' for stage, total in values]
+        # Collected outside the lock, a collector may take its own locks
+        for collect in collectors:
+            for name, kind, help_text, value in collect():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def trace(self, path):
+        """Keep every span finished inside the block and write them to path as a JSON trace file"""
+        with self._lock:
+            previous, self._trace = self._trace, []
+        try:
+            yield
+        finally:
+            with self._lock:
+                spans, self._trace = self._trace, previous
+            write_trace(spans, path)
+
+
+registry = MetricsRegistry()
+
+
+def _inherit(attributes: dict):
+    """Copy the inherited attributes of the enclosing span into attributes and return that span"""
+    parent = _current_span.get()
+    if parent is not None:
+        for key in INHERITED_ATTRIBUTES:
+            if key in parent["attributes"] and key not in attributes:
+                attributes[key] = parent["attributes"][key]
+    return parent
+
+# Function to time one stage of the pipeline
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the block as a span of the given stage. The yielded dict takes attributes known only at
+    the end (e.g. response sizes). partner_id and section are inherited from enclosing spans,
+    also across threads when the context is copied (contextvars.copy_context).
+    """
+    parent = _inherit(attributes)
+    record = {"name": name, "attributes": attributes, "status": "ok", "thread": threading.get_ident(),
+              "start": time.time(), "parent": parent["name"] if parent else None}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        record["status"] = "error"
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - started
+        _current_span.reset(token)
+        registry.record(record)
+
+def observe(name: str, seconds: float, status: str = "ok", **attributes):
+    """Record a span timed by the caller (for code that can't hold a span open, e.g. a generator)"""
+    parent = _inherit(attributes)
+    registry.record({"name": name, "attributes": attributes, "status": status, "thread": threading.get_ident(),
+                     "start": time.time() - seconds, "seconds": seconds, "parent": parent["name"] if parent else None})
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
+
+def register_collector(collect):
+    registry.register_collector(collect)
+
+def trace(path):
+    """Context manager writing every span finished inside it to a JSON trace file"""
+    return registry.trace(path)
+
+# Function to write spans as a JSON trace file
+def write_trace(spans: list, path) -> Path:
+    """
+    Write spans in the Chrome trace event format (open in chrome://tracing or ui.perfetto.dev);
+    every event carries the span attributes in args.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    events = [
+        {
+            "name": span["name"],
+            "ph": "X",
+            "ts": span["start"] * 1e6,
+            "dur": span["seconds"] * 1e6,
+            "pid": os.getpid(),
+            "tid": span["thread"],
+            "args": {**span["attributes"], "status": span["status"], "parent": span["parent"]},
+        }
+        for span in spans
+    ]
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+    return path
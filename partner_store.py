@@ -0,0 +1,229 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Function to turn a stored value into a JSON-serializable one
+def plain_value(value):
+    """numpy scalars become Python numbers (float32 without the float64 noise), NaN and NA become None"""
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(str(value))
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+# Compact, array-backed store of per-partner KPI and answer values
+class PartnerStore:
+    """
+    Column arrays of KPI scores and question answers with a hash index from Partner_ID and TPID
+    to row position, plus an LRU cache of rendered summary texts.
+    Built once per data load; a new data version means a new store (and an empty cache).
+    """
+
+    def __init__(self, kpi_scores_df: pd.DataFrame, question_scores_df: pd.DataFrame,
+                 question_dict: dict, version: int = 0, cache_size: int = 1024):
+        self.version = version
+        self.kpi_names = list(kpi_scores_df.columns)
+        self.question_codes = [col for col in question_scores_df.columns if col not in ('Partner_ID', 'TPID')]
+        self.question_texts = [question_dict.get(code, code) for code in self.question_codes]
+
+        # One typed array per column keeps the original dtypes (and thus formatting) of every value
+        self.kpi_values = [kpi_scores_df[kpi].to_numpy() for kpi in self.kpi_names]
+        self.answer_values = [question_scores_df[code].to_numpy() for code in self.question_codes]
+        self.tpids = question_scores_df['TPID'].to_numpy()
+        self.question_partner_ids = question_scores_df['Partner_ID'].to_numpy()
+
+        # Hash indexes to row positions (first row wins for duplicated IDs)
+        self._kpi_rows = {}
+        for row, partner_id in enumerate(kpi_scores_df.index):
+            self._kpi_rows.setdefault(partner_id, row)
+        self._question_rows = {}
+        for row, partner_id in enumerate(question_scores_df['Partner_ID'].to_numpy()):
+            self._question_rows.setdefault(partner_id, row)
+        self._tpid_rows = {}
+        for row, tpid in enumerate(self.tpids):
+            self._tpid_rows.setdefault(tpid, row)
+
+        self.cache_size = cache_size
+        self._summary_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def with_changes(self, kpi_scores_df: pd.DataFrame, question_scores_df: pd.DataFrame, question_dict: dict,
+                     version: int, removed: list, changed: list, added: list) -> "PartnerStore":
+        """
+        Store for updated data that differs from this one by a few partners.
+        The column arrays are copied and patched: changed partners are overwritten in place,
+        added partners are appended and removed partners are dropped from the indexes (their rows
+        stay behind as unused slots, see unused_rows). Partner IDs must be unique in the new data.
+        Raises ValueError when the columns or their types changed, which needs a full rebuild.
+        """
+        question_codes = [col for col in question_scores_df.columns if col not in ('Partner_ID', 'TPID')]
+        new_kpi_values = [kpi_scores_df[kpi].to_numpy() for kpi in self.kpi_names]
+        new_answer_values = [question_scores_df[code].to_numpy() for code in question_codes]
+        new_tpids = question_scores_df['TPID'].to_numpy()
+        if (list(kpi_scores_df.columns) != self.kpi_names or question_codes != self.question_codes
+                or any(new.dtype != old.dtype for new, old in zip(new_kpi_values + new_answer_values + [new_tpids],
+                                                                  self.kpi_values + self.answer_values + [self.tpids]))):
+            raise ValueError("Columns changed, rebuild the partner store")
+
+        new_rows = pd.Index(question_scores_df['Partner_ID'].to_numpy())
+        changed_old = np.array([self._question_rows[partner_id] for partner_id in changed], dtype=np.int64)
+        changed_new = new_rows.get_indexer(list(changed))
+        added_new = new_rows.get_indexer(list(added))
+
+        def patch(old, new):
+            patched = np.concatenate([old, new[added_new]])
+            patched[changed_old] = new[changed_new]
+            return patched
+
+        store = PartnerStore.__new__(PartnerStore)
+        store.version = version
+        store.kpi_names = self.kpi_names
+        store.question_codes = self.question_codes
+        store.question_texts = [question_dict.get(code, code) for code in self.question_codes]
+        store.kpi_values = [patch(old, new) for old, new in zip(self.kpi_values, new_kpi_values)]
+        store.answer_values = [patch(old, new) for old, new in zip(self.answer_values, new_answer_values)]
+        store.tpids = patch(self.tpids, new_tpids)
+        store.question_partner_ids = patch(self.question_partner_ids, question_scores_df['Partner_ID'].to_numpy())
+
+        store._kpi_rows = self._kpi_rows.copy()
+        store._question_rows = self._question_rows.copy()
+        store._tpid_rows = self._tpid_rows.copy()
+        for partner_id in list(removed) + list(changed):
+            row = store._question_rows[partner_id]
+            if store._tpid_rows.get(self.tpids[row]) == row:
+                del store._tpid_rows[self.tpids[row]]
+        for partner_id in removed:
+            del store._kpi_rows[partner_id]
+            del store._question_rows[partner_id]
+        for offset, partner_id in enumerate(added):
+            row = len(self.tpids) + offset
+            store._kpi_rows[partner_id] = row
+            store._question_rows[partner_id] = row
+        for partner_id in list(changed) + list(added):
+            row = store._question_rows[partner_id]
+            store._tpid_rows.setdefault(store.tpids[row], row)
+
+        store.cache_size = self.cache_size
+        store._summary_cache = OrderedDict()
+        store._lock = threading.Lock()
+        return store
+
+    @property
+    def unused_rows(self) -> int:
+        """Rows left behind by removed partners since the last full build"""
+        return len(self.tpids) - len(self._question_rows)
+
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays, counting every distinct object of object arrays once"""
+        arrays = self.kpi_values + self.answer_values + [self.tpids, self.question_partner_ids]
+        total = sum(values.nbytes for values in arrays)
+        objects = {id(value): value for values in arrays if values.dtype == object for value in values}
+        return total + sum(sys.getsizeof(value) for value in objects.values())
+
+    def __len__(self):
+        return len(self._kpi_rows)
+
+    def __contains__(self, partner_id):
+        return partner_id in self._kpi_rows
+
+    def partner_ids(self) -> list:
+        return list(self._kpi_rows)
+
+    def partner_id_for_tpid(self, tpid):
+        """Return the Partner_ID of a TPID, or None if the TPID is unknown"""
+        row = self._tpid_rows.get(tpid)
+        if row is None:
+            return None
+        return self.question_partner_ids[row].item()
+
+    def tpid(self, partner_id):
+        """TPID of one partner"""
+        row = self._question_rows.get(partner_id)
+        if row is None:
+            raise KeyError(partner_id)
+        return self.tpids[row]
+
+    def kpi_record(self, partner_id) -> dict:
+        """KPI name -> score of one partner"""
+        row = self._kpi_rows.get(partner_id)
+        if row is None:
+            raise KeyError(partner_id)
+        return {kpi: values[row] for kpi, values in zip(self.kpi_names, self.kpi_values)}
+
+    def answer_record(self, partner_id) -> dict:
+        """Question code -> answer of one partner"""
+        row = self._question_rows.get(partner_id)
+        if row is None:
+            raise KeyError(partner_id)
+        return {code: values[row] for code, values in zip(self.question_codes, self.answer_values)}
+
+    def render_summary(self, partner_id) -> str:
+        """Render the summary text of one partner, served from the LRU cache when possible"""
+        with self._lock:
+            if partner_id in self._summary_cache:
+                self._summary_cache.move_to_end(partner_id)
+                return self._summary_cache[partner_id]
+
+        summary_text = self._render(partner_id)
+
+        with self._lock:
+            self._summary_cache[partner_id] = summary_text
+            self._summary_cache.move_to_end(partner_id)
+            while len(self._summary_cache) > self.cache_size:
+                self._summary_cache.popitem(last=False)
+        return summary_text
+
+    def summary_record(self, partner_id) -> dict:
+        """The content of the summary text as plain JSON-serializable values (None for missing ones)"""
+        kpi_row = self._kpi_rows.get(partner_id)
+        if kpi_row is None:
+            raise KeyError(partner_id)
+        question_row = self._question_rows.get(partner_id)
+        if question_row is None:
+            raise ValueError(f"Partner ID {partner_id} not found in Question scores")
+        return {
+            "partner_id": plain_value(partner_id),
+            "tpid": plain_value(self.tpids[question_row]),
+            "kpis": {kpi: plain_value(values[kpi_row]) for kpi, values in zip(self.kpi_names, self.kpi_values)},
+            "questions": [
+                {"number": i, "code": code, "question": question_text, "answer": plain_value(values[question_row])}
+                for i, (code, question_text, values) in enumerate(zip(self.question_codes, self.question_texts,
+                                                                      self.answer_values), 3)
+            ],
+        }
+
+    def clear_cache(self):
+        with self._lock:
+            self._summary_cache.clear()
+
+    def _render(self, partner_id) -> str:
+        kpi_row = self._kpi_rows.get(partner_id)
+        if kpi_row is None:
+            raise KeyError(partner_id)
+        question_row = self._question_rows.get(partner_id)
+        if question_row is None:
+            raise ValueError(f"Partner ID {partner_id} not found in Question scores")
+
+        lines = [f"Chosen Partner: {partner_id} with TPID: {self.tpids[question_row]}", "", "KPI Scores:"]
+        for kpi, values in zip(self.kpi_names, self.kpi_values):
+            score = values[kpi_row]
+            if kpi == 'AIDW_ready':
+                # Handle AIDW_ready as a string value
+                lines.append(f"{kpi}: {score}")
+            elif isinstance(score, (int, float, np.integer, np.floating)) and not np.isnan(score):   # a number(!) and not NaN
+                lines.append(f"{kpi}: {score:.2f}")
+
+        lines.append("")
+        lines.append("Question replies:")
+        # Numbering continues after the Partner_ID and TPID columns, like the original per-row walk
+        for i, (question_text, values) in enumerate(zip(self.question_texts, self.answer_values), 3):
+            lines.append(f"{i}. {question_text}: {values[question_row]}")
+
+        return "\n".join(lines)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# Distance measures for peer search
+METRICS = ("euclidean", "cosine")
+
+
+# Nearest-neighbour index over standardized KPI vectors
+class PeerIndex:
+    """
+    Standardized KPI vectors of all partners in one float32 matrix (z-scores, missing values at the
+    mean), so "which partners look like this one" is one matrix product plus a partial sort.
+    Built once per data load.
+    """
+
+    def __init__(self, kpi_scores_df: pd.DataFrame, kpis: list):
+        self.kpis = [kpi for kpi in kpis if kpi in kpi_scores_df.columns]
+        values = kpi_scores_df[self.kpis].to_numpy(dtype=np.float64)
+        mean = np.nanmean(values, axis=0) if len(values) else np.zeros(len(self.kpis))
+        std = np.nanstd(values, axis=0) if len(values) else np.ones(len(self.kpis))
+        std = np.where((std > 0) & ~np.isnan(std), std, 1.0)
+        vectors = np.nan_to_num((values - mean) / std)
+
+        self.ids = kpi_scores_df.index.to_numpy()
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.squared_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        norms = np.sqrt(self.squared_norms)
+        self.unit_vectors = self.vectors / np.where(norms > 0, norms, 1.0)[:, None]
+
+        # lookup index of partner IDs (first row wins for duplicated IDs)
+        first_rows = ~kpi_scores_df.index.duplicated()
+        self.partner_ids = kpi_scores_df.index[first_rows]
+        self._row_positions = np.flatnonzero(first_rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self, partner_ids) -> np.ndarray:
+        """Translate partner IDs to row positions, raising ValueError for unknown IDs"""
+        positions = self.partner_ids.get_indexer(list(partner_ids))
+        missing = [pid for pid, pos in zip(partner_ids, positions) if pos < 0]
+        if missing:
+            raise ValueError(f"Partner ID {missing[0]} not found in KPI scores")
+        return self._row_positions[positions]
+
+    def _distances(self, rows: np.ndarray, metric: str) -> np.ndarray:
+        """Queries x partners matrix of distances (smaller is more similar)"""
+        if metric == "cosine":
+            return 1.0 - self.unit_vectors[rows] @ self.unit_vectors.T
+        if metric == "euclidean":
+            # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b, clipped against rounding below zero
+            squared = self.squared_norms[rows, None] + self.squared_norms[None, :] - 2.0 * (self.vectors[rows] @ self.vectors.T)
+            return np.sqrt(np.maximum(squared, 0.0))
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+
+    def nearest_batch(self, partner_ids, k: int = 10, metric: str = "euclidean") -> dict:
+        """
+        The k most similar partners of every given partner, nearest first, as a dict of
+        partner ID -> list of (peer ID, distance). A partner is never its own peer.
+        """
+        partner_ids = list(partner_ids)
+        rows = self._rows(partner_ids)
+        distances = self._distances(rows, metric)
+        distances[np.arange(len(rows)), rows] = np.inf
+        k = max(0, min(k, len(self) - 1))
+        if k == 0:
+            return {partner_id: [] for partner_id in partner_ids}
+
+        # Partial sort: only the k smallest distances per row are put in order
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind="stable")
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+        return {
+            partner_id: [(self.ids[col].item(), float(distance)) for col, distance in zip(cols, row_distances)]
+            for partner_id, cols, row_distances in zip(partner_ids, nearest, nearest_distances)
+        }
+
+    def nearest(self, partner_id, k: int = 10, metric: str = "euclidean") -> list:
+        """The k most similar partners of one partner as a list of (peer ID, distance), nearest first"""
+        return self.nearest_batch([partner_id], k, metric)[partner_id]
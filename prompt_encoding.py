@@ -0,0 +1,136 @@
+import math
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from agent_controller import CHARS_PER_TOKEN
+
+# How the question catalog reaches the agent in compact mode: in the first prompt of every thread,
+# or already in the agent instructions (see `python chat.py --question-catalog`)
+CATALOG_MODES = ("thread", "instructions")
+# Tokens kept free for the line telling the agent that answers were left out
+_DROPPED_NOTE_TOKENS = 25
+_ANSWERS_PREFIX = "Answers (question code=score): "
+
+
+# Function to estimate the tokens of a text
+def estimate_tokens(text: str) -> int:
+    """Rough token count (CHARS_PER_TOKEN characters per token), good enough to compare prompt variants"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# Function to remove the indentation the prompt templates carry from the source code
+def compact_whitespace(text: str) -> str:
+    """
+    Strip leading whitespace from every line and collapse runs of blank lines, keeping trailing
+    double spaces (Markdown line breaks in the output formats the prompts ask for).
+    """
+    text = re.sub(r"(?m)^[ \t]+", "", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip("\n")
+
+# Function to format comparison statistics as a compact table
+def format_kpi_table(kpi_stats_index, scores, percentiles, title: str = "Statistics of all partners") -> str:
+    """The comparison statistics of chat._format_comparison_stats as one pipe-separated row per KPI"""
+    lines = [f"{title} (KPI|mean|std|p25|p75|partner score|partner percentile):"]
+    for i, kpi in enumerate(kpi_stats_index.kpis):
+        stats = kpi_stats_index.stats[kpi]
+        lines.append(f"{kpi}|{stats.mean:.2f}|{stats.std:.2f}|{stats.p25:.2f}|{stats.p75:.2f}|{scores[i]:.2f}|{int(percentiles[i])}")
+    return "\n".join(lines) + "\n"
+
+
+# Compact encoding of partner summaries: a question catalog plus code=score pairs
+class PromptEncoder:
+    """
+    Encodes partner summaries with short question codes (Q3, Q4, ... numbered like the verbose
+    summary) instead of the full question texts, which the agent gets once from the question catalog.
+    With a token budget the answers with the least signal are left out first: missing answers,
+    then the answers closest to the mean of all partners (smallest |z-score|).
+    Built per dataset snapshot.
+    """
+
+    def __init__(self, partner_store, question_scores_df):
+        self.partner_store = partner_store
+        self.codes = [f"Q{i}" for i in range(3, 3 + len(partner_store.question_codes))]
+        self.texts = [" ".join(str(text).split()) for text in partner_store.question_texts]
+        # Population mean and spread of every question, for the signal of a partner's answers
+        answers = np.empty((len(question_scores_df), len(self.codes)))
+        for column, code in enumerate(partner_store.question_codes):
+            answers[:, column] = pd.to_numeric(question_scores_df[code], errors="coerce").to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)   # questions nobody answered
+            self.means = np.nanmean(answers, axis=0)
+            self.stds = np.nanstd(answers, axis=0)
+
+    def catalog(self, rows=None) -> str:
+        """Question catalog text, of all questions or only of the given question rows"""
+        rows = range(len(self.codes)) if rows is None else rows
+        lines = ["Question catalog (code: question); the partner answers refer to these codes:"]
+        lines += [f"{self.codes[row]}: {self.texts[row]}" for row in rows]
+        return "\n".join(lines)
+
+    def signals(self, answers: list) -> np.ndarray:
+        """|z-score| of every answer against all partners; -1 for missing answers, 0 for questions without spread"""
+        values = np.array([float(value) if isinstance(value, (int, float, np.integer, np.floating)) else np.nan
+                           for value in answers])
+        # Questions nobody answered (NaN spread) count as no signal, missing answers as less than none
+        with np.errstate(invalid="ignore", divide="ignore"):
+            signal = np.where(self.stds > 0, np.abs(values - self.means) / self.stds, 0.0)
+        return np.where(np.isnan(values), -1.0, signal)
+
+    def encode_summary(self, partner_id, token_budget: int = None, include_catalog: bool = True) -> tuple:
+        """
+        Compact summary of one partner (preceded by the catalog of its questions when include_catalog),
+        fitted into token_budget estimated tokens by leaving out the lowest-signal answers.
+        Returns (text, info) with the questions kept, the unanswered and near-average answers left out
+        and the estimated tokens.
+        Raises KeyError for an unknown partner, like PartnerStore.answer_record.
+        """
+        store = self.partner_store
+        kpis = store.kpi_record(partner_id)
+        answers = list(store.answer_record(partner_id).values())
+        tpid = store.tpid(partner_id)
+
+        kpi_parts = []
+        for kpi, score in kpis.items():
+            if kpi == 'AIDW_ready':
+                kpi_parts.append(f"{kpi}={score}")
+            elif isinstance(score, (int, float, np.integer, np.floating)) and not np.isnan(score):
+                kpi_parts.append(f"{kpi}={score:.2f}")
+        head = f"Partner {partner_id} (TPID {tpid})\nKPI scores: {'; '.join(kpi_parts)}"
+
+        pairs = [f"{code}={value}" for code, value in zip(self.codes, answers)]
+        # Tokens of each question: its answer pair plus, when the catalog is sent along, its catalog line
+        costs = np.array([estimate_tokens(pair + " ") + (estimate_tokens(f"{code}: {text}\n") if include_catalog else 0)
+                          for pair, code, text in zip(pairs, self.codes, self.texts)])
+        kept = np.ones(len(pairs), dtype=bool)
+        signals = self.signals(answers)
+        if token_budget:
+            fixed = (estimate_tokens(head) + estimate_tokens(_ANSWERS_PREFIX) + _DROPPED_NOTE_TOKENS
+                     + (estimate_tokens(self.catalog([])) if include_catalog else 0))
+            total = fixed + costs.sum()
+            # Stable order: equal signals are dropped from the last question backwards
+            for row in np.lexsort((-np.arange(len(pairs)), signals)):
+                if total <= token_budget:
+                    break
+                kept[row] = False
+                total -= costs[row]
+
+        rows = np.flatnonzero(kept)
+        answer_line = _ANSWERS_PREFIX + " ".join(pairs[row] for row in rows)
+        unanswered = signals < 0
+        dropped_unanswered = int(np.count_nonzero(~kept & unanswered))
+        dropped_near_average = int(np.count_nonzero(~kept & ~unanswered))
+        left_out = []
+        if dropped_unanswered:
+            left_out.append(f"{dropped_unanswered} unanswered questions")
+        if dropped_near_average:
+            left_out.append(f"{dropped_near_average} answers close to the average of all partners")
+        if left_out:
+            answer_line += f"\n({' and '.join(left_out)} left out)"
+        text = f"{head}\n{answer_line}"
+        if include_catalog:
+            text = f"{self.catalog(rows)}\n\n{text}"
+        return text, {"questions": len(rows), "dropped": dropped_unanswered + dropped_near_average,
+                      "dropped_unanswered": dropped_unanswered, "dropped_near_average": dropped_near_average,
+                      "tokens": estimate_tokens(text)}
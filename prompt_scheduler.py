@@ -0,0 +1,142 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from metrics import span
+from response_cache import section_keys
+
+
+# Function to check that the prompt dependencies form a DAG
+def validate_prompt_dag(prompts: list):
+    """Raise ValueError for duplicate section names, unknown dependencies or dependency cycles"""
+    names = [prompt['name'] for prompt in prompts]
+    if len(set(names)) != len(names):
+        raise ValueError("Prompt section names must be unique")
+    for prompt in prompts:
+        for dependency in prompt.get('depends_on', []):
+            if dependency not in names:
+                raise ValueError(f"Section '{prompt['name']}' depends on unknown section '{dependency}'")
+
+    # Kahn's algorithm: every section must become ready at some point
+    remaining = {prompt['name']: set(prompt.get('depends_on', [])) for prompt in prompts}
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"Prompt dependencies contain a cycle between: {', '.join(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+
+# Function to put the outputs of earlier sections in front of a section's prompt
+def inject_dependency_outputs(content: str, outputs: list) -> str:
+    """Prefix a prompt with the (name, text) outputs of the sections it depends on"""
+    if not outputs:
+        return content
+    context = "Results of the earlier analysis sections:\n\n"
+    for name, text in outputs:
+        context += f"=== {name} ===\n{text}\n\n"
+    return context + content
+
+# Function to run report prompts as a dependency graph
+def run_prompt_dag(project_client, agent_id: str, prompts: list, send_message, thread_manager,
+                   thread_id: str = None, max_parallel: int = None, response_cache=None, on_section=None) -> list:
+    """
+    Run prompts declared with 'depends_on' lists, running independent sections at the same time.
+
+    Root sections (no dependencies) run first, in order, on the given thread (or a fresh one from
+    thread_manager). Every other section runs on its own forked thread seeded with the root prompts
+    (the shared summary context), with the outputs of its non-root dependencies injected into its
+    prompt. Threads created here are released to thread_manager once their section is done.
+    send_message(project_client, thread_id, agent_id, content) must return the agent response.
+    With a response_cache, sections whose prompt and dependencies are unchanged are served from
+    the cache without creating a thread. on_section(turn) is called with the result of every finished section.
+
+    Returns a list of dicts with name, user (the sent prompt), assistant, timestamp and key (the
+    section's cache key), in the order the prompts were declared.
+    """
+    validate_prompt_dag(prompts)
+    by_name = {prompt['name']: prompt for prompt in prompts}
+    roots = [prompt for prompt in prompts if not prompt.get('depends_on')]
+    root_names = {prompt['name'] for prompt in roots}
+    results = {}
+    results_lock = threading.Lock()
+    cache_keys = section_keys(agent_id, prompts, {prompt['name']: prompt.get('depends_on', []) for prompt in prompts})
+
+    def record(prompt, content, text):
+        with results_lock:
+            results[prompt['name']] = {
+                "name": prompt['name'],
+                "user": content,
+                "assistant": text,
+                "timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+                "key": cache_keys[prompt['name']],
+            }
+        if on_section:
+            on_section(results[prompt['name']])
+
+    def cached_text(prompt):
+        return response_cache.get(cache_keys[prompt['name']]) if response_cache else None
+
+    def send(prompt, thread, content):
+        with span("section", section=prompt['name']):
+            response = send_message(project_client, thread, agent_id, content)
+        if response is None:
+            raise RuntimeError(f"No response from agent for section '{prompt['name']}'")
+        if response_cache:
+            response_cache.put(cache_keys[prompt['name']], response.text.value, prompt['name'])
+        record(prompt, content, response.text.value)
+
+    # Root sections keep the original single-thread behaviour
+    root_thread_id = None
+    try:
+        for prompt in roots:
+            text = cached_text(prompt)
+            if text is not None:
+                record(prompt, prompt['content'], text)
+                continue
+            if root_thread_id is None:
+                root_thread_id = thread_id or thread_manager.acquire()
+                print(f"Created thread, ID: {root_thread_id}")
+            send(prompt, root_thread_id, prompt['content'])
+    finally:
+        if root_thread_id and not thread_id:
+            thread_manager.release(root_thread_id)
+
+    seed_messages = [{"role": "user", "content": prompt['content']} for prompt in roots]
+
+    def run_section(prompt):
+        dependency_outputs = [
+            (name, results[name]["assistant"])
+            for name in prompt.get('depends_on', []) if name not in root_names
+        ]
+        content = inject_dependency_outputs(prompt['content'], dependency_outputs)
+        text = cached_text(prompt)
+        if text is not None:
+            record(prompt, content, text)
+            return
+        forked_thread_id = thread_manager.fork(seed_messages)
+        print(f"Forked thread {forked_thread_id} for section '{prompt['name']}'")
+        try:
+            send(prompt, forked_thread_id, content)
+        finally:
+            thread_manager.release(forked_thread_id)
+
+    pending = [prompt for prompt in prompts if prompt['name'] not in root_names]
+    workers = max_parallel or max(1, len(pending))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            # Start every section whose dependencies are all done
+            for prompt in [p for p in pending if all(d in results for d in p.get('depends_on', []))]:
+                pending.remove(prompt)
+                # In a copy of the caller's context, so the section's spans keep the report's partner ID
+                running[executor.submit(contextvars.copy_context().run, run_section, prompt)] = prompt['name']
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                # Re-raise the first section failure
+                future.result()
+
+    return [results[name] for name in by_name]
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from stats_index import patch_sorted
+
+# Largest page a ranking query returns
+MAX_PAGE_SIZE = 1000
+
+
+# Percentile ranks and score ranks of every partner in every KPI, computed once per data load
+class RankMatrix:
+    """
+    Partners x KPIs matrices of percentile ranks and ranks (1 = highest score, ties share a rank),
+    computed for every numeric KPI column (not only the comparison KPIs) in one sort per KPI.
+    Answers top-N / bottom-N and percentile range queries with paging, without ranking partners per request.
+    """
+
+    def __init__(self, kpi_scores_df: pd.DataFrame, kpis: list):
+        # Text columns such as AIDW_ready can't be ranked
+        self.kpis = [kpi for kpi in kpis if pd.api.types.is_numeric_dtype(kpi_scores_df[kpi])]
+        self.ids = kpi_scores_df.index.to_numpy()
+        self.values = kpi_scores_df[self.kpis].to_numpy(dtype=np.float64)
+        # left / right: number of scores below / not above each score (right follows from the rank)
+        self.left = np.zeros(self.values.shape, dtype=np.int32)
+        right = np.zeros(self.values.shape, dtype=np.int64)
+        self.sorted_values = []   # scores of every KPI in ascending order without NaN, to patch the ranks
+        # One sort per KPI; ties are the runs of equal scores in sorted order
+        for i in range(len(self.kpis)):
+            column = np.ascontiguousarray(self.values[:, i])
+            count = int(np.count_nonzero(~np.isnan(column)))
+            rows = np.argsort(column)[:count]   # NaN sorts last
+            sorted_scores = column[rows]
+            changes = sorted_scores[1:] != sorted_scores[:-1]
+            positions = np.arange(count)
+            self.left[rows, i] = np.maximum.accumulate(np.where(np.r_[True, changes], positions, 0))
+            right[rows, i] = np.minimum.accumulate(np.where(np.r_[changes, True], positions + 1, count)[::-1])[::-1]
+            self.sorted_values.append(sorted_scores)
+        self._rank(right)
+
+    def _rank(self, right: np.ndarray):
+        counts = np.array([len(sorted_scores) for sorted_scores in self.sorted_values], dtype=np.int64)
+        scored = ~np.isnan(self.values)
+        self.left[~scored] = 0
+        # same formula as KPIStats.percentile_of (scipy.stats.percentileofscore(kind='rank'))
+        self.percentiles = np.where(scored, (self.left + right + (right > self.left)) * 50.0 / np.maximum(counts, 1), np.nan)
+        # rank = 1 + number of strictly higher scores
+        self.ranks = np.where(scored, counts - right + 1, 0)
+
+    def with_changes(self, kpi_scores_df: pd.DataFrame, previous_rows: np.ndarray) -> "RankMatrix":
+        """
+        Ranks over an updated kpi_scores_df that differs from this one by a few partners.
+        previous_rows holds the row in this matrix of every new row whose scores are unchanged,
+        -1 for added and changed partners. Instead of sorting every KPI again, the sorted scores are
+        patched and the tie bounds of unchanged partners are shifted by the number of outgoing and
+        incoming scores below them. Raises ValueError when the rankable KPIs changed.
+        """
+        if any(kpi not in kpi_scores_df.columns or not pd.api.types.is_numeric_dtype(kpi_scores_df[kpi]) for kpi in self.kpis):
+            raise ValueError("KPI columns changed, rebuild the rank matrix")
+        matrix = RankMatrix.__new__(RankMatrix)
+        matrix.kpis = self.kpis
+        matrix.ids = kpi_scores_df.index.to_numpy()
+        matrix.values = kpi_scores_df[matrix.kpis].to_numpy(dtype=np.float64)
+        matrix.left = np.zeros(matrix.values.shape, dtype=np.int32)
+        right = np.zeros(matrix.values.shape, dtype=np.int64)
+        matrix.sorted_values = []
+
+        kept = previous_rows >= 0
+        outgoing_rows = np.ones(len(self.values), dtype=bool)
+        outgoing_rows[previous_rows[kept]] = False
+        for i in range(len(matrix.kpis)):
+            outgoing = self.values[outgoing_rows, i]
+            incoming = matrix.values[~kept, i]
+            sorted_scores = patch_sorted(self.sorted_values[i], outgoing, incoming)
+            outgoing = np.sort(outgoing[~np.isnan(outgoing)])
+            incoming = np.sort(incoming[~np.isnan(incoming)])
+            # Unchanged partners: their old bounds minus the outgoing and plus the incoming scores below them
+            scores = matrix.values[kept, i]
+            old_rows = previous_rows[kept]
+            old_right = len(self.sorted_values[i]) - self.ranks[old_rows, i] + 1
+            matrix.left[kept, i] = (self.left[old_rows, i] - np.searchsorted(outgoing, scores, side="left")
+                                    + np.searchsorted(incoming, scores, side="left"))
+            right[kept, i] = (old_right - np.searchsorted(outgoing, scores, side="right")
+                              + np.searchsorted(incoming, scores, side="right"))
+            # Added and changed partners: binary search in the patched scores
+            scores = matrix.values[~kept, i]
+            matrix.left[~kept, i] = np.searchsorted(sorted_scores, scores, side="left")
+            right[~kept, i] = np.searchsorted(sorted_scores, scores, side="right")
+            matrix.sorted_values.append(sorted_scores)
+        matrix._rank(right)
+        return matrix
+
+    def nbytes(self) -> int:
+        arrays = [self.values, self.percentiles, self.ranks, self.left] + self.sorted_values
+        return sum(values.nbytes for values in arrays)
+
+    def _column(self, kpi: str) -> int:
+        if kpi not in self.kpis:
+            raise ValueError(f"Unknown KPI {kpi}; available KPIs: {', '.join(self.kpis)}")
+        return self.kpis.index(kpi)
+
+    def _page(self, i: int, rows: np.ndarray) -> list:
+        return [
+            {
+                "partner_id": self.ids[row].item(),
+                "score": float(self.values[row, i]),
+                "percentile": float(self.percentiles[row, i]),
+                "rank": int(self.ranks[row, i]),
+            }
+            for row in rows
+        ]
+
+    def top(self, kpi: str, limit: int = 20, offset: int = 0, bottom: bool = False) -> dict:
+        """
+        Page of the partners with the highest scores in a KPI (lowest with bottom=True).
+        Only the first offset + limit partners are sorted (partial sort). Partners without a score are left out.
+        """
+        i = self._column(kpi)
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        scored = np.flatnonzero(~np.isnan(self.values[:, i]))
+        total = len(scored)
+        keys = self.values[scored, i] if bottom else -self.values[scored, i]
+        end = min(offset + limit, total)
+        if end > offset:
+            if end < total:
+                # The end-th smallest key bounds the page; every partner tied with it is kept so
+                # that ties are broken by row, the same way on every page
+                threshold = np.partition(keys, end - 1)[end - 1]
+                in_head = keys <= threshold
+                scored, keys = scored[in_head], keys[in_head]
+            rows = scored[np.lexsort((scored, keys))][offset:end]
+        else:
+            rows = scored[:0]
+        return {"kpi": kpi, "order": "bottom" if bottom else "top", "total": total,
+                "offset": offset, "limit": limit, "partners": self._page(i, rows)}
+
+    def percentile_range(self, kpi: str, min_percentile: float = 0.0, max_percentile: float = 100.0,
+                         limit: int = 20, offset: int = 0) -> dict:
+        """Page of the partners whose percentile rank in a KPI is within [min_percentile, max_percentile], highest score first"""
+        i = self._column(kpi)
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        percentiles = self.percentiles[:, i]
+        matches = np.flatnonzero((percentiles >= min_percentile) & (percentiles <= max_percentile))
+        rows = matches[np.lexsort((matches, -self.values[matches, i]))][offset:offset + limit]
+        return {"kpi": kpi, "min_percentile": min_percentile, "max_percentile": max_percentile,
+                "total": len(matches), "offset": offset, "limit": limit, "partners": self._page(i, rows)}
@@ -0,0 +1,355 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import chat
+from report_journal import ReportJournal
+from response_cache import ResponseCache
+from thread_manager import ThreadManager
+
+# Job states: queued -> running -> succeeded | failed (running jobs of a stopped host go back to queued)
+JOB_STATES = ("queued", "running", "succeeded", "failed")
+# Jobs in these states take over new requests for the same partner and data version
+COALESCED_STATES = ("queued", "running", "succeeded")
+# Seconds a claimed job stays with its worker without a heartbeat; after that any worker may run it again
+LEASE_SECONDS = float(os.getenv("REPORT_JOB_LEASE_SECONDS", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    partner_id INTEGER NOT NULL,
+    data_version TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sections TEXT NOT NULL DEFAULT '[]',
+    sections_total INTEGER,
+    output_file TEXT,
+    report TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_by_partner ON jobs (partner_id, data_version);
+"""
+
+
+# Function to get the version of a dataset snapshot that stays the same across host restarts
+def data_version(snapshot) -> str:
+    """Content hash of the dataset file plus the KPI mode (see DatasetSnapshot.content_version)"""
+    return snapshot.content_version
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds).isoformat(timespec="seconds") if seconds else None
+
+
+# Report jobs stored in a local SQLite file
+class ReportJobQueue:
+    """
+    Queue of report jobs in a SQLite database, so queued and finished jobs survive a host restart.
+    Every operation uses its own connection and claims run in an immediate transaction, so any
+    number of worker threads (or processes on the same file) can share the queue.
+    A claimed job is leased to its owner (one worker pool) for lease_seconds and the owner renews
+    the lease while it runs the job; a running job whose lease ran out (its worker process stopped)
+    is queued again by the next claim. Only the owner can record progress and the outcome.
+    """
+
+    def __init__(self, path: Path = None, lease_seconds: float = None):
+        self.path = Path(path) if path else Path.cwd() / "output" / "report_jobs.sqlite3"
+        self.lease_seconds = LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            # Queue files created before jobs were leased
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Connection holding the write lock until the block ends (rolled back on an error)"""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def submit(self, partner_ids: list, data_version: str, force: bool = False) -> list:
+        """
+        Queue a report job for every partner and return (job, coalesced) pairs. A queued, running
+        or finished job for the same partner and data version is returned instead of a new one,
+        unless force is set.
+        """
+        submitted = []
+        now = time.time()
+        with self._transaction() as connection:
+            for partner_id in partner_ids:
+                existing = None if force else connection.execute(
+                    f"SELECT * FROM jobs WHERE partner_id = ? AND data_version = ? "
+                    f"AND status IN ({', '.join('?' * len(COALESCED_STATES))}) ORDER BY created DESC LIMIT 1",
+                    (partner_id, data_version, *COALESCED_STATES)).fetchone()
+                if existing is not None:
+                    submitted.append((self._job(existing), True))
+                    continue
+                job_id = uuid.uuid4().hex
+                connection.execute("INSERT INTO jobs (id, partner_id, data_version, status, created) VALUES (?, ?, ?, 'queued', ?)",
+                                   (job_id, partner_id, data_version, now))
+                submitted.append((self._job(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()), False))
+        return submitted
+
+    def claim(self, owner: str):
+        """
+        Lease the oldest queued job to owner, mark it as running and return it, or None when the
+        queue is empty. Running jobs whose lease expired are queued again first.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            requeued = self._requeue_expired(connection, now)
+            if requeued:
+                print(f"Requeued {requeued} report jobs whose worker stopped renewing their lease")
+            row = connection.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created, rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1, sections = '[]', "
+                               "sections_total = NULL, error = NULL, owner = ?, lease_until = ? WHERE id = ?",
+                               (now, owner, now + self.lease_seconds, row["id"]))
+            return self._job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def renew(self, owner: str, job_ids: list) -> int:
+        """Extend the leases of the given running jobs of owner; returns how many it still holds"""
+        if not job_ids:
+            return 0
+        with self._connect() as connection:
+            return connection.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running' AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time() + self.lease_seconds, owner, *job_ids)).rowcount
+
+    def progress(self, job_id: str, owner: str, sections: list, total: int):
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET sections = ?, sections_total = ?, lease_until = ? "
+                               "WHERE id = ? AND owner = ? AND status = 'running'",
+                               (json.dumps(sections), total, time.time() + self.lease_seconds, job_id, owner))
+
+    def complete(self, job_id: str, owner: str, output_file: str, report: str) -> bool:
+        """Record the report of a job; False when owner lost the job (its lease expired) in the meantime"""
+        with self._connect() as connection:
+            return connection.execute("UPDATE jobs SET status = 'succeeded', finished = ?, output_file = ?, report = ?, "
+                                      "lease_until = NULL WHERE id = ? AND owner = ? AND status = 'running'",
+                                      (time.time(), output_file, report, job_id, owner)).rowcount > 0
+
+    def fail(self, job_id: str, owner: str, error: str) -> bool:
+        with self._connect() as connection:
+            return connection.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ?, lease_until = NULL "
+                                      "WHERE id = ? AND owner = ? AND status = 'running'",
+                                      (time.time(), error, job_id, owner)).rowcount > 0
+
+    def requeue_expired(self) -> int:
+        """Put running jobs whose lease expired (their worker process stopped) back in the queue; returns how many"""
+        with self._transaction() as connection:
+            return self._requeue_expired(connection, time.time())
+
+    @staticmethod
+    def _requeue_expired(connection, now: float) -> int:
+        return connection.execute("UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL "
+                                  "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)", (now,)).rowcount
+
+    def get(self, job_id: str, include_report: bool = True):
+        """The job as a dict, or None for an unknown job ID"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row, include_report) if row is not None else None
+
+    def counts(self) -> dict:
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in JOB_STATES} | {status: count for status, count in rows}
+
+    @staticmethod
+    def _job(row, include_report: bool = False) -> dict:
+        sections = json.loads(row["sections"])
+        job = {
+            "job_id": row["id"],
+            "partner_id": row["partner_id"],
+            "data_version": row["data_version"],
+            "status": row["status"],
+            "created": _timestamp(row["created"]),
+            "started": _timestamp(row["started"]),
+            "finished": _timestamp(row["finished"]),
+            "attempts": row["attempts"],
+            "owner": row["owner"],
+            "progress": {"sections_done": len(sections), "sections_total": row["sections_total"], "sections": sections},
+            "output_file": row["output_file"],
+            "error": row["error"],
+        }
+        if include_report:
+            job["report"] = row["report"]
+        return job
+
+
+# Background workers running the report pipeline for queued jobs
+class ReportWorkers:
+    """
+    Pool of daemon threads that claim jobs from the queue and run chat.generate_report on a shared
+    agent client and thread pool, recording the finished sections as they come in.
+    Every job journals its sections next to the queue file (runs/job-<ID>.jsonl), so a job that was
+    running when its host stopped continues from its finished sections once its lease expired.
+    A heartbeat thread renews the leases of the running jobs every third of the lease time.
+    wake() makes idle workers look for new jobs right away instead of at their next poll.
+    """
+
+    def __init__(self, queue: ReportJobQueue, workers: int = 2, project_client=None, agent_id: str = None,
+                 parallel_sections: bool = False, response_cache: ResponseCache = None, poll_seconds: float = 1.0):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.project_client = project_client
+        self.agent_id = agent_id
+        self.parallel_sections = parallel_sections
+        self.response_cache = response_cache
+        self.poll_seconds = poll_seconds
+        self.thread_manager = None
+        # Lease owner ID of this pool, unique across hosts and worker processes
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.project_client is None:
+            self.project_client, self.agent_id = chat.get_project_client(), os.getenv("AZURE_AGENT_ID")
+        self.thread_manager = ThreadManager(self.project_client, pool_size=self.workers)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"report-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="report-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = None):
+        """Let the workers finish their current job and exit"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.thread_manager is not None:
+            self.thread_manager.close()
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.owner)
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            with self._running_lock:
+                self._running.add(job["job_id"])
+            try:
+                self._run(job)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job["job_id"])
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            with self._running_lock:
+                job_ids = list(self._running)
+            try:
+                self.queue.renew(self.owner, job_ids)
+            except sqlite3.Error as e:
+                print(f"Could not renew report job leases: {e}")
+
+    def _run(self, job: dict):
+        sections = []
+
+        def on_section(name: str, done: int, total: int):
+            sections.append(name)
+            self.queue.progress(job["job_id"], self.owner, list(sections), total)
+
+        try:
+            output_file = chat.generate_report(self.project_client, self.agent_id, job["partner_id"],
+                                               parallel_sections=self.parallel_sections,
+                                               thread_manager=self.thread_manager,
+                                               response_cache=self.response_cache, on_section=on_section,
+                                               journal=ReportJournal(self.queue.path.parent / "runs" / f"job-{job['job_id']}.jsonl"))
+            if not self.queue.complete(job["job_id"], self.owner, str(output_file), Path(output_file).read_text(encoding="utf-8")):
+                print(f"Report job {job['job_id']} finished after its lease expired; keeping the other worker's result")
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.fail(job["job_id"], self.owner, f"{type(e).__name__}: {e}")
+
+
+_queue = None
+_workers = None
+_workers_lock = threading.Lock()
+
+# Function to get the shared job queue, without starting any workers
+def get_queue() -> ReportJobQueue:
+    """Return the job queue of this process; REPORT_JOBS_DB sets its file (default output/report_jobs.sqlite3)"""
+    global _queue
+    if _queue is None:
+        with _workers_lock:
+            if _queue is None:
+                _queue = ReportJobQueue(os.getenv("REPORT_JOBS_DB"))
+    return _queue
+
+# Function to get the shared report workers, started on first use
+def get_workers() -> ReportWorkers:
+    """
+    Return the report workers of this process, starting them on first use (REPORT_WORKERS sets the
+    number of workers, default 2). Only queueing a job starts them; reading a job status doesn't.
+    """
+    global _workers
+    if _workers is None:
+        queue = get_queue()
+        with _workers_lock:
+            if _workers is None:
+                _workers = ReportWorkers(queue, workers=int(os.getenv("REPORT_WORKERS", "2")),
+                                         response_cache=ResponseCache()).start()
+    return _workers
+
+# Function to queue report jobs for partners
+def submit_reports(partner_ids: list, force: bool = False) -> list:
+    """
+    Queue a report job for every partner on the current data version and wake the workers.
+    Returns (job, coalesced) pairs; raises ValueError for partners that aren't in the data.
+    """
+    snapshot = chat.get_snapshot()
+    missing = [partner_id for partner_id in partner_ids if partner_id not in snapshot.kpi_scores_df.index]
+    if missing:
+        raise ValueError(f"Partner ID {', '.join(str(partner_id) for partner_id in missing[:10])} not found in KPI scores")
+    workers = get_workers()
+    submitted = workers.queue.submit(partner_ids, data_version(snapshot), force)
+    workers.wake()
+    return submitted
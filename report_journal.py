@@ -0,0 +1,188 @@
+import json
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+SEPARATOR = "\n\n" + "=" * 80 + "\n\n"
+
+
+# Functions formatting the report files (shared by the streaming writer and chat.save_*)
+def format_report_header(partner_id: int, timestamp: str) -> str:
+    return f"Analysis for Partner {partner_id}\nGenerated on: {timestamp}\n" + "=" * 80 + "\n\n"
+
+def format_report_section(turn: dict, first: bool) -> str:
+    """The first turn is written as the initial summary (its prompt), the others as the agent response"""
+    if first:
+        return "=== Initial Summary ===\n\n" + turn["user"] + SEPARATOR
+    return f"=== {turn.get('name', 'Analysis')} ===\n\n" + turn["assistant"] + SEPARATOR
+
+def format_backup_entry(name: str, timestamp: str, content: str) -> str:
+    return f"\n=== {name} at {timestamp} ===\n" + content + SEPARATOR
+
+
+# Writer of the output and backup files of one report, section by section
+class ReportWriter:
+    """
+    Appends every finished section to the backup file right away, and to the output file as soon
+    as all sections declared before it are written too (parallel sections finish out of order).
+    The output file is written as <name>.<random>.partial (so two reports of a partner started in the
+    same second don't share it) and renamed when the report is complete.
+    """
+
+    def __init__(self, partner_id: int, section_names: list, output_dir: Path = None):
+        self.partner_id = partner_id
+        self.section_names = list(section_names)
+        self.output_dir = Path(output_dir) if output_dir else Path.cwd() / "output"
+        (self.output_dir / "backup").mkdir(parents=True, exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.output_file = self.output_dir / f"partner_{partner_id}_analysis_{timestamp}.txt"
+        self.backup_file = self.output_dir / "backup" / f"backup_responses_{partner_id}_{timestamp}.txt"
+        self._partial_file = self.output_file.with_name(f"{self.output_file.name}.{uuid.uuid4().hex[:8]}.partial")
+        self._output = self._partial_file.open("w", encoding="utf-8")
+        self._backup = self.backup_file.open("a", encoding="utf-8")
+        self._output.write(format_report_header(partner_id, timestamp))
+        self._pending = {}   # finished sections waiting for an earlier one
+        self._written = 0
+
+    def add(self, turn: dict):
+        self._backup.write(format_backup_entry(turn["name"], turn["timestamp"], turn["assistant"]))
+        self._backup.flush()
+        self._pending[turn["name"]] = turn
+        while self._written < len(self.section_names) and self.section_names[self._written] in self._pending:
+            self._output.write(format_report_section(self._pending.pop(self.section_names[self._written]),
+                                                     first=self._written == 0))
+            self._written += 1
+        self._output.flush()
+
+    def close(self) -> Path:
+        """Finish the files and return the output file path"""
+        self._backup.close()
+        self._output.close()
+        os.replace(self._partial_file, self.output_file)
+        print(f"Response backed up to: {self.backup_file.absolute()}")
+        print(f"\nAnalysis saved to: {self.output_file.absolute()}")
+        return self.output_file
+
+    def abort(self):
+        """Close the files of a failed report; the backup keeps the sections that were finished"""
+        self._backup.close()
+        self._output.close()
+        self._partial_file.unlink(missing_ok=True)
+
+
+# Append-only journal of the finished sections of one partner's report
+class ReportJournal:
+    """
+    One JSON line per finished section (name, section key, prompt, response, timestamp), written and
+    synced as soon as the section completes, and a final {"done": output file} line. A rerun on the
+    same journal skips every section whose key (see response_cache.section_keys) is journaled,
+    so only the sections that never finished, or whose inputs changed, are sent to the agent again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.turns = {}   # section key -> journaled turn
+        self.output_file = None
+        self.reused = 0
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue   # a line cut off by a crash
+                    if "done" in entry:
+                        self.output_file = entry["done"]
+                    else:
+                        self.turns[entry["key"]] = entry
+
+    @property
+    def done(self) -> bool:
+        return self.output_file is not None
+
+    def _append(self, entry: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, turn: dict):
+        if turn["key"] not in self.turns:
+            self._append(turn)
+            self.turns[turn["key"]] = turn
+
+    def finish(self, output_file):
+        self.output_file = str(output_file)
+        self._append({"done": self.output_file})
+
+    def lookup(self, response_cache=None) -> "_JournalLookup":
+        """Section lookup for the report runners: the journal first, then the response cache"""
+        return _JournalLookup(self, response_cache)
+
+
+class _JournalLookup:
+    def __init__(self, journal: ReportJournal, response_cache):
+        self.journal = journal
+        self.response_cache = response_cache
+
+    def get(self, key: str):
+        turn = self.journal.turns.get(key)
+        if turn is not None:
+            self.journal.reused += 1
+            return turn["assistant"]
+        return self.response_cache.get(key) if self.response_cache else None
+
+    def put(self, key: str, text: str, section: str = None):
+        if self.response_cache:
+            self.response_cache.put(key, text, section)
+
+
+# One report run (a single partner or a batch), with a journal per partner
+class ReportRun:
+    """
+    A run directory output/runs/<run ID> holding run.json (the partners and settings of the run)
+    and a partner_<ID>.jsonl journal per partner. ReportRun.open(run ID or directory) continues a
+    run that stopped: finished partners are skipped and unfinished ones resume from their journal.
+    """
+
+    def __init__(self, directory: Path, manifest: dict):
+        self.directory = Path(directory)
+        self.manifest = manifest
+
+    @classmethod
+    def create(cls, partner_ids: list, parallel_sections: bool = False, batch: bool = False,
+               run_id: str = None, runs_dir: Path = None) -> "ReportRun":
+        run_id = run_id or f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{uuid.uuid4().hex[:6]}"
+        directory = (Path(runs_dir) if runs_dir else Path.cwd() / "output" / "runs") / run_id
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = {"run_id": run_id, "created": datetime.now().isoformat(timespec="seconds"),
+                    "partner_ids": [int(partner_id) for partner_id in partner_ids],
+                    "parallel_sections": parallel_sections, "batch": batch}
+        (directory / "run.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        return cls(directory, manifest)
+
+    @classmethod
+    def open(cls, run: str, runs_dir: Path = None) -> "ReportRun":
+        """Open a run by its ID (under output/runs) or its directory; raises ValueError when there is none"""
+        directory = Path(run)
+        if not (directory / "run.json").exists():
+            directory = (Path(runs_dir) if runs_dir else Path.cwd() / "output" / "runs") / run
+        try:
+            manifest = json.loads((directory / "run.json").read_text(encoding="utf-8"))
+        except OSError:
+            raise ValueError(f"Report run {run} not found") from None
+        return cls(directory, manifest)
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest["run_id"]
+
+    @property
+    def partner_ids(self) -> list:
+        return self.manifest["partner_ids"]
+
+    def journal(self, partner_id: int) -> ReportJournal:
+        return ReportJournal(self.directory / f"partner_{partner_id}.jsonl")
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+# Function to compute the cache keys of all report sections
+def section_keys(agent_id: str, prompts: list, dependencies: dict) -> dict:
+    """
+    Cache key of every section, chaining in the keys of the sections it depends on,
+    so a changed input invalidates every section downstream of it.
+    dependencies maps a section name to the names of the sections it depends on.
+    """
+    keys = {}
+    for prompt in prompts:
+        dependency_keys = [keys[name] for name in dependencies.get(prompt['name'], [])]
+        keys[prompt['name']] = ResponseCache.key(agent_id, prompt['name'], prompt['content'], dependency_keys)
+    return keys
+
+# Disk-backed cache of agent responses, keyed by a hash of everything the response depends on
+class ResponseCache:
+    """
+    Content-addressed cache of agent responses stored as JSON files under cache_dir.
+    Entries older than max_age_seconds are ignored and removed; when the cache grows past
+    max_bytes the least recently used entries are evicted. With bypass=True lookups always
+    miss but fresh responses are still written, which refreshes the cache.
+    """
+
+    def __init__(self, cache_dir: Path = None, max_bytes: int = 256 * 1024 * 1024,
+                 max_age_seconds: float = 30 * 24 * 3600, bypass: bool = False):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.cwd() / "output" / "cache"
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size = sum(path.stat().st_size for path in self.cache_dir.glob("*/*.json"))
+
+    @staticmethod
+    def key(agent_id: str, section: str, prompt: str, dependency_keys: list = ()) -> str:
+        """
+        Hash of the agent, the section name, the prompt text (which embeds the partner summary or
+        comparison statistics) and the keys of the sections this one depends on.
+        """
+        digest = hashlib.sha256()
+        for part in [agent_id or "", section, prompt, *dependency_keys]:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached response text for a key, or None on a miss"""
+        path = self._path(key)
+        text = None
+        if not self.bypass and path.exists():
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if time.time() - entry["created"] <= self.max_age_seconds:
+                    text = entry["text"]
+                    # Touch the entry so eviction treats it as recently used
+                    os.utime(path)
+                else:
+                    self._remove(path)
+            except (OSError, ValueError, KeyError):
+                text = None
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, key: str, text: str, section: str = None):
+        """Store a response text under a key, evicting old entries if the cache is too large"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump({"key": key, "section": section, "created": time.time(), "text": text}, f, ensure_ascii=False)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.writes += 1
+            self._size += path.stat().st_size - old_size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries, then least recently used ones until the cache fits max_bytes"""
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        with self._lock:
+            size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            self._remove(path)
+            size -= entry_size
+        with self._lock:
+            self._size = max(0, size)
+
+    def _remove(self, path: Path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+            self._size -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes,
+                    "evictions": self.evictions, "bytes": self._size}
@@ -0,0 +1,225 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Declarative KPI weight table: one row per (kpi, input, weight). An input is a question answer
+# column (e.g. SM_1_Answer) or another KPI, so composite indexes are weighted means of KPIs.
+# Every KPI is the weighted mean of its inputs, over the inputs a partner actually answered.
+#
+# The upstream weights are not published. Only the rows of AIDW_AI_Index, AIDW_DB_Index,
+# AIDW_Inno_Index and AIDW_Index (and the AIDW_ready thresholds) reproduce the dataset; the other
+# rows are equal weights over topic-related questions and are placeholders until the real table is
+# dropped in (python scoring.py shows how far each KPI is off).
+WEIGHTS_FILE = Path(__file__).resolve().parent / "kpi_weights.csv"
+
+# AIDW_ready is "Yes" when every listed KPI reaches its threshold (placeholder values as well)
+AIDW_READY_THRESHOLDS = {'AIDW_Index': 7.0, 'Partner_PTI': 7.0}
+
+# Derived scores are checked against the KPI columns of the dataset when it has them: "refuse"
+# raises DerivedKPIMismatchError, "warn" only prints the differences, "off" skips the check
+DERIVED_KPI_CHECK_MODES = ("refuse", "warn", "off")
+DERIVED_KPI_CHECK = os.getenv("DERIVED_KPI_CHECK", "refuse")
+# Largest difference from a dataset score that still counts as the same score
+DERIVED_KPI_TOLERANCE = float(os.getenv("DERIVED_KPI_TOLERANCE", "0.01"))
+
+
+# Raised when the weight table doesn't reproduce the KPI scores of the dataset. Not a ValueError:
+# callers answer those as bad input (the data routes with 404), and this is a configuration error.
+class DerivedKPIMismatchError(Exception):
+    pass
+
+
+# Weighted-mean scoring model compiled from a weight table
+class ScoringModel:
+    """
+    Compiles the weight table into one dense question x KPI matrix for the KPIs computed from answers,
+    plus one small KPI x KPI matrix per level of composite KPIs, so scoring every partner is a
+    handful of NumPy matrix products.
+    """
+
+    def __init__(self, weights: pd.DataFrame, ready_thresholds: dict = None):
+        weights = weights.astype({'weight': np.float64})
+        self.kpis = list(dict.fromkeys(weights['kpi']))
+        self.ready_thresholds = dict(AIDW_READY_THRESHOLDS if ready_thresholds is None else ready_thresholds)
+
+        inputs = weights.groupby('kpi', sort=False)['input'].apply(list).to_dict()
+        composite = {kpi for kpi in self.kpis if any(source in inputs for source in inputs[kpi])}
+        for kpi in composite:
+            if not all(source in inputs for source in inputs[kpi]):
+                raise ValueError(f"{kpi} mixes question and KPI inputs")
+
+        # KPIs computed from answers, as one question x KPI weight matrix
+        self.base_kpis = [kpi for kpi in self.kpis if kpi not in composite]
+        base = weights[weights['kpi'].isin(self.base_kpis)]
+        self.questions = list(dict.fromkeys(base['input']))
+        self.question_weights = self._matrix(base, self.questions, self.base_kpis)
+
+        # Composite KPIs, level by level: each level only uses KPIs computed before it
+        self.levels = []
+        done = list(self.base_kpis)
+        remaining = [kpi for kpi in self.kpis if kpi in composite]
+        while remaining:
+            level = [kpi for kpi in remaining if all(source in done for source in inputs[kpi])]
+            if not level:
+                raise ValueError(f"Circular KPI definitions: {', '.join(remaining)}")
+            rows = weights[weights['kpi'].isin(level)]
+            level_inputs = list(dict.fromkeys(rows['input']))
+            self.levels.append((level, level_inputs, self._matrix(rows, level_inputs, level)))
+            done += level
+            remaining = [kpi for kpi in remaining if kpi not in level]
+
+    @staticmethod
+    def _matrix(rows: pd.DataFrame, inputs: list, kpis: list) -> np.ndarray:
+        matrix = np.zeros((len(inputs), len(kpis)))
+        input_positions = {name: i for i, name in enumerate(inputs)}
+        kpi_positions = {name: j for j, name in enumerate(kpis)}
+        for kpi, source, weight in rows[['kpi', 'input', 'weight']].itertuples(index=False):
+            matrix[input_positions[source], kpi_positions[kpi]] += weight
+        return matrix
+
+    @classmethod
+    def load(cls, path=WEIGHTS_FILE, ready_thresholds: dict = None) -> "ScoringModel":
+        """Build a model from a weight table CSV with kpi, input and weight columns"""
+        return cls(pd.read_csv(path), ready_thresholds)
+
+    @staticmethod
+    def _weighted_mean(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        # Missing inputs drop out of both the weighted sum and the sum of weights
+        missing = np.isnan(values)
+        if not missing.any():
+            return values @ (weights / weights.sum(axis=0))
+        totals = np.where(missing, 0.0, values) @ weights
+        weight_sums = weights.sum(axis=0) - missing.astype(np.float64) @ weights
+        return np.divide(totals, weight_sums, out=np.full_like(totals, np.nan), where=weight_sums > 0)
+
+    def score_matrix(self, answers: np.ndarray) -> np.ndarray:
+        """
+        KPI scores (partners x self.kpis) from an answer matrix with one column per self.questions,
+        NaN for missing answers.
+        """
+        columns = {kpi: j for j, kpi in enumerate(self.base_kpis)}
+        scores = np.empty((len(answers), len(self.kpis)))
+        scores[:, :len(self.base_kpis)] = self._weighted_mean(answers, self.question_weights)
+        for level, inputs, weights in self.levels:
+            start = len(columns)
+            scores[:, start:start + len(level)] = self._weighted_mean(scores[:, [columns[name] for name in inputs]], weights)
+            columns.update((kpi, start + j) for j, kpi in enumerate(level))
+        return scores[:, [columns[kpi] for kpi in self.kpis]]
+
+    def score(self, question_scores_df: pd.DataFrame, kpi_columns: list = None) -> pd.DataFrame:
+        """
+        KPI scores frame indexed by Partner_ID (in kpi_columns order when given), computed from a
+        frame with Partner_ID and the answer columns. Non-numeric answers count as missing.
+        """
+        missing = [question for question in self.questions if question not in question_scores_df.columns]
+        if missing:
+            raise ValueError(f"Answer columns missing for scoring: {', '.join(missing)}")
+        answers_df = question_scores_df[self.questions]
+        text_columns = [question for question in self.questions if not pd.api.types.is_numeric_dtype(answers_df[question].dtype)]
+        if text_columns:
+            answers_df = answers_df.assign(**{question: pd.to_numeric(answers_df[question], errors='coerce') for question in text_columns})
+        answers = answers_df.to_numpy(dtype=np.float64, na_value=np.nan)
+        kpi_scores_df = pd.DataFrame(self.score_matrix(answers), columns=self.kpis,
+                                     index=pd.Index(question_scores_df['Partner_ID'].to_numpy(), name='Partner_ID'))
+
+        ready = np.ones(len(kpi_scores_df), dtype=bool)
+        for kpi, threshold in self.ready_thresholds.items():
+            ready &= kpi_scores_df[kpi].to_numpy() >= threshold
+        kpi_scores_df['AIDW_ready'] = np.where(ready, 'Yes', 'No').astype(object)
+
+        if kpi_columns is not None:
+            kpi_scores_df = kpi_scores_df.reindex(columns=kpi_columns)
+        return kpi_scores_df
+
+_default_model = None
+
+# Function to compute the KPI scores of all partners from their answers
+def compute_kpi_scores(question_scores_df: pd.DataFrame, kpi_columns: list = None, model: ScoringModel = None) -> pd.DataFrame:
+    """Score every partner with the given model, or with the default weight table (kpi_weights.csv)"""
+    global _default_model
+    if model is None:
+        if _default_model is None:
+            _default_model = ScoringModel.load()
+        model = _default_model
+    return model.score(question_scores_df, kpi_columns)
+
+# Function to compare derived KPI scores with the scores of the dataset
+def compare_kpi_scores(derived_df: pd.DataFrame, dataset_df: pd.DataFrame, tolerance: float = None) -> dict:
+    """
+    KPI -> {"max_diff", "mismatched", "compared"} for every KPI both frames have, over the partners
+    of both with a dataset score. AIDW_ready is compared as text (max_diff is None).
+    """
+    tolerance = DERIVED_KPI_TOLERANCE if tolerance is None else tolerance
+    partner_ids = dataset_df.index.intersection(derived_df.index, sort=False)
+    report = {}
+    for kpi in [kpi for kpi in derived_df.columns if kpi in dataset_df.columns]:
+        expected = dataset_df.loc[partner_ids, kpi]
+        actual = derived_df.loc[partner_ids, kpi]
+        if pd.api.types.is_numeric_dtype(expected):
+            expected = expected.to_numpy(dtype=np.float64)
+            actual = pd.to_numeric(actual, errors='coerce').to_numpy(dtype=np.float64)
+            compared = ~np.isnan(expected)
+            # A missing derived score for a partner the dataset scores counts as a mismatch
+            diffs = np.where(np.isnan(actual), np.inf, np.abs(actual - expected))[compared]
+            report[kpi] = {"max_diff": float(diffs.max()) if len(diffs) else 0.0,
+                           "mismatched": int(np.count_nonzero(diffs > tolerance)), "compared": int(compared.sum())}
+        else:
+            compared = expected.notna().to_numpy()
+            mismatched = (expected.astype(str).to_numpy() != actual.astype(str).to_numpy()) & compared
+            report[kpi] = {"max_diff": None, "mismatched": int(mismatched.sum()), "compared": int(compared.sum())}
+    return report
+
+# Function to check derived KPI scores against the dataset before they are served
+def check_derived_kpis(derived_df: pd.DataFrame, dataset_df: pd.DataFrame, mode: str = None, tolerance: float = None) -> dict:
+    """
+    Compare derived scores with the dataset's own KPI columns (see compare_kpi_scores) and, per mode
+    (default DERIVED_KPI_CHECK), raise DerivedKPIMismatchError or print a warning when any KPI is
+    off by more than the tolerance. Returns the comparison ({} with mode "off").
+    """
+    mode = DERIVED_KPI_CHECK if mode is None else mode
+    tolerance = DERIVED_KPI_TOLERANCE if tolerance is None else tolerance
+    if mode not in DERIVED_KPI_CHECK_MODES:
+        raise ValueError(f"DERIVED_KPI_CHECK must be one of {', '.join(DERIVED_KPI_CHECK_MODES)}")
+    if mode == "off":
+        return {}
+    report = compare_kpi_scores(derived_df, dataset_df, tolerance)
+    differing = [
+        f"{kpi} ({result['mismatched']}/{result['compared']} partners"
+        + (f", max diff {result['max_diff']:.2f})" if result['max_diff'] is not None else ")")
+        for kpi, result in report.items() if result['mismatched']
+    ]
+    if differing:
+        message = (f"KPI scores derived with {WEIGHTS_FILE.name} differ from the dataset by more than {tolerance}: "
+                   + "; ".join(differing))
+        if mode == "refuse":
+            raise DerivedKPIMismatchError(message + ". Fix the weight table or set DERIVED_KPI_CHECK=warn to serve them anyway.")
+        print(f"Warning: {message}")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the weight table reproduces the KPI columns of a dataset.")
+    parser.add_argument("csv", nargs="?", default="final_merged_with_questions.csv", help="Dataset with answer and KPI columns")
+    parser.add_argument("--weights", default=WEIGHTS_FILE, help=f"Weight table (default: {WEIGHTS_FILE.name})")
+    parser.add_argument("--tolerance", type=float, default=DERIVED_KPI_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    merged_df = pd.read_csv(args.csv)
+    answer_columns = [col for col in merged_df.columns if col.endswith('_Answer')]
+    kpis = [kpi for kpi in ScoringModel.load(args.weights).kpis + ['AIDW_ready'] if kpi in merged_df.columns]
+    derived_df = compute_kpi_scores(merged_df[['Partner_ID'] + answer_columns], kpis, ScoringModel.load(args.weights))
+    report = compare_kpi_scores(derived_df, merged_df[['Partner_ID'] + kpis].set_index('Partner_ID'), args.tolerance)
+    for kpi, result in report.items():
+        max_diff = "-" if result['max_diff'] is None else f"{result['max_diff']:.4f}"
+        status = "ok" if not result['mismatched'] else f"{result['mismatched']}/{result['compared']} partners differ"
+        print(f"{kpi:<24} max diff {max_diff:>8}  {status}")
+    mismatched = [kpi for kpi, result in report.items() if result['mismatched']]
+    print(f"{len(report) - len(mismatched)} of {len(report)} KPIs reproduced within {args.tolerance}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
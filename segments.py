@@ -0,0 +1,133 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+from stats_index import KPIStatsIndex
+
+
+# Declaration of one way to split partners into peer groups
+@dataclasses.dataclass(frozen=True)
+class Segment:
+    """
+    Partners are grouped by the value of a KPI scores column, or by bands of a numeric column
+    when bins are given (edges of the bands, labels one per band).
+    """
+    column: str
+    bins: tuple = ()
+    labels: tuple = ()
+    description: str = ""
+
+    def assign(self, kpi_scores_df: pd.DataFrame) -> pd.Series:
+        """Group label of every row (NaN for partners outside every group)"""
+        values = kpi_scores_df[self.column]
+        if self.bins:
+            labels = pd.cut(values, bins=list(self.bins), labels=list(self.labels) or None, include_lowest=True)
+            return labels.astype(object).where(labels.notna(), np.nan)
+        return values.map(str).where(values.notna(), np.nan)
+
+
+# Segment definitions available to comparisons - add a declaration here to add a segment
+SEGMENTS = {
+    "aidw_ready": Segment("AIDW_ready", description="AIDW ready (Yes / No)"),
+    "pti_band": Segment("Partner_PTI", bins=(0, 4, 6, 8, 10), labels=("0-4", "4-6", "6-8", "8-10"),
+                        description="Partner PTI score band"),
+}
+
+
+# Cohort statistics of every group of every segment, computed once per data load
+class SegmentStatsCube:
+    """
+    One KPIStatsIndex (count, mean, std, quartiles and sorted values for percentile lookup) per
+    segment group, plus the group of every partner, so a segment comparison is a lookup.
+    """
+
+    def __init__(self, kpi_scores_df: pd.DataFrame, kpis: list, segments: dict = None):
+        self.segments = SEGMENTS if segments is None else segments
+        self.kpis = [kpi for kpi in kpis if kpi in kpi_scores_df.columns]
+        # lookup index of partner IDs (first row wins for duplicated IDs)
+        first_rows = ~kpi_scores_df.index.duplicated()
+        self.partner_ids = kpi_scores_df.index[first_rows]
+        self._row_positions = np.flatnonzero(first_rows)
+
+        self.labels = {}   # segment name -> group label of every row (object array, NaN without group)
+        self.groups = {}   # segment name -> {group label: KPIStatsIndex of the group}
+        for name, segment in self.segments.items():
+            if segment.column not in kpi_scores_df.columns:
+                continue
+            labels = pd.Series(segment.assign(kpi_scores_df).to_numpy(dtype=object))
+            self.labels[name] = labels.to_numpy()
+            self.groups[name] = {
+                label: KPIStatsIndex(kpi_scores_df.iloc[rows], self.kpis)
+                for label, rows in labels.groupby(labels, sort=True, dropna=True).indices.items()
+            }
+
+    def with_changes(self, kpi_scores_df: pd.DataFrame, outgoing: list, incoming: list) -> "SegmentStatsCube":
+        """
+        Cube over an updated kpi_scores_df that differs from this one by a few partners.
+        outgoing are the partner IDs whose old rows left (removed and changed partners), incoming
+        those whose new rows came in (changed and added partners). Group labels are assigned again
+        in one pass; only groups that lost or gained partners get their statistics patched
+        (KPIStatsIndex.with_changes), the others are kept as they are.
+        """
+        cube = SegmentStatsCube.__new__(SegmentStatsCube)
+        cube.segments = self.segments
+        cube.kpis = self.kpis
+        first_rows = ~kpi_scores_df.index.duplicated()
+        cube.partner_ids = kpi_scores_df.index[first_rows]
+        cube._row_positions = np.flatnonzero(first_rows)
+
+        outgoing_positions = self.partner_ids.get_indexer(list(outgoing))
+        incoming_positions = cube.partner_ids.get_indexer(list(incoming))
+        if (outgoing_positions < 0).any() or (incoming_positions < 0).any():
+            raise ValueError("Changed partners not found in KPI scores")
+        outgoing_rows = self._row_positions[outgoing_positions]
+        incoming_rows = cube._row_positions[incoming_positions]
+        cube.labels = {}
+        cube.groups = {}
+        for name, old_labels in self.labels.items():
+            labels = pd.Series(self.segments[name].assign(kpi_scores_df).to_numpy(dtype=object))
+            cube.labels[name] = labels.to_numpy()
+            outgoing_labels = old_labels[outgoing_rows]
+            incoming_labels = cube.labels[name][incoming_rows]
+            cube.groups[name] = {}
+            for label, rows in labels.groupby(labels, sort=True, dropna=True).indices.items():
+                group = self.groups[name].get(label)
+                leaving = [partner_id for partner_id, old_label in zip(outgoing, outgoing_labels) if old_label == label]
+                coming = incoming_rows[incoming_labels == label]
+                if group is not None and not leaving and not len(coming):
+                    cube.groups[name][label] = group
+                elif group is not None:
+                    cube.groups[name][label] = group.with_changes(
+                        kpi_scores_df.iloc[rows], group.partner_scores(leaving),
+                        kpi_scores_df[self.kpis].iloc[coming].to_numpy(dtype=np.float64))
+                else:
+                    cube.groups[name][label] = KPIStatsIndex(kpi_scores_df.iloc[rows], self.kpis)
+        return cube
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the group statistics"""
+        return sum(
+            group.values.nbytes + sum(stats.sorted_values.nbytes for stats in group.stats.values())
+            for groups in self.groups.values() for group in groups.values()
+        )
+
+    def partner_groups(self, segment: str, partner_ids) -> list:
+        """
+        Group label and group statistics of every given partner in a segment, as (label, KPIStatsIndex).
+        Raises ValueError for unknown segments or partners, and for partners outside every group.
+        """
+        if segment not in self.groups:
+            raise ValueError(f"Unknown segment {segment}; available segments: {', '.join(self.groups)}")
+        partner_ids = list(partner_ids)
+        positions = self.partner_ids.get_indexer(partner_ids)
+        missing = [pid for pid, pos in zip(partner_ids, positions) if pos < 0]
+        if missing:
+            raise ValueError(f"Partner ID {missing[0]} not found in KPI scores")
+        labels = self.labels[segment][self._row_positions[positions]]
+        result = []
+        for partner_id, label in zip(partner_ids, labels):
+            if pd.isna(label):
+                raise ValueError(f"Partner ID {partner_id} has no {self.segments[segment].column} value for segment {segment}")
+            result.append((label, self.groups[segment][label]))
+        return result
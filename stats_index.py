@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+# Function to remove and add values in a sorted array without sorting it again
+def patch_sorted(sorted_values: np.ndarray, outgoing, incoming) -> np.ndarray:
+    """
+    sorted_values (without NaN) minus the outgoing values plus the incoming ones, still sorted.
+    NaN values are ignored; raises ValueError when an outgoing value is not in sorted_values.
+    """
+    outgoing = np.sort(np.asarray(outgoing, dtype=np.float64))
+    outgoing = outgoing[~np.isnan(outgoing)]
+    incoming = np.sort(np.asarray(incoming, dtype=np.float64))
+    incoming = incoming[~np.isnan(incoming)]
+
+    # Equal outgoing values remove consecutive copies of that value
+    repeat = np.arange(len(outgoing)) - np.searchsorted(outgoing, outgoing, side="left")
+    positions = np.searchsorted(sorted_values, outgoing, side="left") + repeat
+    if len(positions) and (positions[-1] >= len(sorted_values)
+                           or not np.array_equal(sorted_values[positions], outgoing)):
+        raise ValueError("Outgoing values are not part of the cohort")
+    remaining = np.delete(sorted_values, positions)
+    return np.insert(remaining, np.searchsorted(remaining, incoming), incoming)
+
+
+# Cohort statistics for one KPI, computed once per data load
+class KPIStats:
+    """Sorted values and cached moments of a single KPI column"""
+
+    def __init__(self, values: np.ndarray, is_sorted: bool = False):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.sorted_values = values if is_sorted else np.sort(values)
+        self.count = len(self.sorted_values)
+        if self.count:
+            self.mean = float(self.sorted_values.mean())
+            # ddof=1 to match pandas Series.std()
+            self.std = float(self.sorted_values.std(ddof=1)) if self.count > 1 else float("nan")
+            # linear interpolation, the same method as pandas Series.quantile()
+            self.p25, self.p75 = (float(q) for q in np.quantile(self.sorted_values, [0.25, 0.75]))
+        else:
+            self.mean = self.std = self.p25 = self.p75 = float("nan")
+
+    def percentile_of(self, scores) -> np.ndarray:
+        """
+        Percentile rank of one or many scores within the cohort.
+        Uses binary search and gives the same result as scipy.stats.percentileofscore(kind='rank').
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if not self.count:
+            return np.full(scores.shape, np.nan)
+        left = np.searchsorted(self.sorted_values, scores, side="left")
+        right = np.searchsorted(self.sorted_values, scores, side="right")
+        percentiles = (left + right + (right > left)) * 50.0 / self.count
+        return np.where(np.isnan(scores), np.nan, percentiles)
+
+    def with_changes(self, outgoing, incoming) -> "KPIStats":
+        """
+        Statistics after removing the outgoing values and adding the incoming ones.
+        Patches the sorted array by binary search instead of sorting the whole cohort again.
+        """
+        return KPIStats(patch_sorted(self.sorted_values, outgoing, incoming), is_sorted=True)
+
+
+# Index over all comparison KPIs of the KPI scores dataframe
+class KPIStatsIndex:
+    """
+    Precomputed cohort statistics for the KPI scores dataframe.
+    Build it once per data load, then answer comparison queries without rescanning the data.
+    """
+
+    def __init__(self, kpi_scores_df: pd.DataFrame, kpis: list, stats: dict = None):
+        self.kpis = [kpi for kpi in kpis if kpi in kpi_scores_df.columns]
+        # partners x KPIs matrix, rows aligned with kpi_scores_df.index
+        self.values = kpi_scores_df[self.kpis].to_numpy(dtype=np.float64)
+        # lookup index of partner IDs (first row wins for duplicated IDs)
+        first_rows = ~kpi_scores_df.index.duplicated()
+        self.partner_ids = kpi_scores_df.index[first_rows]
+        self._row_positions = np.flatnonzero(first_rows)
+        if stats is None:
+            stats = {kpi: KPIStats(self.values[:, i]) for i, kpi in enumerate(self.kpis)}
+        self.stats = stats
+
+    def with_changes(self, kpi_scores_df: pd.DataFrame, outgoing: np.ndarray, incoming: np.ndarray) -> "KPIStatsIndex":
+        """
+        Index over an updated kpi_scores_df that differs from this one by a few rows.
+        outgoing holds the old KPI values (partners x self.kpis) of removed and changed partners,
+        incoming the new values of added and changed partners.
+        """
+        stats = {
+            kpi: self.stats[kpi].with_changes(outgoing[:, i], incoming[:, i])
+            for i, kpi in enumerate(self.kpis)
+        }
+        return KPIStatsIndex(kpi_scores_df, self.kpis, stats=stats)
+
+    def _rows(self, partner_ids) -> np.ndarray:
+        """Translate partner IDs to row positions, raising ValueError for unknown IDs"""
+        positions = self.partner_ids.get_indexer(list(partner_ids))
+        missing = [pid for pid, pos in zip(partner_ids, positions) if pos < 0]
+        if missing:
+            raise ValueError(f"Partner ID {missing[0]} not found in KPI scores")
+        return self._row_positions[positions]
+
+    def partner_scores(self, partner_ids) -> np.ndarray:
+        """Partners x KPIs matrix of scores for the given partner IDs"""
+        return self.values[self._rows(partner_ids)]
+
+    def percentiles(self, partner_ids) -> np.ndarray:
+        """Partners x KPIs matrix of percentile ranks for the given partner IDs"""
+        return self.percentiles_of(self.partner_scores(partner_ids))
+
+    def percentiles_of(self, scores) -> np.ndarray:
+        """Percentile ranks of a partners x KPIs matrix of scores within this cohort (which needn't contain them)"""
+        scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+        percentiles = np.empty_like(scores)
+        for i, kpi in enumerate(self.kpis):
+            percentiles[:, i] = self.stats[kpi].percentile_of(scores[:, i])
+        return percentiles
@@ -0,0 +1,57 @@
+import azure.functions as func
+import logging
+import json
+from azurefunctions.extensions.http.fastapi import Request, StreamingResponse, PlainTextResponse
+from chat import initialize_agent, prepare_partner_summary, stream_report
+
+# Streaming routes live in their own Function app entry point: once the FastAPI HTTP streams
+# extension is imported, every HTTP trigger of the app has to use its request/response types,
+# so the routes in function_app.py cannot share a worker with it.
+# Run locally with: PYTHON_SCRIPT_FILE_NAME=stream_app.py func start --port 7072
+app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
+
+# Function to format report events as server-sent events
+def _sse_events(partner_id: int):
+    project_client, agent_id = initialize_agent()
+    try:
+        with project_client:
+            for event, data in stream_report(project_client, agent_id, partner_id):
+                if event == "section":
+                    yield f"event: section\ndata: {json.dumps({'name': data})}\n\n"
+                elif event == "delta":
+                    yield f"event: delta\ndata: {json.dumps({'text': data})}\n\n"
+                else:
+                    yield f"event: done\ndata: {json.dumps({'output_file': data})}\n\n"
+    except Exception as e:
+        logging.error(f"Error streaming report: {e}")
+        yield f"event: error\ndata: {json.dumps({'error': 'Error generating report.'})}\n\n"
+
+# Function to format report events as chunked plain text
+def _text_chunks(partner_id: int):
+    project_client, agent_id = initialize_agent()
+    try:
+        with project_client:
+            for event, data in stream_report(project_client, agent_id, partner_id):
+                if event == "section":
+                    yield f"\n=== {data} ===\n\n"
+                elif event == "delta":
+                    yield data
+    except Exception as e:
+        logging.error(f"Error streaming report: {e}")
+        yield "\n\nError generating report.\n"
+
+@app.route(route="report/{partner_id}/stream", methods=[func.HttpMethod.GET])
+async def stream_report_route(req: Request) -> StreamingResponse:
+    """Stream the full report of a partner section by section (?format=text for plain text)."""
+    try:
+        partner_id = int(req.path_params["partner_id"])
+        # Fail fast with a 404 before opening the stream
+        prepare_partner_summary(partner_id)
+    except ValueError as e:
+        logging.error(f"Error streaming report: {e}")
+        return PlainTextResponse(str(e), status_code=404)
+
+    if req.query_params.get("format") == "text":
+        return StreamingResponse(_text_chunks(partner_id), media_type="text/plain")
+    return StreamingResponse(_sse_events(partner_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,132 @@
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from agent_controller import get_controller
+
+
+# Thread cleanup modes once a report is done with a thread
+CLEANUP_MODES = ("delete", "archive", "keep")
+
+# Hands out fresh agent threads per report and cleans them up in the background
+class ThreadManager:
+    """
+    Creates a fresh agent thread per report (or takes a pre-created one from a pool), so message
+    retrieval never pages through other partners' history. Released threads are deleted, archived
+    to output/threads as JSON and then deleted, or kept, on a background executor.
+    """
+
+    def __init__(self, project_client, pool_size: int = 0, cleanup: str = "delete", archive_dir: Path = None):
+        if cleanup not in CLEANUP_MODES:
+            raise ValueError(f"cleanup must be one of {', '.join(CLEANUP_MODES)}")
+        self.project_client = project_client
+        self.pool_size = pool_size
+        self.cleanup = cleanup
+        self.archive_dir = archive_dir or Path.cwd() / "output" / "threads"
+        self._pool = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thread-cleanup")
+        self._refilling = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.cleaned = 0
+        self._refill()
+
+    def _create(self, messages: list = None):
+        # Retried on throttling like the other agent calls (see agent_controller.py)
+        if messages:
+            thread = get_controller().call(lambda: self.project_client.agents.threads.create(messages=messages))
+        else:
+            thread = get_controller().call(lambda: self.project_client.agents.threads.create())
+        with self._lock:
+            self.created += 1
+        return thread.id
+
+    def _refill(self):
+        """Top the pool of empty threads back up, in the background"""
+        with self._lock:
+            missing = self.pool_size - self._pool.qsize() - self._refilling
+            self._refilling += max(0, missing)
+        for _ in range(max(0, missing)):
+            self._executor.submit(self._add_to_pool)
+
+    def _add_to_pool(self):
+        try:
+            self._pool.put(self._create())
+        except Exception as e:
+            print(f"Could not pre-create thread: {e}")
+        finally:
+            with self._lock:
+                self._refilling -= 1
+
+    def acquire(self) -> str:
+        """Return the ID of a fresh, empty thread"""
+        try:
+            thread_id = self._pool.get_nowait()
+        except queue.Empty:
+            thread_id = self._create()
+        self._refill()
+        return thread_id
+
+    def fork(self, messages: list) -> str:
+        """Return the ID of a new thread seeded with the given messages (dicts with role and content)"""
+        return self._create(messages)
+
+    def release(self, thread_id: str):
+        """Clean up a thread the caller is done with, without waiting for it"""
+        if self.cleanup != "keep":
+            self._executor.submit(self._cleanup, thread_id)
+
+    @contextmanager
+    def thread(self):
+        """Context manager handing out a fresh thread ID and releasing it afterwards"""
+        thread_id = self.acquire()
+        try:
+            yield thread_id
+        finally:
+            self.release(thread_id)
+
+    def _cleanup(self, thread_id: str):
+        try:
+            if self.cleanup == "archive":
+                self._archive(thread_id)
+            self.project_client.agents.threads.delete(thread_id)
+            with self._lock:
+                self.cleaned += 1
+        except Exception as e:
+            print(f"Could not clean up thread {thread_id}: {e}")
+
+    def _archive(self, thread_id: str):
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        messages = []
+        for message in self.project_client.agents.messages.list(thread_id=thread_id, order="asc"):
+            messages.append({
+                "role": str(message.role),
+                "text": "\n".join(text.text.value for text in (message.text_messages or [])),
+            })
+        with (self.archive_dir / f"{thread_id}.json").open("w", encoding="utf-8") as f:
+            json.dump({"thread_id": thread_id, "messages": messages}, f, ensure_ascii=False, indent=2)
+
+    def close(self, wait: bool = True):
+        """Stop refilling the pool, finish pending cleanups and delete unused pooled threads"""
+        self.pool_size = 0
+        self._executor.shutdown(wait=wait)
+        if not wait:
+            return
+        while True:
+            try:
+                thread_id = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.project_client.agents.threads.delete(thread_id)
+            except Exception as e:
+                print(f"Could not clean up thread {thread_id}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()